@@ -0,0 +1,162 @@
+################################################################################
+# affected cmd funcs
+#
+# The "affected" command lists the dependencies affected by going from one
+# revision of this repo to another: the ones whose pin in the .rept_deps file
+# was added or changed, plus every dependency that depends on one of those,
+# directly or through other dependencies. It's meant for CI, to rebuild only
+# what changed.
+#
+# Pins are compared as written, so a pin that names a branch only counts as
+# changed if the branch name changed. Who depends on whom comes from the
+# dependency graph of the new revision, resolved the same way as for
+# "rept graph", so the dependencies need to have been synced.
+#
+# By default the affected dependencies are printed one name per line. With
+# "--format json", the added, removed and changed dependencies are listed too.
+################################################################################
+
+import collections
+import json
+import sys
+
+from repo_tool import dag_scheduler
+from repo_tool import deps_cache
+from repo_tool import git_utils
+from repo_tool import graph_cmd
+from repo_tool import rept_utils
+
+AffectedArgs = collections.namedtuple('AffectedArgs',
+    'old_rev new_rev output_format num_jobs')
+
+# Each field is a list of dependency names; affected ones are named the way
+# "rept graph" shows them. affected includes changed and added.
+AffectedDeps = collections.namedtuple('AffectedDeps',
+    'added removed changed affected')
+
+################################################################################
+# diff funcs
+################################################################################
+
+# Returns (dependencies, err).
+def load_dependencies(rev):
+    rev_hash = git_utils.get_rev_hash(rev)
+    if not rev_hash:
+        return (None, "bad revision '{0}'".format(rev))
+
+    dependencies, err = deps_cache.get_dependency_data_for_revision(rev_hash)
+    if err:
+        return (None, 'bad .rept_deps file at {0}: {1}'.format(rev, err))
+    return (dependencies, None)
+
+# Returns (added, removed, changed) lists of dependencies, in the order they're
+# listed. Dependencies are matched up by remote server and name.
+def diff_dependencies(old_deps, new_deps):
+    old_by_key = rept_utils.index_by_dependency_key(old_deps)
+    new_by_key = rept_utils.index_by_dependency_key(new_deps)
+
+    added = []
+    changed = []
+    for dep in new_deps:
+        old_dep = old_by_key.get(rept_utils.get_dependency_key(dep))
+        if not old_dep:
+            added.append(dep)
+        elif old_dep != dep:
+            changed.append(dep)
+
+    removed = [dep for dep in old_deps
+               if rept_utils.get_dependency_key(dep) not in new_by_key]
+    return (added, removed, changed)
+
+# Every node in the graph that depends on one of the given nodes, directly or
+# not, including those nodes themselves. The root isn't included.
+def find_dependents(graph, keys):
+    dependents = {}
+    for edge in graph.edges:
+        dependents.setdefault(edge.dst, []).append(edge.src)
+
+    found = set()
+    to_visit = list(keys)
+    while to_visit:
+        key = to_visit.pop()
+        if key in found or key == graph.root:
+            continue
+        found.add(key)
+        to_visit.extend(dependents.get(key, []))
+    return found
+
+# Returns (AffectedDeps, errs).
+def find_affected(old_deps, new_deps, num_jobs):
+    added, removed, changed = diff_dependencies(old_deps, new_deps)
+
+    # Without every repo's own dependencies, some dependents may be missed, so
+    # problems loading them are errors.
+    graph = graph_cmd.resolve_graph(new_deps, num_jobs)
+    errs = [node.err for node in graph.nodes.values() if node.err]
+
+    affected = find_dependents(graph,
+        [rept_utils.get_dependency_key(dep) for dep in added + changed])
+    labels = graph_cmd.get_node_labels(graph.nodes)
+    affected = [labels[key] for key in graph.nodes.keys() if key in affected]
+
+    get_names = lambda deps: [dep.name for dep in deps]
+    return (AffectedDeps(get_names(added), get_names(removed),
+                         get_names(changed), affected), errs)
+
+################################################################################
+# command funcs
+################################################################################
+
+def print_affected_usage():
+    rept_utils.printerr('usage: rept affected [-j <jobs>] '
+                        '[--format (list | json)] <old-rev> <new-rev>')
+
+def parse_affected_args(args):
+    parsed_args = rept_utils.parse_args(
+        args, 'j:', ['format='], usage_fn=print_affected_usage)
+
+    output_format = 'list'
+    num_jobs = graph_cmd.DEFAULT_NUM_JOBS
+    for opt, optarg in parsed_args[0]:
+        if opt == '--format':
+            if optarg not in ['list', 'json']:
+                rept_utils.printerr(
+                    "error: '--format' must be 'list' or 'json'")
+                print_affected_usage()
+                sys.exit(1)
+            output_format = optarg
+        elif opt == '-j':
+            num_jobs = dag_scheduler.parse_num_workers(optarg)
+            if not num_jobs:
+                rept_utils.printerr("error: '-j' must be a positive number")
+                print_affected_usage()
+                sys.exit(1)
+
+    if len(parsed_args[1]) != 2:
+        print_affected_usage()
+        sys.exit(1)
+
+    return AffectedArgs(
+        parsed_args[1][0], parsed_args[1][1], output_format, num_jobs)
+
+def cmd_affected(args):
+    affected_args = parse_affected_args(args)
+
+    old_deps, err = load_dependencies(affected_args.old_rev)
+    if err:
+        sys.exit('error: ' + err)
+    new_deps, err = load_dependencies(affected_args.new_rev)
+    if err:
+        sys.exit('error: ' + err)
+
+    affected_deps, errs = find_affected(
+        old_deps, new_deps, affected_args.num_jobs)
+    if errs:
+        rept_utils.print_std_err_list(errs)
+        sys.exit(1)
+
+    if affected_args.output_format == 'json':
+        print(json.dumps(affected_deps._asdict(), indent=2))
+    else:
+        for name in affected_deps.affected:
+            print(name)
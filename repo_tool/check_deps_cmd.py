@@ -11,22 +11,49 @@ import collections
 import os
 import sys
 
+from repo_tool import deps_cache
 from repo_tool import git_utils
+from repo_tool import graph_utils
+from repo_tool import rept_cache
 from repo_tool import rept_utils
 
 TargetDep = collections.namedtuple('TargetDep',
     'dependency repo_abs_path')
 
+# The dependencies of every repo in the last checked graph, keyed by repo path
+# and commit. A commit's .rept_deps file never changes, so as long as a repo is
+# still at the same commit, the next check can skip finding and loading its
+# .rept_deps file. This only saves loading; every revision and every edge is
+# still checked on every run.
+CHECKED_GRAPH_CACHE_NAME = 'checked-graph'
+CHECKED_GRAPH_CACHE_MAX_ENTRIES = 4096
+
+def get_checked_graph_cache():
+    return rept_cache.get_cache(
+        CHECKED_GRAPH_CACHE_NAME, CHECKED_GRAPH_CACHE_MAX_ENTRIES,
+        version=deps_cache.DEPS_CACHE_VERSION)
+
+def get_checked_graph_key(repo_path, rev_hash):
+    return '{0}:{1}'.format(repo_path, rev_hash)
+
+# Index the target dependencies for find_target_dep().
+def get_target_deps(dependencies):
+    return rept_utils.index_by_dependency_key(
+        dependencies, lambda dep: TargetDep(dep, os.path.abspath(dep.path)))
+
 def find_target_dep(targets, dep):
-    for target in targets:
-        if (target.dependency.remote_server == dep.remote_server and
-            target.dependency.name == dep.name):
-            return target
-    return None
+    return targets.get(rept_utils.get_dependency_key(dep))
+
+# An entry in the check results for a repo's .rept_deps file. Either err is set
+# for a problem found in the file itself, or target_dep is set for a dependency
+# whose own sub-deps still need to be checked.
+CheckItem = collections.namedtuple('CheckItem', 'err target_dep')
 
 # Check each dependency for inconsistencies against the target dependencies.
-def check_subdeps(dep_chain, dependencies, targets):
-    errs = []
+# rev_hashes memoizes the revision check for each target, since many repos may
+# depend on the same one.
+def check_subdeps(dependencies, targets, rev_hashes):
+    items = []
     for dep in dependencies:
         target_dep = find_target_dep(targets, dep)
 
@@ -36,79 +63,163 @@ def check_subdeps(dep_chain, dependencies, targets):
         # main .rept_deps file, which is bad.
         if not target_dep:
             err = "Unlisted dependency '{0}' found".format(dep.name)
-            errs.append((err, dep_chain))
+            items.append(CheckItem(err, None))
+            continue
 
         # We're requiring that revision names, not just commits have to match.
         # Technically commits are all that are required for consistency, but
         # that's just asking for trouble if we start mixing representations.
-        elif dep.revision != target_dep.dependency.revision:
-            errs.append(
-                (['Inconsistent dependency for {0}:'.format(dep.name),
-                  'required: {0}'.format(target_dep.dependency.revision),
-                  'found: {0}'.format(dep.revision)],
-                 dep_chain))
+        if dep.revision != target_dep.dependency.revision:
+            items.append(CheckItem(
+                ['Inconsistent dependency for {0}:'.format(dep.name),
+                 'required: {0}'.format(target_dep.dependency.revision),
+                 'found: {0}'.format(dep.revision)],
+                None))
+            continue
+
+        if target_dep.repo_abs_path not in rev_hashes:
+            rev_hashes[target_dep.repo_abs_path] = (
+                git_utils.get_rev_hash_from_repo(
+                    dep.revision, target_dep.repo_abs_path))
+
+        dep_hash, hash_err = rev_hashes[target_dep.repo_abs_path]
+        if not dep_hash:
+            err_msg = rept_utils.gen_bad_revision_err_str(
+                dep.name, dep.revision, hash_err)
+            items.append(CheckItem(err_msg, None))
 
         else:
-            dep_hash, hash_err = git_utils.get_rev_hash_from_repo(
-                dep.revision, target_dep.repo_abs_path)
-            if not dep_hash:
-                err_msg = rept_utils.gen_bad_revision_err_str(
-                    dep.name, dep.revision, hash_err)
-                errs.append((err_msg, dep_chain))
-
-            else:
-                # If we got here, this dependency's revision is ok. Now gotta
-                # check its sub-deps.
-                subdep_errs = check_subdeps_for_repo(
-                    dep_chain, dep.name, target_dep, targets)
-                errs.extend(subdep_errs)
+            # If we got here, this dependency's revision is ok. Its sub-deps
+            # get checked as a repo of their own.
+            items.append(CheckItem(None, target_dep))
 
-    return errs
+    return items
 
 # Check the subdependencies for the specified repo against the targets.
-def check_subdeps_for_repo(dep_chain, repo_name, target_dep, targets):
-    new_dep_chain = dep_chain + [target_dep.repo_abs_path]
+def check_subdeps_for_repo(target_dep, targets, rev_hashes, checked_graph=None):
+    # The repo's revision was resolved when its parent was checked.
+    rev_hash, hash_err = rev_hashes.get(target_dep.repo_abs_path, (None, None))
+    key = get_checked_graph_key(target_dep.repo_abs_path, rev_hash)
 
-    # If the current repo path is already in the dependency chain, that means
-    # we must have a circular dependency, which is bad.
-    if target_dep.repo_abs_path in dep_chain:
-        return [('Circular reference detected', new_dep_chain)]
+    entry = checked_graph.get(key) if checked_graph and rev_hash else None
+    if entry:
+        dependencies, err = deps_cache.from_cache_entry(entry)
+        return check_subdeps(dependencies, targets, rev_hashes)
 
     with rept_utils.DoInExistingDir(target_dep.repo_abs_path) as ctx:
         if ctx:
             # Look for the contents of a .rept_deps file at the specified
-            # revision so see if we need to keep doing consistency checks.
-            rept_deps_contents = git_utils.get_file_contents_for_revision(
-                target_dep.dependency.revision, '.rept_deps')
-
-            # No .rept_deps file? No prob. Just means no conflicts.
-            # Treat an empty file and no file as the same thing.
-            if not rept_deps_contents:
-                return []
-
-            dependencies, err = rept_utils.parse_dependency_data(
-                rept_deps_contents)
+            # revision so see if we need to keep doing consistency checks. No
+            # .rept_deps file? No prob. Just means no conflicts.
+            dependencies, err = deps_cache.get_dependency_data_for_revision(
+                rev_hash or target_dep.dependency.revision)
 
             # If the dependencies couldn't be parsed, we can't continue down
             # this chain, so err out.
             if dependencies == None: # test for None since [] is allowed
-                return [(err, new_dep_chain)]
+                return [CheckItem(err, None)]
+
+            if checked_graph and rev_hash:
+                checked_graph.put(
+                    key, deps_cache.to_cache_entry(dependencies, None))
 
             # Now we can check all of the sub-dependencies of this dependency.
-            return check_subdeps(new_dep_chain, dependencies, targets)
+            return check_subdeps(dependencies, targets, rev_hashes)
 
         else:
-            return [('Missing repo: {0}'.format(repo_name), new_dep_chain)]
+            err = 'Missing repo: {0}'.format(target_dep.dependency.name)
+            return [CheckItem(err, None)]
+
+# Build the dependency graph: a dict from repo path to that repo's check items.
+# Every repo is checked once, no matter how many chains lead to it.
+def build_check_graph(root_path, dependencies, targets, checked_graph=None):
+    graph = {}
+    rev_hashes = {}
+
+    def visit(repo_path, items):
+        graph[repo_path] = items
+        for item in items:
+            if item.target_dep:
+                child_path = item.target_dep.repo_abs_path
+                if child_path not in graph:
+                    visit(child_path, check_subdeps_for_repo(
+                        item.target_dep, targets, rev_hashes, checked_graph))
+
+    visit(root_path, check_subdeps(dependencies, targets, rev_hashes))
+    return graph
+
+def get_graph_children(graph, repo_path):
+    return [item.target_dep.repo_abs_path
+            for item in graph[repo_path] if item.target_dep]
+
+# Find the circular references in the graph, and the set of repos with an error
+# somewhere below them. Every other repo is clean, and the chains through it
+# don't need to be walked when reporting errors.
+#
+# Each circular reference is reported once, with all of the repos in it, along
+# with the chain that first led into it.
+def find_graph_problems(graph, root_path):
+    get_children = lambda repo_path: get_graph_children(graph, repo_path)
+    components, parents = graph_utils.find_components([root_path], get_children)
+
+    dirty = set()
+    cycle_errs = []
+
+    # Components come children first, so a component's children have all been
+    # classified by the time we get to it.
+    for component in components:
+        is_dirty = False
+        for repo_path in component:
+            for item in graph[repo_path]:
+                if (item.err or
+                    item.target_dep.repo_abs_path in dirty):
+                    is_dirty = True
+        if is_dirty:
+            dirty.update(component)
+
+        if graph_utils.is_cycle(component, get_children):
+            members = ', '.join(
+                [os.path.basename(repo_path) for repo_path in component])
+            err = ['Circular reference detected', 'members: ' + members]
+            cycle_errs.append(
+                (err, graph_utils.get_path_to(parents, component[0])))
+
+    # Report the cycles closest to the root first.
+    cycle_errs.reverse()
+    return (dirty, cycle_errs)
+
+# Walk every chain through the graph that has an error in it, collecting
+# (err, dep_chain) pairs in the order a plain depth-first walk would find them.
+# Chains stop when they come back around to a repo already in them; circular
+# references are reported by find_graph_problems().
+def collect_graph_errs(graph, dirty, dep_chain, errs):
+    for item in graph[dep_chain[-1]]:
+        if item.err:
+            errs.append((item.err, dep_chain))
+            continue
+
+        child_path = item.target_dep.repo_abs_path
+        if child_path in dirty and child_path not in dep_chain:
+            collect_graph_errs(graph, dirty, dep_chain + [child_path], errs)
+
+    return errs
+
+# Check the graph, returning every (err, dep_chain) pair.
+def check_graph(graph, root_path):
+    dirty, cycle_errs = find_graph_problems(graph, root_path)
+    return collect_graph_errs(graph, dirty, [root_path], []) + cycle_errs
 
 def do_check_dep_consistency(dependencies):
-    target_deps = []
-    for dep in dependencies:
-        repo_abs_path = os.path.abspath(dep.path)
-        target_dep = TargetDep(dep, repo_abs_path)
-        target_deps.append(target_dep)
+    target_deps = get_target_deps(dependencies)
+
+    checked_graph = get_checked_graph_cache()
 
     # Check each dependency for consistency with the targets.
-    errs = check_subdeps([os.getcwd()], dependencies, target_deps)
+    root_path = os.getcwd()
+    graph = build_check_graph(
+        root_path, dependencies, target_deps, checked_graph)
+
+    errs = check_graph(graph, root_path)
 
     for err in errs:
         dep_chain = [os.path.basename(dirname) for dirname in err[1]]
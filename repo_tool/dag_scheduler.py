@@ -0,0 +1,126 @@
+################################################################################
+# dag scheduler funcs
+#
+# Runs a piece of work for every node of a dependency DAG, starting each node as
+# soon as all of its prerequisites have finished, with at most num_workers
+# nodes running at a time.
+#
+# Among the nodes that are ready to run, the one that comes first in the node
+# list goes first. So with a single worker, and the node list in an order where
+# prerequisites come first (e.g. a depth-first post-order), the work runs in
+# exactly that order, on the calling thread.
+################################################################################
+
+import heapq
+import sys
+import threading
+
+class DagCycleError(Exception):
+    pass
+
+# Raise DagCycleError if the nodes can't be ordered so that every node comes
+# after its prerequisites.
+def check_for_cycles(nodes, dependents, num_prereqs):
+    remaining = dict(num_prereqs)
+    topo_order = [node for node in nodes if not remaining[node]]
+    idx = 0
+    while idx < len(topo_order):
+        for dependent in dependents[topo_order[idx]]:
+            remaining[dependent] -= 1
+            if not remaining[dependent]:
+                topo_order.append(dependent)
+        idx += 1
+
+    if len(topo_order) != len(nodes):
+        raise DagCycleError('the dependency graph has a cycle')
+
+# Run work_fn(node) for every node, respecting the prerequisites. prereqs maps a
+# node to the nodes that have to finish before it can start; prerequisites that
+# aren't in the node list are ignored. Nodes must be hashable.
+#
+# Returns a dict from each node to what work_fn returned for it. If work_fn
+# raises, no new nodes are started, and the exception is re-raised once the
+# running ones finish.
+def run_dag(nodes, prereqs, work_fn, num_workers=1):
+    position = dict([(node, idx) for idx, node in enumerate(nodes)])
+
+    dependents = dict([(node, []) for node in nodes])
+    num_prereqs = {}
+    for node in nodes:
+        node_prereqs = set(
+            [prereq for prereq in prereqs.get(node, []) if prereq in position])
+        num_prereqs[node] = len(node_prereqs)
+        for prereq in node_prereqs:
+            dependents[prereq].append(node)
+
+    check_for_cycles(nodes, dependents, num_prereqs)
+
+    # The ready nodes, as a heap of positions in the node list.
+    ready = []
+    def push_ready(node):
+        heapq.heappush(ready, position[node])
+
+    def pop_ready():
+        return nodes[heapq.heappop(ready)]
+
+    for node in nodes:
+        if not num_prereqs[node]:
+            push_ready(node)
+
+    results = {}
+
+    def finish(node, result):
+        results[node] = result
+        for dependent in dependents[node]:
+            num_prereqs[dependent] -= 1
+            if not num_prereqs[dependent]:
+                push_ready(dependent)
+
+    if num_workers <= 1:
+        while ready:
+            node = pop_ready()
+            finish(node, work_fn(node))
+        return results
+
+    cond = threading.Condition()
+    state = {'error': None}
+
+    def worker():
+        while True:
+            with cond:
+                while (not ready and not state['error'] and
+                       len(results) < len(nodes)):
+                    cond.wait()
+                if state['error'] or not ready:
+                    return
+                node = pop_ready()
+
+            try:
+                result = work_fn(node)
+            except:
+                with cond:
+                    state['error'] = sys.exc_info()[1]
+                    cond.notify_all()
+                return
+
+            with cond:
+                finish(node, result)
+                cond.notify_all()
+
+    threads = [threading.Thread(target=worker)
+               for i in range(min(num_workers, len(nodes)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if state['error']:
+        raise state['error']
+    return results
+
+# Parse the value of a -j option. Returns None if it isn't a positive number.
+def parse_num_workers(optarg):
+    if not optarg.isdigit() or int(optarg) < 1:
+        return None
+    return int(optarg)
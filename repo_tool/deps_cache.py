@@ -0,0 +1,99 @@
+################################################################################
+# dependency data cache funcs
+#
+# Parsing a .rept_deps file is a pure function of its contents, so parse results
+# are cached on disk keyed by the git blob hash of the contents. For a file at a
+# revision, the blob hash comes straight from the revision's tree, so a cache
+# hit skips reading the file as well as parsing it.
+#
+# Parse errors are cached too, since they're just as deterministic.
+################################################################################
+
+import hashlib
+
+from repo_tool import git_objects
+from repo_tool import git_utils
+from repo_tool import rept_cache
+from repo_tool import rept_utils
+
+DEPS_CACHE_NAME = 'deps'
+DEPS_CACHE_MAX_ENTRIES = 512
+
+DEPS_FILENAME = '.rept_deps'
+
+# Bump whenever the Dependency fields or the parse rules change, so caches of
+# old parse results are dropped. Caches of anything derived from parse results
+# use it too.
+DEPS_CACHE_VERSION = 1
+
+def get_deps_cache(repo_dir='.'):
+    return rept_cache.get_cache(
+        DEPS_CACHE_NAME, DEPS_CACHE_MAX_ENTRIES, repo_dir,
+        DEPS_CACHE_VERSION)
+
+# The hash git would give the contents as a blob.
+def get_blob_hash(contents):
+    data = contents.encode('utf-8')
+    header = 'blob {0}\0'.format(len(data)).encode('utf-8')
+    return hashlib.sha1(header + data).hexdigest()
+
+def to_cache_entry(dependencies, err):
+    deps = None
+    if dependencies != None:
+        deps = [list(dep) for dep in dependencies]
+    return {'deps': deps, 'err': err}
+
+def from_cache_entry(entry):
+    dependencies = None
+    if entry['deps'] != None:
+        dependencies = [rept_utils.Dependency(*dep) for dep in entry['deps']]
+    return (dependencies, entry['err'])
+
+def get_cached_parse(key, parse_fn, repo_dir='.'):
+    cache = get_deps_cache(repo_dir)
+    entry = cache.get(key)
+    if entry:
+        return from_cache_entry(entry)
+
+    dependencies, err = parse_fn()
+    cache.put(key, to_cache_entry(dependencies, err))
+    return (dependencies, err)
+
+# Drop-in, cached replacement for rept_utils.parse_dependency_data().
+def parse_dependency_data(rept_deps_str, repo_dir='.'):
+    return get_cached_parse(
+        'contents:' + get_blob_hash(rept_deps_str),
+        lambda: rept_utils.parse_dependency_data(rept_deps_str),
+        repo_dir)
+
+def parse_revision_contents(contents):
+    # No .rept_deps file? No prob. Just means no dependencies. Treat an empty
+    # file and no file as the same thing.
+    if not contents:
+        return ([], None)
+    return rept_utils.parse_dependency_data(contents)
+
+# Get the dependencies from the .rept_deps file at a revision of the repo at
+# repo_dir. Returns (dependencies, err). A revision without a .rept_deps file has
+# no dependencies.
+def get_dependency_data_for_revision(rev, repo_dir='.'):
+    blob_hash, handled = git_objects.get_blob_hash_for_revision(
+        rev, DEPS_FILENAME, repo_dir)
+
+    if handled and not blob_hash:
+        return ([], None)
+
+    if handled:
+        key = 'revision:' + blob_hash
+        return get_cached_parse(key, lambda: parse_revision_contents(
+            git_utils.get_file_contents_for_revision(
+                rev, DEPS_FILENAME, repo_dir)),
+            repo_dir)
+
+    # The object reader couldn't help, so the contents have to come from git
+    # before we know what they hash to.
+    contents = git_utils.get_file_contents_for_revision(
+        rev, DEPS_FILENAME, repo_dir)
+    if not contents:
+        return ([], None)
+    return parse_dependency_data(contents, repo_dir)
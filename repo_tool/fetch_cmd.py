@@ -4,37 +4,111 @@
 # The "fetch" command fetches all repos on which the currently checked out
 # revision of the current repo depend. i.e. 'git fetch <remote>' is called for
 # all dependent repos.
+#
+# Repos whose remotes have nothing new for them are skipped (see remote_refs).
+# --force fetches every repo without checking first.
+#
+# --narrow fetches only each dependency's pinned revision, without tags, falling
+# back to a full fetch when that fails (see remote_refs). This repo itself is
+# always fully fetched.
+#
+# With a "fetch_ttl" in .rept_local, repos fetched less than that many seconds
+# ago aren't fetched again. --no-cache fetches them anyway.
+#
+# --prune also removes remote-tracking branches that are gone from the remotes,
+# in the same fetch, like "rept prune" would. That's one network operation per
+# repo, so there's no checking for anything new first (which would be a second
+# one), no fetch TTL (which doesn't know whether the last fetch pruned), and no
+# narrowing (pruning needs the remote's full list of branches).
 ################################################################################
 
+import os
 import sys
 
+from repo_tool import remote_refs
 from repo_tool import rept_utils
 
 def print_fetch_usage():
-    rept_utils.printerr('usage: rept fetch')
+    rept_utils.printerr('usage: rept fetch [--force] [--narrow] [--no-cache] '
+                        '[--prune]')
 
 def cmd_fetch(dependencies, local_config, args):
     parsed_args = rept_utils.parse_args(
-        args, '', usage_fn=print_fetch_usage)
+        args, '', ['force', 'narrow', 'no-cache', 'prune'],
+        usage_fn=print_fetch_usage)
 
     if len(parsed_args[1]):
         rept_utils.print_unknown_arg(parsed_args[1][0])
         print_fetch_usage()
         sys.exit(1)
 
+    force = False
+    narrow = False
+    prune = False
+    fetch_ttl = local_config.fetch_ttl
+    for opt, optarg in parsed_args[0]:
+        if opt == '--force':
+            force = True
+        elif opt == '--narrow':
+            narrow = True
+        elif opt == '--no-cache':
+            fetch_ttl = 0
+        elif opt == '--prune':
+            prune = True
+
+    if prune:
+        force = True
+        narrow = False
+
+    def get_fetch_refspec(dep):
+        if not narrow:
+            return None
+        return remote_refs.get_narrow_refspec(
+            dep.remote, dep.revision, os.path.abspath(dep.path))
+
+    repos = [(os.getcwd(), local_config.remote, '', None)]
+    repos += [(os.path.abspath(dep.path), dep.remote, dep.remote_server,
+               get_fetch_refspec(dep))
+              for dep in dependencies]
+
+    # Why each repo that doesn't need a fetch doesn't, keyed by repo path.
+    skips = {}
+    if not force:
+        for repo_path, remote, remote_server, narrow_refspec in repos:
+            if remote_refs.is_recently_fetched(
+                    repo_path, remote, fetch_ttl, narrow_refspec):
+                skips[repo_path] = 'fetched from {0} in the last {1}s'.format(
+                    remote, fetch_ttl)
+
+        to_check = [repo for repo in repos if repo[0] not in skips]
+        up_to_date = remote_refs.find_up_to_date_repos(to_check)
+        for repo_path, remote, remote_server, narrow_refspec in to_check:
+            if repo_path in up_to_date:
+                skips[repo_path] = 'nothing new on {0}'.format(remote)
+
     errs = []
 
-    print('fetching {0} for this repo...'.format(local_config.remote))
-    ret = rept_utils.exec_proc(['git', 'fetch', local_config.remote], False)
-    if (ret):
-        errs.append(
-            "error: cannot fetch '{0}' for this repo".format(local_config.remote))
+    if os.getcwd() in skips:
+        print('skipping this repo: {0}'.format(skips[os.getcwd()]))
+    else:
+        print('fetching {0} for this repo...'.format(local_config.remote))
+        ret = remote_refs.fetch_remote(
+            os.getcwd(), local_config.remote, prune=prune)
+        if (ret):
+            errs.append("error: cannot fetch '{0}' for this repo".format(
+                local_config.remote))
 
     for dep in dependencies:
+        if os.path.abspath(dep.path) in skips:
+            print('skipping {0}: {1}'.format(
+                dep.name, skips[os.path.abspath(dep.path)]))
+            continue
+
         print('fetching {0}...'.format(dep.name))
         with rept_utils.DoInExistingDir(dep.path) as ctx:
             if ctx:
-                ret = rept_utils.exec_proc(['git', 'fetch', dep.remote], False)
+                ret = remote_refs.fetch_remote(
+                    os.getcwd(), dep.remote, get_fetch_refspec(dep), prune)
                 if (ret):
                     errs.append(
                         "error: cannot fetch repo '{0}'".format(dep.name))
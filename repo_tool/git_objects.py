@@ -0,0 +1,402 @@
+################################################################################
+# git object reader funcs
+#
+# A small, pure-python reader for git's object database. It reads loose objects
+# and pack files (via their .idx files, including delta resolution), which is
+# enough to walk commit -> tree -> blob and pull a file like .rept_deps out of a
+# revision without spawning "git show".
+#
+# Like the ref reader, this is conservative: if something can't be found or
+# isn't understood, the answer is reported as unhandled and the caller falls
+# back to the git CLI.
+################################################################################
+
+import binascii
+import glob
+import os
+import struct
+import zlib
+
+from repo_tool import git_refs
+
+OBJ_COMMIT = 1
+OBJ_TREE = 2
+OBJ_BLOB = 3
+OBJ_TAG = 4
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+
+OBJ_TYPE_NAMES = {
+    OBJ_COMMIT: 'commit',
+    OBJ_TREE: 'tree',
+    OBJ_BLOB: 'blob',
+    OBJ_TAG: 'tag',
+}
+
+IDX_V2_MAGIC = b'\377tOc'
+
+MAX_TAG_DEPTH = 10
+
+# Parsed .idx files, keyed by path and validated by stat data.
+pack_index_cache = {}
+
+class PackIndex(object):
+    def __init__(self, pack_path, data):
+        self.pack_path = pack_path
+        self.data = data
+
+        if data[:4] == IDX_V2_MAGIC:
+            self.version = struct.unpack('>I', data[4:8])[0]
+            self.fanout_offset = 8
+        else:
+            self.version = 1
+            self.fanout_offset = 0
+
+        self.count = struct.unpack(
+            '>I', data[self.fanout_offset + 255 * 4:self.fanout_offset + 256 * 4])[0]
+        table_offset = self.fanout_offset + 256 * 4
+
+        if self.version == 1:
+            self.entry_size = 24
+            self.sha_offset = table_offset + 4
+        else:
+            self.entry_size = 20
+            self.sha_offset = table_offset
+            self.crc_offset = self.sha_offset + self.count * 20
+            self.offset_offset = self.crc_offset + self.count * 4
+            self.large_offset_offset = self.offset_offset + self.count * 4
+
+    def get_sha(self, idx):
+        pos = self.sha_offset + idx * self.entry_size
+        return self.data[pos:pos + 20]
+
+    def find_offset(self, bin_sha):
+        first_byte = ord(bin_sha[0:1])
+        fanout = self.fanout_offset
+        lo = 0
+        if first_byte > 0:
+            lo = struct.unpack(
+                '>I', self.data[fanout + (first_byte - 1) * 4:fanout + first_byte * 4])[0]
+        hi = struct.unpack(
+            '>I', self.data[fanout + first_byte * 4:fanout + (first_byte + 1) * 4])[0]
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_sha = self.get_sha(mid)
+            if mid_sha == bin_sha:
+                return self.get_pack_offset(mid)
+            elif mid_sha < bin_sha:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return None
+
+    def get_pack_offset(self, idx):
+        if self.version == 1:
+            pos = self.sha_offset - 4 + idx * self.entry_size
+            return struct.unpack('>I', self.data[pos:pos + 4])[0]
+
+        pos = self.offset_offset + idx * 4
+        offset = struct.unpack('>I', self.data[pos:pos + 4])[0]
+        if offset & 0x80000000:
+            pos = self.large_offset_offset + (offset & 0x7fffffff) * 8
+            offset = struct.unpack('>Q', self.data[pos:pos + 8])[0]
+        return offset
+
+def get_objects_dirs(repo_dir='.'):
+    git_dir, common_dir = git_refs.find_git_dirs(repo_dir)
+    if not git_dir:
+        return []
+
+    objects_dir = os.path.join(common_dir, 'objects')
+    objects_dirs = [objects_dir]
+
+    # Alternates let a repo borrow objects from other object stores.
+    alternates = git_refs.read_file_bytes(
+        os.path.join(objects_dir, 'info', 'alternates'))
+    if alternates:
+        for line in alternates.decode('utf-8').splitlines():
+            line = line.strip()
+            if line and not line.startswith('#'):
+                objects_dirs.append(os.path.join(objects_dir, line))
+
+    return objects_dirs
+
+def load_pack_index(idx_path):
+    try:
+        st = os.stat(idx_path)
+    except OSError:
+        return None
+
+    stamp = (st.st_mtime, st.st_size)
+    cached = pack_index_cache.get(idx_path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    data = git_refs.read_file_bytes(idx_path)
+    if not data:
+        return None
+
+    pack_index = PackIndex(idx_path[:-len('.idx')] + '.pack', data)
+    pack_index_cache[idx_path] = (stamp, pack_index)
+    return pack_index
+
+def read_loose_object(objects_dir, hex_sha):
+    path = os.path.join(objects_dir, hex_sha[:2], hex_sha[2:])
+    compressed = git_refs.read_file_bytes(path)
+    if compressed is None:
+        return None
+
+    try:
+        raw = zlib.decompress(compressed)
+    except zlib.error:
+        return None
+
+    header_end = raw.find(b'\0')
+    obj_type_name, size = raw[:header_end].split(b' ')
+    obj_type_name = obj_type_name.decode('ascii')
+    for obj_type, name in OBJ_TYPE_NAMES.items():
+        if name == obj_type_name:
+            return (obj_type, raw[header_end + 1:])
+    return None
+
+def read_pack_varint_header(f):
+    byte = ord(f.read(1))
+    obj_type = (byte >> 4) & 0x7
+    size = byte & 0x0f
+    shift = 4
+    while byte & 0x80:
+        byte = ord(f.read(1))
+        size |= (byte & 0x7f) << shift
+        shift += 7
+    return (obj_type, size)
+
+def read_ofs_delta_offset(f):
+    byte = ord(f.read(1))
+    offset = byte & 0x7f
+    while byte & 0x80:
+        byte = ord(f.read(1))
+        offset = ((offset + 1) << 7) | (byte & 0x7f)
+    return offset
+
+def read_zlib_stream(f, size):
+    # Objects in a pack are just concatenated zlib streams, so keep feeding the
+    # decompressor until it reports data past the end of the stream.
+    decompressor = zlib.decompressobj()
+    chunks = []
+    while True:
+        chunk = f.read(4096)
+        if not chunk:
+            break
+        chunks.append(decompressor.decompress(chunk))
+        if decompressor.unused_data:
+            break
+    chunks.append(decompressor.flush())
+
+    data = b''.join(chunks)
+    return data if len(data) == size else None
+
+def read_delta_size(delta, pos):
+    size = 0
+    shift = 0
+    while True:
+        byte = ord(delta[pos:pos + 1])
+        pos += 1
+        size |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return (size, pos)
+
+def apply_delta(base, delta):
+    src_size, pos = read_delta_size(delta, 0)
+    dst_size, pos = read_delta_size(delta, pos)
+    if src_size != len(base):
+        return None
+
+    out = []
+    while pos < len(delta):
+        cmd = ord(delta[pos:pos + 1])
+        pos += 1
+        if cmd & 0x80:
+            # Copy a range out of the base object.
+            copy_offset = 0
+            copy_size = 0
+            for i in range(4):
+                if cmd & (1 << i):
+                    copy_offset |= ord(delta[pos:pos + 1]) << (i * 8)
+                    pos += 1
+            for i in range(3):
+                if cmd & (1 << (4 + i)):
+                    copy_size |= ord(delta[pos:pos + 1]) << (i * 8)
+                    pos += 1
+            if copy_size == 0:
+                copy_size = 0x10000
+            out.append(base[copy_offset:copy_offset + copy_size])
+        elif cmd:
+            # Insert literal data from the delta itself.
+            out.append(delta[pos:pos + cmd])
+            pos += cmd
+        else:
+            return None
+
+    result = b''.join(out)
+    return result if len(result) == dst_size else None
+
+def read_packed_object(pack_path, offset, objects_dirs):
+    try:
+        f = open(pack_path, 'rb')
+    except (IOError, OSError):
+        return None
+
+    try:
+        f.seek(offset)
+        obj_type, size = read_pack_varint_header(f)
+
+        if obj_type == OBJ_OFS_DELTA:
+            base_offset = offset - read_ofs_delta_offset(f)
+            delta = read_zlib_stream(f, size)
+            base = read_packed_object(pack_path, base_offset, objects_dirs)
+        elif obj_type == OBJ_REF_DELTA:
+            base_sha = binascii.hexlify(f.read(20)).decode('ascii')
+            delta = read_zlib_stream(f, size)
+            base = read_object_from_dirs(base_sha, objects_dirs)
+        elif obj_type in OBJ_TYPE_NAMES:
+            data = read_zlib_stream(f, size)
+            return (obj_type, data) if data is not None else None
+        else:
+            return None
+    finally:
+        f.close()
+
+    if not base or delta is None:
+        return None
+
+    data = apply_delta(base[1], delta)
+    return (base[0], data) if data is not None else None
+
+def read_object_from_dirs(hex_sha, objects_dirs):
+    bin_sha = binascii.unhexlify(hex_sha)
+
+    for objects_dir in objects_dirs:
+        obj = read_loose_object(objects_dir, hex_sha)
+        if obj:
+            return obj
+
+        idx_paths = glob.glob(os.path.join(objects_dir, 'pack', '*.idx'))
+        for idx_path in idx_paths:
+            pack_index = load_pack_index(idx_path)
+            if not pack_index:
+                continue
+            offset = pack_index.find_offset(bin_sha)
+            if offset is not None:
+                obj = read_packed_object(
+                    pack_index.pack_path, offset, objects_dirs)
+                if obj:
+                    return obj
+
+    return None
+
+# Read an object by its full hex hash. Returns (obj_type, data), or None if the
+# object couldn't be read.
+def read_object(hex_sha, repo_dir='.'):
+    if not git_refs.FULL_HASH_RE.match(hex_sha):
+        return None
+
+    objects_dirs = get_objects_dirs(repo_dir)
+    if not objects_dirs:
+        return None
+
+    return read_object_from_dirs(hex_sha, objects_dirs)
+
+def peel_to_commit(hex_sha, repo_dir='.'):
+    for _ in range(MAX_TAG_DEPTH):
+        obj = read_object(hex_sha, repo_dir)
+        if not obj:
+            return None
+        obj_type, data = obj
+        if obj_type == OBJ_COMMIT:
+            return (hex_sha, data)
+        elif obj_type == OBJ_TAG:
+            # The first line of a tag is "object <hash>".
+            first_line = data.split(b'\n', 1)[0]
+            if not first_line.startswith(b'object '):
+                return None
+            hex_sha = first_line[len(b'object '):].decode('ascii')
+        else:
+            return None
+    return None
+
+def get_commit_tree(commit_data):
+    # The first line of a commit is "tree <hash>".
+    first_line = commit_data.split(b'\n', 1)[0]
+    if not first_line.startswith(b'tree '):
+        return None
+    return first_line[len(b'tree '):].decode('ascii')
+
+def find_tree_entry(tree_data, name):
+    target = name.encode('utf-8')
+    pos = 0
+    while pos < len(tree_data):
+        mode_end = tree_data.find(b' ', pos)
+        name_end = tree_data.find(b'\0', mode_end)
+        entry_mode = tree_data[pos:mode_end]
+        entry_name = tree_data[mode_end + 1:name_end]
+        entry_sha = tree_data[name_end + 1:name_end + 21]
+        pos = name_end + 21
+        if entry_name == target:
+            return (entry_mode, binascii.hexlify(entry_sha).decode('ascii'))
+    return (None, None)
+
+# Find the hash of the blob at a path within a revision. Returns
+# (blob_hash, handled), with the same meaning for "handled" as in
+# git_refs.resolve_rev(). A handled result of None means the path doesn't exist
+# at that revision.
+def get_blob_hash_for_revision(rev, path, repo_dir='.'):
+    rev_hash, handled = git_refs.resolve_rev(rev, repo_dir)
+    if not handled:
+        return (None, False)
+    if not rev_hash:
+        return (None, True)
+
+    commit = peel_to_commit(rev_hash, repo_dir)
+    if not commit:
+        return (None, False)
+
+    tree_hash = get_commit_tree(commit[1])
+    if not tree_hash:
+        return (None, False)
+
+    parts = [part for part in path.replace('\\', '/').split('/') if part]
+    obj_hash = tree_hash
+    for part_idx, part in enumerate(parts):
+        tree = read_object(obj_hash, repo_dir)
+        if not tree or tree[0] != OBJ_TREE:
+            return (None, False)
+
+        mode, obj_hash = find_tree_entry(tree[1], part)
+        if not mode:
+            return (None, True)
+
+        # Everything but the last component must be a directory. Anything that
+        # isn't a plain tree or file (submodules, symlinks) is left to git.
+        is_last = part_idx == len(parts) - 1
+        if not is_last and mode != b'40000':
+            return (None, True)
+        if is_last and mode not in [b'100644', b'100755']:
+            return (None, False)
+
+    return (obj_hash, True)
+
+# Read the contents of a file at a revision. Returns (contents, handled), where
+# contents are the raw bytes of the file.
+def get_file_contents_for_revision(rev, path, repo_dir='.'):
+    blob_hash, handled = get_blob_hash_for_revision(rev, path, repo_dir)
+    if not blob_hash:
+        return (None, handled)
+
+    blob = read_object(blob_hash, repo_dir)
+    if not blob or blob[0] != OBJ_BLOB:
+        return (None, False)
+
+    return (blob[1], True)
@@ -0,0 +1,364 @@
+################################################################################
+# git ref reader funcs
+#
+# A small, pure-python reader for the parts of a repo's ref store that rept
+# needs to answer most of its questions: HEAD, loose refs under refs/, and the
+# packed-refs file. Answering these in-process avoids spawning git for every
+# "what does this branch point to" query.
+#
+# The reader is deliberately conservative. Anything it doesn't understand (rev
+# expressions like "HEAD~2", abbreviated hashes, reftable repos, repos located
+# through GIT_DIR, etc.) is reported as unhandled so the caller can fall back to
+# the git CLI, which is always the authority.
+################################################################################
+
+import os
+import re
+
+# The order in which git tries to expand a short ref name. (See "SPECIFYING
+# REVISIONS" in gitrevisions(7).)
+DWIM_REF_FORMATS = [
+    '{0}',
+    'refs/{0}',
+    'refs/tags/{0}',
+    'refs/heads/{0}',
+    'refs/remotes/{0}',
+    'refs/remotes/{0}/HEAD',
+]
+
+# Refs that live in the per-worktree git dir rather than the common dir.
+PER_WORKTREE_REF_PREFIXES = [
+    'refs/bisect/',
+    'refs/worktree/',
+    'refs/rewritten/',
+]
+
+MAX_SYMREF_DEPTH = 5
+
+FULL_HASH_RE = re.compile('^[0-9a-f]{40}$')
+HEX_RE = re.compile('^[0-9a-fA-F]{4,40}$')
+PSEUDO_REF_RE = re.compile('^[A-Z_]+$')
+
+# Characters (or sequences) that turn a name into a rev expression or that git
+# does not allow in ref names. We leave all of those to git.
+UNSUPPORTED_REV_RE = re.compile(r'[~^:?*\[\\@{}\s]|\.\.|//|^/|/$|\.lock$|^-')
+
+# Cache of packed-refs file contents, keyed by path and validated by stat data.
+packed_refs_cache = {}
+
+def read_file_bytes(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+# Return (git_dir, common_dir) for the repo at repo_dir, or (None, None) if the
+# reader can't handle the repo.
+def find_git_dirs(repo_dir='.'):
+    # If git is being pointed somewhere else by the environment, don't try to
+    # second guess it.
+    if os.environ.get('GIT_DIR') or os.environ.get('GIT_COMMON_DIR'):
+        return (None, None)
+
+    dot_git = os.path.join(repo_dir, '.git')
+    if os.path.isdir(dot_git):
+        git_dir = dot_git
+    elif os.path.isfile(dot_git):
+        # Worktrees and submodules use a .git file that points at the real git
+        # dir: "gitdir: <path>"
+        contents = read_file_bytes(dot_git)
+        if not contents or not contents.startswith(b'gitdir: '):
+            return (None, None)
+        git_dir = contents[len(b'gitdir: '):].strip().decode('utf-8')
+        git_dir = os.path.join(os.path.dirname(dot_git), git_dir)
+        if not os.path.isdir(git_dir):
+            return (None, None)
+    else:
+        return (None, None)
+
+    common_dir = git_dir
+    commondir_contents = read_file_bytes(os.path.join(git_dir, 'commondir'))
+    if commondir_contents:
+        common_dir = os.path.join(
+            git_dir, commondir_contents.strip().decode('utf-8'))
+
+    # The reftable backend and sha256 repos are beyond what we handle here.
+    if os.path.isdir(os.path.join(common_dir, 'reftable')):
+        return (None, None)
+    config = read_file_bytes(os.path.join(common_dir, 'config')) or b''
+    if b'objectformat' in config.lower() or b'refstorage' in config.lower():
+        return (None, None)
+
+    return (os.path.normpath(git_dir), os.path.normpath(common_dir))
+
+def get_dir_for_ref(refname, git_dir, common_dir):
+    if not refname.startswith('refs/'):
+        return git_dir
+    for prefix in PER_WORKTREE_REF_PREFIXES:
+        if refname.startswith(prefix):
+            return git_dir
+    return common_dir
+
+# Return the raw contents of a loose ref file, or None if there is no such file.
+def read_loose_ref(refname, git_dir, common_dir):
+    ref_dir = get_dir_for_ref(refname, git_dir, common_dir)
+    path = os.path.join(ref_dir, *refname.split('/'))
+    if not os.path.isfile(path):
+        return None
+    contents = read_file_bytes(path)
+    return contents.strip().decode('utf-8') if contents is not None else None
+
+def get_packed_refs_data(common_dir):
+    path = os.path.join(common_dir, 'packed-refs')
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    stamp = (st.st_mtime, st.st_size, st.st_ino)
+    cached = packed_refs_cache.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    data = read_file_bytes(path)
+    packed_refs_cache[path] = (stamp, data)
+    return data
+
+def get_next_packed_record(data, pos):
+    # Skip to the start of the next line, then skip over any peeled lines
+    # ("^<hash>") since they belong to the record before them.
+    end = data.find(b'\n', pos)
+    pos = len(data) if end < 0 else end + 1
+    while data[pos:pos + 1] == b'^':
+        end = data.find(b'\n', pos)
+        pos = len(data) if end < 0 else end + 1
+    return pos
+
+def parse_packed_record(data, pos):
+    end = data.find(b'\n', pos)
+    line = data[pos:] if end < 0 else data[pos:end]
+    parts = line.rstrip(b'\r').split(b' ', 1)
+    if len(parts) != 2:
+        return (None, None)
+    return (parts[1], parts[0])
+
+def find_packed_ref(refname, common_dir):
+    data = get_packed_refs_data(common_dir)
+    if not data:
+        return None
+
+    target = refname.encode('utf-8')
+
+    start = 0
+    is_sorted = False
+    if data.startswith(b'#'):
+        header_end = data.find(b'\n')
+        header = data[:header_end]
+        is_sorted = b' sorted' in header
+        start = get_next_packed_record(data, 0)
+
+    # Old versions of git didn't promise sorted packed-refs files, so those
+    # need a linear scan.
+    if not is_sorted:
+        pos = start
+        while pos < len(data):
+            name, value = parse_packed_record(data, pos)
+            if name == target:
+                return value.decode('utf-8')
+            pos = get_next_packed_record(data, pos)
+        return None
+
+    # Binary search over the record start positions. lo always points at the
+    # start of a record, and hi at the start of a record (or the end).
+    lo = start
+    hi = len(data)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        rec_start = data.rfind(b'\n', lo, mid) + 1
+        if rec_start < lo:
+            rec_start = lo
+        if data[rec_start:rec_start + 1] == b'^':
+            rec_start = data.rfind(b'\n', lo, rec_start - 1) + 1
+            if rec_start < lo:
+                rec_start = lo
+
+        name, value = parse_packed_record(data, rec_start)
+        if name is None:
+            return None
+        if name == target:
+            return value.decode('utf-8')
+        elif name < target:
+            lo = get_next_packed_record(data, rec_start)
+        else:
+            hi = rec_start
+
+    return None
+
+# Return the raw value of a ref (a hash or "ref: <target>"), looking at the
+# loose ref first and then at packed-refs.
+def read_ref(refname, git_dir, common_dir):
+    value = read_loose_ref(refname, git_dir, common_dir)
+    if value is None and refname.startswith('refs/'):
+        value = find_packed_ref(refname, common_dir)
+    return value
+
+# Fully resolve a ref name, following symbolic refs. Returns the hash, or None
+# if the ref doesn't exist.
+def resolve_ref(refname, git_dir, common_dir):
+    for _ in range(MAX_SYMREF_DEPTH):
+        value = read_ref(refname, git_dir, common_dir)
+        if value is None:
+            return None
+        if value.startswith('ref: '):
+            refname = value[len('ref: '):].strip()
+        elif FULL_HASH_RE.match(value):
+            return value
+        else:
+            return None
+    return None
+
+# Resolve a revision name to a hash without spawning git. Returns
+# (rev_hash, handled). If handled is False, the reader couldn't answer
+# authoritatively and the caller must ask git. If handled is True, rev_hash is
+# the answer, with None meaning the revision doesn't exist.
+def resolve_rev(rev, repo_dir='.'):
+    if not rev or UNSUPPORTED_REV_RE.search(rev):
+        return (None, False)
+
+    git_dir, common_dir = find_git_dirs(repo_dir)
+    if not git_dir:
+        return (None, False)
+
+    # Full hashes resolve to themselves. (git rev-parse doesn't check that the
+    # object actually exists either.)
+    if FULL_HASH_RE.match(rev):
+        return (rev, True)
+
+    # Top-level names other than HEAD are pseudo refs like FETCH_HEAD, whose
+    # formats vary, so let git deal with them.
+    if PSEUDO_REF_RE.match(rev) and rev != 'HEAD':
+        return (None, False)
+
+    for fmt in DWIM_REF_FORMATS:
+        if fmt == '{0}' and not (rev == 'HEAD' or rev.startswith('refs/')):
+            continue
+        rev_hash = resolve_ref(fmt.format(rev), git_dir, common_dir)
+        if rev_hash:
+            return (rev_hash, True)
+
+    # Could still be an abbreviated hash, which only git can expand.
+    if HEX_RE.match(rev):
+        return (None, False)
+
+    return (None, True)
+
+# Find the ref a revision name refers to, the way resolve_rev() would. Returns
+# (refname, handled), with the same meaning for "handled" as in resolve_rev().
+# A handled refname of None means the revision isn't a ref: it's a full hash, or
+# it doesn't exist.
+def find_rev_refname(rev, repo_dir='.'):
+    if not rev or UNSUPPORTED_REV_RE.search(rev):
+        return (None, False)
+
+    git_dir, common_dir = find_git_dirs(repo_dir)
+    if not git_dir:
+        return (None, False)
+
+    if FULL_HASH_RE.match(rev):
+        return (None, True)
+
+    if PSEUDO_REF_RE.match(rev) and rev != 'HEAD':
+        return (None, False)
+
+    for fmt in DWIM_REF_FORMATS:
+        if fmt == '{0}' and not (rev == 'HEAD' or rev.startswith('refs/')):
+            continue
+        refname = fmt.format(rev)
+        if resolve_ref(refname, git_dir, common_dir):
+            return (refname, True)
+
+    if HEX_RE.match(rev):
+        return (None, False)
+
+    return (None, True)
+
+# Return (branch_name, handled) for the currently checked out branch.
+# branch_name is None when HEAD is detached or points to an unborn branch.
+def get_head_branch(repo_dir='.'):
+    git_dir, common_dir = find_git_dirs(repo_dir)
+    if not git_dir:
+        return (None, False)
+
+    value = read_loose_ref('HEAD', git_dir, common_dir)
+    if value is None:
+        return (None, False)
+
+    if not value.startswith('ref: '):
+        return (None, True)
+
+    refname = value[len('ref: '):].strip()
+    if not refname.startswith('refs/heads/'):
+        return (None, True)
+
+    if not resolve_ref(refname, git_dir, common_dir):
+        return (None, True)
+
+    return (refname[len('refs/heads/'):], True)
+
+# Characters that start the non-ref part of a rev expression ("HEAD~2",
+# "v1.0^{}", "master:path").
+REV_SUFFIX_RE = re.compile(r'[~^:]')
+
+# Rev expressions whose meaning depends on more than the ref files (reflogs,
+# upstream config, commit message searches).
+VOLATILE_REV_RE = re.compile(r'@\{|^:|:/')
+
+def get_file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    mtime = getattr(st, 'st_mtime_ns', st.st_mtime)
+    return [mtime, st.st_size, st.st_ino]
+
+# Return a cheap fingerprint of the ref files that a rev's resolution depends on
+# (HEAD, packed-refs, and the loose ref files the rev's name could expand to),
+# or None if the rev's resolution can't be tied to the ref files. If the
+# fingerprint hasn't changed, neither has what the rev resolves to.
+def get_ref_state_stamp(rev, repo_dir='.'):
+    if not rev or VOLATILE_REV_RE.search(rev):
+        return None
+
+    git_dir, common_dir = find_git_dirs(repo_dir)
+    if not git_dir:
+        return None
+
+    base = REV_SUFFIX_RE.split(rev, 1)[0]
+    if base in ['', '@']:
+        base = 'HEAD'
+
+    # A base that's still an expression (a range, say) may name refs we can't
+    # pick out of it.
+    if UNSUPPORTED_REV_RE.search(base):
+        return None
+
+    refnames = ['HEAD'] + [fmt.format(base) for fmt in DWIM_REF_FORMATS]
+
+    paths = [os.path.join(common_dir, 'packed-refs')]
+    seen = set()
+    while refnames:
+        refname = refnames.pop(0)
+        if refname in seen:
+            continue
+        seen.add(refname)
+
+        ref_dir = get_dir_for_ref(refname, git_dir, common_dir)
+        paths.append(os.path.join(ref_dir, *refname.split('/')))
+
+        # Follow symbolic refs, since their targets matter too.
+        value = read_loose_ref(refname, git_dir, common_dir)
+        if value and value.startswith('ref: '):
+            refnames.append(value[len('ref: '):].strip())
+
+    return [get_file_stamp(path) for path in paths]
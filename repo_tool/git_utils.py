@@ -4,11 +4,108 @@
 
 import os
 
+from repo_tool import git_objects
+from repo_tool import git_refs
+from repo_tool import rept_cache
 from repo_tool import rept_utils
 
-def get_rev_hash(rev):
-    ret, out, err = rept_utils.exec_proc(['git', 'rev-parse', rev])
-    return out if not ret else None
+# The same questions tend to get asked several times during a single rept run,
+# so query results are memoized, keyed by the repo (the query's repo_dir
+# argument, or the current directory), the query and its arguments. Whenever
+# rept runs a git command that can change a repo, everything memoized for that
+# repo is dropped.
+#
+# Memoization has to be switched on by the rept command itself. Other users of
+# these funcs (like the tests) may be changing repos behind our back.
+memo = {}
+memo_enabled = False
+
+def set_memo_enabled(enabled):
+    global memo_enabled
+    memo_enabled = enabled
+    memo.clear()
+
+# The real path of the repo a query runs in.
+def get_memo_repo_path(query_fn, args, kwargs):
+    repo_dir = kwargs.get('repo_dir', '.')
+    arg_names = query_fn.__code__.co_varnames[:query_fn.__code__.co_argcount]
+    if 'repo_dir' in arg_names and arg_names.index('repo_dir') < len(args):
+        repo_dir = args[arg_names.index('repo_dir')]
+    return os.path.realpath(os.getcwd() if repo_dir == '.' else repo_dir)
+
+def memoized(query_fn):
+    def memoized_query_fn(*args, **kwargs):
+        if not memo_enabled:
+            return query_fn(*args, **kwargs)
+        key = (get_memo_repo_path(query_fn, args, kwargs), query_fn.__name__,
+               args, tuple(sorted(kwargs.items())))
+        if key not in memo:
+            memo[key] = query_fn(*args, **kwargs)
+        return memo[key]
+    memoized_query_fn.__name__ = query_fn.__name__
+    return memoized_query_fn
+
+def invalidate_memo(repo_dir):
+    repo_dir = os.path.realpath(repo_dir)
+    for key in list(memo.keys()):
+        if key[0] == repo_dir:
+            del memo[key]
+
+rept_utils.add_git_write_listener(invalidate_memo)
+
+# The start of a git command line that runs in repo_dir.
+def get_git_cmd(repo_dir='.'):
+    return ['git'] if repo_dir == '.' else ['git', '-C', repo_dir]
+
+# Most of the queries below can be answered straight from the ref store, so try
+# the in-process ref reader first and only spawn git when it can't help.
+
+# Revisions the ref reader can't handle are resolved by git, and the results are
+# kept in a per-repo cache across runs. An entry stays valid as long as the ref
+# files its resolution depends on are unchanged. "rev-parse" and "rev-parse
+# --verify" can answer differently for the same rev (a range resolves without
+# --verify, but isn't a single object), so they're cached separately.
+REVISION_CACHE_NAME = 'revisions'
+REVISION_CACHE_MAX_ENTRIES = 1024
+REVISION_CACHE_VERSION = 1
+
+def get_revision_cache(repo_dir='.'):
+    return rept_cache.get_cache(
+        REVISION_CACHE_NAME, REVISION_CACHE_MAX_ENTRIES, repo_dir,
+        REVISION_CACHE_VERSION)
+
+def get_revision_cache_key(rev, verify):
+    return '{0}:{1}'.format('verify' if verify else 'plain', rev)
+
+def resolve_rev_with_git(rev, verify, repo_dir='.'):
+    stamp = git_refs.get_ref_state_stamp(rev, repo_dir)
+    cache = get_revision_cache(repo_dir)
+    key = get_revision_cache_key(rev, verify)
+    if stamp != None:
+        cached = cache.get(key)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+    cmd = get_git_cmd(repo_dir) + ['rev-parse']
+    if verify:
+        cmd.append('--verify')
+    ret, out, err = rept_utils.exec_proc(cmd + [rev])
+    rev_hash = out if not ret else None
+
+    # Only cache revs that exist. A missing one may show up without any ref
+    # changing (e.g. an abbreviated hash after a fetch).
+    if rev_hash and stamp != None:
+        cache.put(key, [stamp, rev_hash])
+
+    return rev_hash
+
+@memoized
+def get_rev_hash(rev, repo_dir='.'):
+    rev_hash, handled = git_refs.resolve_rev(rev, repo_dir)
+    if handled:
+        return rev_hash
+
+    return resolve_rev_with_git(rev, False, repo_dir)
 
 def get_rev_hash_from_repo(rev, repo_dir):
     rev_hash = None
@@ -22,12 +119,31 @@ def get_rev_hash_from_repo(rev, repo_dir):
             err = 'could not enter the repo'
     return (rev_hash, err)
 
-def get_branch_exists(branch_name):
+# Is the commit with the given full hash in the repo's object store?
+def has_commit(rev_hash, repo_dir='.'):
+    if git_objects.peel_to_commit(rev_hash, repo_dir):
+        return True
+
+    # The object reader couldn't find it, but it may just not understand how
+    # the object is stored.
     ret, out, err = rept_utils.exec_proc(
-        ['git', 'rev-parse', '--verify', branch_name])
+        get_git_cmd(repo_dir) + ['cat-file', '-e', rev_hash + '^{commit}'])
     return ret == 0
 
+@memoized
+def get_branch_exists(branch_name):
+    rev_hash, handled = git_refs.resolve_rev(branch_name)
+    if handled:
+        return rev_hash != None
+
+    return resolve_rev_with_git(branch_name, True) != None
+
+@memoized
 def is_current_branch(branch_name):
+    current_branch, handled = git_refs.get_head_branch()
+    if handled:
+        return current_branch == branch_name
+
     ret, out, err = rept_utils.exec_proc(['git', 'branch'])
     if ret:
         return False
@@ -36,23 +152,117 @@ def is_current_branch(branch_name):
     branch = [branch[2:] for branch in branches if branch.startswith('* ')]
     return branch[0] == branch_name if branch else False
 
+@memoized
 def get_any_remote_branch_exists(branch_name):
-    ret, out, err = rept_utils.exec_proc(['git', 'branch', '-a'])
-    if ret:
-        return []
+    # Let git do the filtering, and stream the results, since there may be a
+    # huge number of remote branches. "**/" matches any remote name, including
+    # ones with slashes.
+    branches = []
+    def add_branch(refname):
+        branches.append(refname[len('refs/'):])
 
-    branches = out.split()
-    return [branch for branch in branches if
-        branch.startswith('remotes/') and branch.endswith('/' + branch_name)]
+    ret = rept_utils.exec_proc_lines(
+        ['git', 'for-each-ref', '--format=%(refname)',
+         'refs/remotes/**/' + branch_name],
+        add_branch)
+    return branches if not ret else []
 
-def is_branch_merged(branch_name):
-    ret, out, err = rept_utils.exec_proc(['git', 'branch', '--merged'])
-    if ret:
+# Whether one commit is an ancestor of another never changes once both commits
+# are known, so the answers are kept in a per-repo cache keyed by the pair of
+# commit hashes.
+ANCESTRY_CACHE_NAME = 'ancestry'
+ANCESTRY_CACHE_MAX_ENTRIES = 4096
+
+def get_ancestry_cache():
+    return rept_cache.get_cache(ANCESTRY_CACHE_NAME, ANCESTRY_CACHE_MAX_ENTRIES)
+
+def get_ancestry_cache_key(ancestor_hash, descendant_hash):
+    return ancestor_hash + ':' + descendant_hash
+
+def is_ancestor(ancestor_rev, descendant_rev):
+    ancestor_hash = get_rev_hash(ancestor_rev)
+    descendant_hash = get_rev_hash(descendant_rev)
+    if not ancestor_hash or not descendant_hash:
         return False
 
-    branches = out.split()
-    return branch_name in branches
+    cache = get_ancestry_cache()
+    key = get_ancestry_cache_key(ancestor_hash, descendant_hash)
+    result = cache.get(key)
+    if result != None:
+        return result
+
+    ret, out, err = rept_utils.exec_proc(
+        ['git', 'merge-base', '--is-ancestor', ancestor_hash, descendant_hash])
+
+    # Anything other than 0 (yes) or 1 (no) is an error, which isn't cached.
+    if ret in [0, 1]:
+        cache.put(key, ret == 0)
+
+    return ret == 0
+
+# A branch is merged if it's reachable from the target (HEAD by default), which
+# is exactly what "git branch --merged" reports. Asking about just the one branch
+# avoids listing every merged branch in the repo.
+def is_branch_merged(branch_name, target_rev='HEAD'):
+    return is_ancestor('refs/heads/' + branch_name, target_rev)
+
+# Batched version of is_branch_merged(). Takes a list of
+# (branch_name, target_rev) pairs and returns a list of bools in the same order.
+# Pairs are grouped by target so that each target costs a single git call.
+def are_branches_merged(branch_target_pairs):
+    cache = get_ancestry_cache()
+
+    # Answer what we can from the ancestry cache first.
+    results = []
+    uncached = {}
+    for branch_name, target_rev in branch_target_pairs:
+        branch_hash = get_rev_hash('refs/heads/' + branch_name)
+        target_hash = get_rev_hash(target_rev)
+        if not branch_hash or not target_hash:
+            results.append(False)
+            continue
+
+        key = get_ancestry_cache_key(branch_hash, target_hash)
+        result = cache.get(key)
+        results.append(result)
+        if result == None:
+            uncached.setdefault(target_rev, []).append(
+                (len(results) - 1, branch_name, key))
+
+    for target_rev, branch_infos in uncached.items():
+        branch_names = sorted(set([info[1] for info in branch_infos]))
+        merged = get_merged_branches(branch_names, target_rev)
+        for idx, branch_name, key in branch_infos:
+            results[idx] = branch_name in merged
+            cache.put(key, results[idx])
+
+    return results
 
+MAX_REF_PATTERNS_PER_CALL = 200
+
+# Return the subset of branch_names that are merged into target_rev.
+def get_merged_branches(branch_names, target_rev='HEAD'):
+    merged = set()
+    for i in range(0, len(branch_names), MAX_REF_PATTERNS_PER_CALL):
+        chunk = branch_names[i:i + MAX_REF_PATTERNS_PER_CALL]
+        chunk_set = set(chunk)
+        patterns = ['refs/heads/' + branch_name for branch_name in chunk]
+        ret, out, err = rept_utils.exec_proc(
+            ['git', 'for-each-ref', '--merged=' + target_rev,
+             '--format=%(refname)'] + patterns)
+        if ret:
+            continue
+
+        # Ref patterns also match anything below them (refs/heads/a matches
+        # refs/heads/a/b), so only keep exact matches.
+        for refname in out.split():
+            branch_name = refname[len('refs/heads/'):]
+            if branch_name in chunk_set:
+                merged.add(branch_name)
+
+    return merged
+
+@memoized
 def get_remotes():
     ret, out, err = rept_utils.exec_proc(['git', 'remote'])
     if ret:
@@ -61,14 +271,22 @@ def get_remotes():
     return [remote.strip() for remote in out.split(os.linesep)]
 
 def is_clean_working_directory(count_untracked):
-    cmd = ['git', 'status', '--porcelain']
+    # Rename detection is pointless for a yes/no answer. Git uses fsmonitor
+    # and the untracked cache on its own when the repo has them configured.
+    cmd = ['git', 'status', '--porcelain', '--no-renames']
     if not count_untracked:
         cmd.append('-uno')
     ret, out, err = rept_utils.exec_proc(cmd)
 
     return (ret == 0) and (out == '')
 
-def get_file_contents_for_revision(rev, filename):
+@memoized
+def get_file_contents_for_revision(rev, filename, repo_dir='.'):
+    contents, handled = git_objects.get_file_contents_for_revision(
+        rev, filename, repo_dir)
+    if handled:
+        return contents.decode('utf-8').strip() if contents != None else None
+
     spec = '{0}:{1}'.format(rev, filename)
-    ret, out, err = rept_utils.exec_proc(['git', 'show', spec])
+    ret, out, err = rept_utils.exec_proc(get_git_cmd(repo_dir) + ['show', spec])
     return out if not ret else None
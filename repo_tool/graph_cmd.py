@@ -0,0 +1,320 @@
+################################################################################
+# graph cmd funcs
+#
+# The "graph" command resolves the whole transitive dependency graph of the
+# currently checked out revision and prints it, either as a graphviz DOT file or
+# as JSON. Each repo in the graph is resolved at the revision the main .rept_deps
+# file pins it to, so every repo shows up once, with the commit it's pinned to.
+# Edges carry the revision the depending repo asked for, and the problems
+# "check-deps" would complain about are listed with the graph.
+#
+# "rept graph why <dependency>" lists every path from this repo to a
+# dependency, straight from the resolved graph.
+#
+# Repos are told apart by remote server and name, like in the .rept_deps file.
+# A repo is shown by name, with its server in front only when another repo in
+# the graph has the same name.
+#
+# Every repo in the graph has to be listed in the main .rept_deps file, so they
+# can all be resolved up front, independently of each other, and in parallel.
+# -j sets how many at a time.
+################################################################################
+
+import collections
+import json
+import os
+import sys
+
+from repo_tool import check_deps_cmd
+from repo_tool import dag_scheduler
+from repo_tool import deps_cache
+from repo_tool import git_utils
+from repo_tool import graph_utils
+from repo_tool import rept_utils
+
+DEFAULT_NUM_JOBS = 4
+
+# remote_server is None for the root.
+GraphNode = collections.namedtuple('GraphNode',
+    'name remote_server path revision rev_hash err')
+
+# src and dst are node keys. err is set when the depending repo asks for a
+# different revision than the one the main .rept_deps file pins.
+GraphEdge = collections.namedtuple('GraphEdge',
+    'src dst revision err')
+
+# nodes is an OrderedDict of GraphNodes keyed by (remote server, name), in the
+# order they were found; root is the root's key. errs is a list of (node key,
+# err) pairs.
+DepGraph = collections.namedtuple('DepGraph',
+    'root nodes edges errs')
+
+GraphArgs = collections.namedtuple('GraphArgs',
+    'output_format why_dep num_jobs')
+
+################################################################################
+# resolution funcs
+################################################################################
+
+# Resolve a repo's pinned revision and load its dependencies. Runs on a worker
+# thread, so everything here works on explicit repo dirs and never changes the
+# current directory. Returns (rev_hash, dependencies, err).
+def resolve_repo(target_dep):
+    dep = target_dep.dependency
+    repo_path = target_dep.repo_abs_path
+
+    if not os.path.isdir(repo_path):
+        return (None, None, 'Missing repo: {0}'.format(dep.name))
+
+    rev_hash = git_utils.get_rev_hash(dep.revision, repo_path)
+    if not rev_hash:
+        err = rept_utils.gen_bad_revision_err_str(
+            dep.name, dep.revision, 'could not get revision from the repo')
+        return (None, None, err)
+
+    dependencies, err = deps_cache.get_dependency_data_for_revision(
+        rev_hash, repo_path)
+    return (rev_hash, dependencies, err)
+
+def get_root_key():
+    return (None, os.path.basename(os.getcwd()))
+
+# The name each node is shown by: its repo name, or "<server>:<name>" when more
+# than one node has that name. Returns a dict from node key to label.
+def get_node_labels(nodes):
+    name_counts = collections.Counter([node.name for node in nodes.values()])
+
+    labels = {}
+    for key, node in nodes.items():
+        if name_counts[node.name] > 1 and node.remote_server:
+            labels[key] = '{0}:{1}'.format(node.remote_server, node.name)
+        else:
+            labels[key] = node.name
+    return labels
+
+def resolve_graph(dependencies, num_jobs):
+    targets = check_deps_cmd.get_target_deps(dependencies)
+
+    # Every repo past the root is a target, so the graph's nodes are known
+    # before anything is resolved.
+    target_keys = []
+    for dep in dependencies:
+        key = rept_utils.get_dependency_key(dep)
+        if key not in target_keys:
+            target_keys.append(key)
+    results = dag_scheduler.run_dag(
+        target_keys, {}, lambda key: resolve_repo(targets[key]), num_jobs)
+
+    root_key = get_root_key()
+    nodes = collections.OrderedDict()
+    nodes[root_key] = GraphNode(root_key[1], None, '.', 'HEAD',
+                                git_utils.get_rev_hash('HEAD'), None)
+    edges = []
+    errs = []
+
+    def add_edges(src_key, repo_deps):
+        for dep in repo_deps:
+            target_dep = check_deps_cmd.find_target_dep(targets, dep)
+            if not target_dep:
+                errs.append((src_key,
+                    "Unlisted dependency '{0}' found".format(dep.name)))
+                continue
+
+            target = target_dep.dependency
+            err = None
+            if dep.revision != target.revision:
+                err = ('Inconsistent dependency for {0}: required: {1}, '
+                       'found: {2}').format(
+                           dep.name, target.revision, dep.revision)
+                errs.append((src_key, err))
+
+            edges.append(GraphEdge(src_key,
+                rept_utils.get_dependency_key(target), dep.revision, err))
+
+    for key in target_keys:
+        dep = targets[key].dependency
+        rev_hash, repo_deps, err = results[key]
+        nodes[key] = GraphNode(
+            dep.name, dep.remote_server, dep.path, dep.revision, rev_hash, err)
+
+    add_edges(root_key, dependencies)
+    for key in target_keys:
+        if results[key][2]:
+            errs.append((key, results[key][2]))
+    for key in target_keys:
+        repo_deps = results[key][1]
+        if repo_deps:
+            add_edges(key, repo_deps)
+
+    errs.extend(find_cycle_errs(root_key, edges, get_node_labels(nodes)))
+
+    return DepGraph(root_key, nodes, edges, errs)
+
+def get_children_by_repo(edges):
+    children = collections.OrderedDict()
+    for edge in edges:
+        children.setdefault(edge.src, [])
+        if edge.dst not in children[edge.src]:
+            children[edge.src].append(edge.dst)
+    return children
+
+# Report each circular reference once, with all of the repos in it.
+def find_cycle_errs(root_key, edges, labels):
+    children = get_children_by_repo(edges)
+    get_children = lambda key: children.get(key, [])
+    components, parents = graph_utils.find_components([root_key], get_children)
+
+    errs = []
+    for component in reversed(components):
+        if graph_utils.is_cycle(component, get_children):
+            errs.append((component[0],
+                'Circular reference detected, members: ' +
+                ', '.join([labels[key] for key in component])))
+    return errs
+
+# Every path from the root to one of the given nodes. Paths don't go around
+# cycles.
+#
+# There can be exponentially many paths, but the walk only goes into repos that
+# lead to a wanted node (found by walking back from the wanted nodes first), so
+# it does little more work than it takes to list the paths.
+def find_paths_to(graph, dst_keys):
+    children = get_children_by_repo(graph.edges)
+
+    parents = {}
+    for edge in graph.edges:
+        parents.setdefault(edge.dst, []).append(edge.src)
+
+    leads_to_dst = set(dst_keys)
+    to_visit = collections.deque(dst_keys)
+    while to_visit:
+        for parent in parents.get(to_visit.popleft(), []):
+            if parent not in leads_to_dst:
+                leads_to_dst.add(parent)
+                to_visit.append(parent)
+
+    paths = []
+    # Each work item is a path and the set of nodes on it.
+    work = []
+    if graph.root in leads_to_dst:
+        work.append(([graph.root], set([graph.root])))
+    while work:
+        path, on_path = work.pop()
+        if path[-1] in dst_keys:
+            paths.append(path)
+            continue
+        for child in reversed(children.get(path[-1], [])):
+            if child in leads_to_dst and child not in on_path:
+                work.append((path + [child], on_path | set([child])))
+    return paths
+
+################################################################################
+# output funcs
+################################################################################
+
+def get_short_hash(rev_hash):
+    return rev_hash[:12] if rev_hash else '?'
+
+def quote_dot_str(s):
+    s = s.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '"{0}"'.format(s)
+
+def print_graph_dot(graph):
+    labels = get_node_labels(graph.nodes)
+
+    print('digraph rept {')
+    for key, node in graph.nodes.items():
+        label = '{0}\n{1}'.format(labels[key], get_short_hash(node.rev_hash))
+        attrs = 'label={0}'.format(quote_dot_str(label))
+        if node.err:
+            attrs += ', color=red'
+        print('    {0} [{1}];'.format(quote_dot_str(labels[key]), attrs))
+    for edge in graph.edges:
+        attrs = 'label={0}'.format(quote_dot_str(edge.revision))
+        if edge.err:
+            attrs += ', color=red'
+        print('    {0} -> {1} [{2}];'.format(
+            quote_dot_str(labels[edge.src]), quote_dot_str(labels[edge.dst]),
+            attrs))
+    print('}')
+
+# Nodes are listed with their fields; edges and errors refer to nodes by label.
+def print_graph_json(graph):
+    labels = get_node_labels(graph.nodes)
+
+    edges = []
+    for edge in graph.edges:
+        edge_dict = edge._asdict()
+        edge_dict['src'] = labels[edge.src]
+        edge_dict['dst'] = labels[edge.dst]
+        edges.append(edge_dict)
+
+    contents = {
+        'root': labels[graph.root],
+        'nodes': [node._asdict() for node in graph.nodes.values()],
+        'edges': edges,
+        'errors': [{'repo': labels[key], 'error': err}
+                   for key, err in graph.errs],
+    }
+    print(json.dumps(contents, indent=2))
+
+# repo_name may be a plain name, matching every repo with that name, or a
+# "<server>:<name>" label.
+def print_graph_why(graph, repo_name):
+    labels = get_node_labels(graph.nodes)
+    dst_keys = set([key for key, node in graph.nodes.items()
+                    if repo_name in [node.name, labels[key]]])
+    if not dst_keys:
+        sys.exit("error: '{0}' is not in the dependency graph".format(repo_name))
+
+    for path in find_paths_to(graph, dst_keys):
+        print(' -> '.join([labels[key] for key in path]))
+
+################################################################################
+# command funcs
+################################################################################
+
+def print_graph_usage():
+    rept_utils.printerr('usage: rept graph [-j <jobs>] [--format (dot | json)]')
+    rept_utils.printerr('   or: rept graph [-j <jobs>] why <dependency-name>')
+
+def parse_graph_args(args):
+    parsed_args = rept_utils.parse_args(
+        args, 'j:', ['format='], usage_fn=print_graph_usage)
+
+    output_format = 'dot'
+    num_jobs = DEFAULT_NUM_JOBS
+    for opt, optarg in parsed_args[0]:
+        if opt == '--format':
+            if optarg not in ['dot', 'json']:
+                rept_utils.printerr("error: '--format' must be 'dot' or 'json'")
+                print_graph_usage()
+                sys.exit(1)
+            output_format = optarg
+        elif opt == '-j':
+            num_jobs = dag_scheduler.parse_num_workers(optarg)
+            if not num_jobs:
+                rept_utils.printerr("error: '-j' must be a positive number")
+                print_graph_usage()
+                sys.exit(1)
+
+    why_dep = None
+    if len(parsed_args[1]):
+        if parsed_args[1][0] != 'why' or len(parsed_args[1]) != 2:
+            print_graph_usage()
+            sys.exit(1)
+        why_dep = parsed_args[1][1]
+
+    return GraphArgs(output_format, why_dep, num_jobs)
+
+def cmd_graph(dependencies, args):
+    graph_args = parse_graph_args(args)
+
+    graph = resolve_graph(dependencies, graph_args.num_jobs)
+
+    if graph_args.why_dep:
+        print_graph_why(graph, graph_args.why_dep)
+    elif graph_args.output_format == 'json':
+        print_graph_json(graph)
+    else:
+        print_graph_dot(graph)
@@ -0,0 +1,78 @@
+################################################################################
+# graph util funcs
+################################################################################
+
+# Find the strongly connected components of the graph reachable from roots, in
+# one linear pass (Tarjan's algorithm, without recursion so deep graphs can't
+# overflow the stack). get_children(node) returns a node's children.
+#
+# Returns (components, parents). Each component is a list of nodes in the order
+# they were reached, so its first node is where the walk entered it. Components
+# come out children first: a component can only depend on components that came
+# before it. parents maps each node to the node the walk reached it from (None
+# for roots).
+def find_components(roots, get_children):
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+    parents = {}
+
+    def start(node, parent):
+        index[node] = lowlink[node] = len(index)
+        parents[node] = parent
+        stack.append(node)
+        on_stack.add(node)
+        return (node, iter(get_children(node)))
+
+    for root in roots:
+        if root in index:
+            continue
+
+        work = [start(root, None)]
+        while work:
+            node, children = work[-1]
+
+            child_started = False
+            for child in children:
+                if child not in index:
+                    work.append(start(child, node))
+                    child_started = True
+                    break
+                elif child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            if child_started:
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.remove(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                component.reverse()
+                components.append(component)
+
+    return (components, parents)
+
+# A component is a cycle if it has more than one node, or its one node depends
+# on itself.
+def is_cycle(component, get_children):
+    return len(component) > 1 or component[0] in get_children(component[0])
+
+# The path the walk took from a root to node.
+def get_path_to(parents, node):
+    path = []
+    while node != None:
+        path.append(node)
+        node = parents[node]
+    path.reverse()
+    return path
@@ -0,0 +1,225 @@
+################################################################################
+# history cmd funcs
+#
+# The "history" command shows how this repo's pin for a dependency changed over
+# its history: every commit that changed the pin, newest first, with the
+# revision it pinned. With --revision, only the commits that pinned that
+# revision are shown.
+#
+# History follows first parents, so it's the history of the pin on the current
+# branch, with merges counted as the commit that changed the pin.
+#
+# The pins come from an index of the commits that changed the .rept_deps file,
+# kept in the repo's cache dir. Each entry also records the next older commit
+# that changed the file, so a commit's whole history can be read from the index
+# without asking git. Only commits that aren't in the index yet are read from
+# the log, and that read stops as soon as it reaches one that is.
+################################################################################
+
+import collections
+import sys
+import time
+
+from repo_tool import deps_cache
+from repo_tool import git_objects
+from repo_tool import git_refs
+from repo_tool import git_utils
+from repo_tool import rept_cache
+from repo_tool import rept_utils
+
+HISTORY_CACHE_NAME = 'deps-history'
+HISTORY_CACHE_MAX_ENTRIES = 16384
+
+NULL_HASH = '0' * 40
+
+# A commit that changed the .rept_deps file. pins maps each dependency name to
+# the revision the commit pinned it to. prev is the next older commit that
+# changed the file, or None.
+DepsChange = collections.namedtuple('DepsChange',
+    'commit time subject prev pins err')
+
+HistoryArgs = collections.namedtuple('HistoryArgs',
+    'dep_name revision')
+
+################################################################################
+# index funcs
+################################################################################
+
+def get_history_cache():
+    return rept_cache.get_cache(
+        HISTORY_CACHE_NAME, HISTORY_CACHE_MAX_ENTRIES,
+        version=deps_cache.DEPS_CACHE_VERSION)
+
+def get_change_key(commit):
+    return 'change:' + commit
+
+def get_head_key(commit):
+    return 'head:' + commit
+
+def read_blob(blob_hash):
+    obj = git_objects.read_object(blob_hash)
+    if obj and obj[0] == git_objects.OBJ_BLOB:
+        return obj[1].decode('utf-8')
+
+    ret, out, err = rept_utils.exec_proc(['git', 'cat-file', 'blob', blob_hash])
+    return out if not ret else None
+
+# Returns (pins, err) for the .rept_deps file with the given blob hash.
+def get_pins(blob_hash):
+    if blob_hash == NULL_HASH:
+        return ({}, None)
+
+    dependencies, err = deps_cache.get_cached_parse(
+        'revision:' + blob_hash,
+        lambda: deps_cache.parse_revision_contents(read_blob(blob_hash)))
+    if err:
+        return ({}, err)
+    return (dict([(dep.name, dep.revision) for dep in dependencies]), None)
+
+# Add the commits that changed the .rept_deps file on rev's first-parent history
+# to the index, up to the first one that's already there. Returns the newest
+# such commit, or None if there isn't one, and an err.
+def index_changes(rev):
+    cache = get_history_cache()
+
+    # Each commit is a "commit <hash> <time> <subject>" line, followed by a raw
+    # diff line for the file: ":<modes> <old blob> <new blob> <status>\t<path>"
+    cmd = ['git', 'log', '--first-parent', '-m', '--raw', '--no-abbrev',
+           '--format=commit %H %ct %s', rev, '--', deps_cache.DEPS_FILENAME]
+
+    new_changes = []
+    state = {'indexed': None}
+    def on_line(line):
+        if line.startswith('commit '):
+            fields = line[len('commit '):].split(' ', 2)
+            commit = fields[0]
+            if cache.get(get_change_key(commit)):
+                state['indexed'] = commit
+                return False
+            subject = fields[2] if len(fields) > 2 else ''
+            new_changes.append([commit, int(fields[1]), subject, NULL_HASH])
+        elif line.startswith(':') and new_changes:
+            new_changes[-1][3] = line.split('\t', 1)[0].split()[-2]
+        return True
+
+    ret = rept_utils.exec_proc_lines(cmd, on_line)
+    if ret and not state['indexed']:
+        return (None, 'could not read the history of {0}'.format(rev))
+
+    for idx, change in enumerate(new_changes):
+        commit, commit_time, subject, blob_hash = change
+        if idx + 1 < len(new_changes):
+            prev = new_changes[idx + 1][0]
+        else:
+            prev = state['indexed']
+        pins, err = get_pins(blob_hash)
+        cache.put(get_change_key(commit),
+                  [commit_time, subject, prev, pins, err])
+
+    if new_changes:
+        return (new_changes[0][0], None)
+    return (state['indexed'], None)
+
+# Get the commits that changed the .rept_deps file on the first-parent history
+# of a commit, newest first. Returns (changes, err).
+def get_changes(head_hash):
+    cache = get_history_cache()
+
+    head_key = get_head_key(head_hash)
+    commit = cache.get(head_key)
+    if commit == None:
+        commit, err = index_changes(head_hash)
+        if err:
+            return (None, err)
+        cache.put(head_key, commit or '')
+
+    changes = []
+    while commit:
+        entry = cache.get(get_change_key(commit))
+        if not entry:
+            # Evicted from the index. Index it again from here on.
+            index_changes(commit)
+            entry = cache.get(get_change_key(commit))
+            if not entry:
+                return (None,
+                        'could not read the history of {0}'.format(commit))
+        changes.append(DepsChange(commit, *entry))
+        commit = entry[2]
+    return (changes, None)
+
+# Does a pinned revision match the one asked for? Commit hashes may be
+# abbreviated.
+def is_matching_revision(pinned, revision):
+    if pinned == revision:
+        return True
+    return (git_refs.HEX_RE.match(revision) != None and
+            git_refs.HEX_RE.match(pinned) != None and
+            pinned.lower().startswith(revision.lower()))
+
+# The changes to one dependency's pin, newest first, as (change, revision)
+# pairs. The revision is None when the change removed the dependency. Changes
+# whose .rept_deps file couldn't be parsed are skipped.
+def get_pin_changes(changes, dep_name):
+    pin_changes = []
+    prev_revision = None
+    for change in reversed(changes):
+        if change.err:
+            continue
+        revision = change.pins.get(dep_name)
+        if revision != prev_revision:
+            pin_changes.append((change, revision))
+        prev_revision = revision
+    pin_changes.reverse()
+    return pin_changes
+
+################################################################################
+# command funcs
+################################################################################
+
+def print_pin_change(change, revision):
+    print('{0} {1} {2}  {3}'.format(
+        change.commit[:12],
+        time.strftime('%Y-%m-%d', time.localtime(change.time)),
+        revision if revision != None else '(removed)',
+        change.subject))
+
+def print_history_usage():
+    rept_utils.printerr(
+        'usage: rept history [--revision <revision>] <dependency-name>')
+
+def parse_history_args(args):
+    parsed_args = rept_utils.parse_args(
+        args, '', ['revision='], usage_fn=print_history_usage)
+
+    revision = None
+    for opt, optarg in parsed_args[0]:
+        if opt == '--revision':
+            revision = optarg
+
+    if len(parsed_args[1]) != 1:
+        print_history_usage()
+        sys.exit(1)
+
+    return HistoryArgs(parsed_args[1][0], revision)
+
+def cmd_history(args):
+    history_args = parse_history_args(args)
+
+    head_hash = git_utils.get_rev_hash('HEAD')
+    if not head_hash:
+        sys.exit('error: this repo has no commits')
+
+    changes, err = get_changes(head_hash)
+    if err:
+        sys.exit('error: ' + err)
+
+    pin_changes = get_pin_changes(changes, history_args.dep_name)
+    if not pin_changes:
+        sys.exit("error: '{0}' has never been a dependency".format(
+            history_args.dep_name))
+
+    for change, revision in pin_changes:
+        if (history_args.revision == None or
+            (revision != None and
+             is_matching_revision(revision, history_args.revision))):
+            print_pin_change(change, revision)
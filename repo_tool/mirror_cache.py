@@ -0,0 +1,183 @@
+################################################################################
+# mirror cache funcs
+#
+# When the REPT_MIRROR_DIR environment variable names a directory, sync keeps a
+# bare mirror of each dependency's remote repo there, shared by every workspace
+# on the machine. Dependencies are then cloned and fetched from the mirror,
+# which is a local operation, and only the mirror talks to the remote server.
+# A clone still gets the real remote URL, so pushes go where they always did.
+#
+# There's one mirror per remote URL. A mirror is brought up to date at most
+# once per run, and only by one process at a time: whoever is updating it holds
+# an OS lock on a file next to it (<mirror>.lock). The OS lets go of the lock
+# when its process dies, so a killed run can't leave the mirror locked, and the
+# lock file itself is never removed.
+################################################################################
+
+import errno # python 2 hack
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+from repo_tool import rept_utils
+
+MIRROR_DIR_ENV_VAR = 'REPT_MIRROR_DIR'
+
+# How long to wait for another process to finish updating a mirror.
+LOCK_TIMEOUT_SECS = 600
+LOCK_POLL_SECS = 0.5
+
+UNSAFE_NAME_CHARS_RE = re.compile(r'[^A-Za-z0-9._-]')
+
+# The mirrors this process has already brought up to date, keyed by path.
+updated_mirrors = set()
+
+# Threads syncing different dependencies may share a mirror.
+mirror_locks = {}
+mirror_locks_lock = threading.Lock()
+
+def get_mirror_dir():
+    mirror_dir = os.environ.get(MIRROR_DIR_ENV_VAR)
+    return os.path.abspath(mirror_dir) if mirror_dir else None
+
+# The mirror's path is made from the URL's last part, to make it recognizable,
+# and a hash of the whole URL, to make it unique.
+def get_mirror_path(mirror_dir, url):
+    name = os.path.basename(url.rstrip('/\\')) or 'repo'
+    if name.endswith('.git'):
+        name = name[:-len('.git')]
+    name = UNSAFE_NAME_CHARS_RE.sub('_', name)
+    url_hash = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(mirror_dir, '{0}-{1}.git'.format(name, url_hash))
+
+def get_thread_lock(mirror_path):
+    with mirror_locks_lock:
+        return mirror_locks.setdefault(mirror_path, threading.Lock())
+
+# Try to take the OS lock on an open lock file, without waiting. Returns
+# whether it was taken.
+def try_lock_file(fd):
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except (IOError, OSError):
+        return False
+
+# Take the mirror's lock, waiting for another process to let it go if need be.
+# Returns (lock_fd, err).
+def lock_mirror(mirror_path):
+    lock_path = mirror_path + '.lock'
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_RDWR)
+    except OSError:
+        return (None, 'cannot open lock file {0}'.format(lock_path))
+
+    deadline = time.time() + LOCK_TIMEOUT_SECS
+    while not try_lock_file(fd):
+        if time.time() > deadline:
+            os.close(fd)
+            return (None, 'timed out waiting for the lock on {0}'.format(
+                lock_path))
+        time.sleep(LOCK_POLL_SECS)
+    return (fd, None)
+
+# Let go of a lock taken by lock_mirror().
+def unlock_mirror(lock_fd):
+    try:
+        if fcntl:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(lock_fd, 0, os.SEEK_SET)
+            msvcrt.locking(lock_fd, msvcrt.LK_UNLCK, 1)
+    except (IOError, OSError):
+        pass
+    os.close(lock_fd)
+
+# Create or fetch the mirror. Must be called with the mirror locked. Returns an
+# err, or None.
+def refresh_mirror(mirror_path, url):
+    if os.path.isdir(mirror_path):
+        ret = rept_utils.exec_proc(
+            ['git', 'fetch', '--prune', 'origin'], False, mirror_path)
+        if ret:
+            return 'cannot update mirror {0}'.format(mirror_path)
+        return None
+
+    # Clone next to the mirror and move it into place, so a failed clone never
+    # leaves a broken mirror behind.
+    tmp_path = mirror_path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    ret = rept_utils.exec_proc(
+        ['git', 'clone', '--mirror', url, tmp_path], False)
+    if ret:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return 'cannot create mirror of {0}'.format(url)
+    os.rename(tmp_path, mirror_path)
+    return None
+
+# Bring the mirror of the repo at url up to date, unless that's already been
+# done by this process. Returns (mirror_path, err).
+def update_mirror(mirror_dir, url):
+    mirror_path = get_mirror_path(mirror_dir, url)
+
+    with get_thread_lock(mirror_path):
+        if mirror_path in updated_mirrors:
+            return (mirror_path, None)
+
+        # start python 2 hack
+        #os.makedirs(mirror_dir, exist_ok=True)
+        try:
+            os.makedirs(mirror_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                return (None,
+                        'cannot create mirror dir {0}'.format(mirror_dir))
+        # end python 2 hack
+
+        lock_fd, err = lock_mirror(mirror_path)
+        if err:
+            return (None, err)
+        try:
+            err = refresh_mirror(mirror_path, url)
+        finally:
+            unlock_mirror(lock_fd)
+        if err:
+            return (None, err)
+
+        updated_mirrors.add(mirror_path)
+        return (mirror_path, None)
+
+# Clone the mirror into repo_path, with the remote named and pointed at url as
+# if it had been cloned from there. Returns an err, or None.
+def clone_from_mirror(mirror_path, repo_path, remote, url):
+    ret = rept_utils.exec_proc(
+        ['git', 'clone', '-o', remote, mirror_path, '.'], False, repo_path)
+    if ret:
+        return 'cannot clone from mirror {0}'.format(mirror_path)
+
+    ret, out, err = rept_utils.exec_proc(
+        ['git', 'remote', 'set-url', remote, url], True, repo_path)
+    if ret:
+        return 'cannot set the url of {0}'.format(remote)
+    return None
+
+# Fetch the mirror's branches and tags into repo_path, as a fetch from remote
+# would. Returns the fetch's return code.
+def fetch_from_mirror(mirror_path, repo_path, remote):
+    return rept_utils.exec_proc(
+        ['git', 'fetch', '--tags', mirror_path,
+         '+refs/heads/*:refs/remotes/{0}/*'.format(remote)],
+        False, repo_path)
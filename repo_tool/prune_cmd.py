@@ -4,6 +4,8 @@
 # The "prune" command removes all remote branches from all repos on which the
 # currently checked out revision of the current repo depend.
 # i.e. 'git remote prune <remote>' is called for all dependent repos.
+#
+# To fetch and prune in one go, use "rept fetch --prune" instead.
 ################################################################################
 
 import sys
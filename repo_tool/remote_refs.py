@@ -0,0 +1,231 @@
+################################################################################
+# remote ref funcs
+#
+# Most fetches bring nothing new, but each one still goes through a full fetch
+# negotiation. Asking a remote for its branch and tag tips ("git ls-remote") is
+# much cheaper, and if every tip matches what the repo already has, there's
+# nothing to fetch.
+#
+# Checks run in parallel, with a cap on how many hit the same remote server at
+# once. Anything that can't be checked (an unusual fetch refspec, a failed
+# ls-remote, a ref the ref reader can't answer for) counts as changed, so the
+# repo just gets fetched as it would have been anyway.
+#
+# A narrow fetch only fetches the one revision a dependency is pinned to,
+# instead of every branch and tag of its remote.
+#
+# Each repo's cache dir also remembers when it was last fetched from each
+# remote, or found to have nothing new on it. With a fetch TTL (the "fetch_ttl"
+# setting in .rept_local), a repo that was brought up to date more recently than
+# that isn't checked or fetched again.
+################################################################################
+
+import os
+import threading
+import time
+
+from multiprocessing.pool import ThreadPool
+
+from repo_tool import git_refs
+from repo_tool import git_utils
+from repo_tool import rept_cache
+from repo_tool import rept_utils
+
+DEFAULT_NUM_JOBS = 8
+MAX_CHECKS_PER_SERVER = 4
+
+FETCH_TIMES_CACHE_NAME = 'fetch-times'
+FETCH_TIMES_CACHE_MAX_ENTRIES = 256
+
+def get_default_refspec(remote):
+    return '+refs/heads/*:refs/remotes/{0}/*'.format(remote)
+
+# The refspec that fetches just a dependency's pinned revision into the repo at
+# repo_path, or None if the revision isn't something that can be fetched on its
+# own (like a local branch). A remote-tracking branch fetches the one branch, a
+# commit hash fetches the commit (if the server allows it), and a name the repo
+# already has as a tag fetches that tag.
+def get_narrow_refspec(remote, revision, repo_path):
+    if git_refs.FULL_HASH_RE.match(revision):
+        return revision
+
+    if git_refs.UNSUPPORTED_REV_RE.search(revision):
+        return None
+
+    remote_prefix = remote + '/'
+    if revision.startswith(remote_prefix):
+        branch = revision[len(remote_prefix):]
+        if branch == 'HEAD':
+            return None
+        return '+refs/heads/{0}:refs/remotes/{1}/{0}'.format(branch, remote)
+
+    if '/' in revision or git_refs.PSEUDO_REF_RE.match(revision):
+        return None
+
+    tag_refname = 'refs/tags/' + revision
+    if not git_utils.get_rev_hash(tag_refname, repo_path):
+        return None
+    return '{0}:{0}'.format(tag_refname)
+
+# Split a refspec that maps one ref to another into (src, dst). Returns
+# (None, None) for anything else.
+def parse_ref_refspec(refspec):
+    src, sep, dst = refspec.lstrip('+').partition(':')
+    if not sep or not src.startswith('refs/') or not dst.startswith('refs/'):
+        return (None, None)
+    return (src, dst)
+
+def get_fetch_times_cache(repo_path):
+    return rept_cache.get_cache(
+        FETCH_TIMES_CACHE_NAME, FETCH_TIMES_CACHE_MAX_ENTRIES, repo_path)
+
+# Fetch times are kept per remote, and per narrow refspec, since a narrow fetch
+# only brings the one ref up to date.
+def get_fetch_time_key(remote, narrow_refspec=None):
+    if narrow_refspec:
+        return '{0} {1}'.format(remote, narrow_refspec)
+    return remote
+
+# Remember that the repo was just brought up to date with the remote.
+def record_fetch(repo_path, remote, narrow_refspec=None):
+    cache = get_fetch_times_cache(repo_path)
+    cache.put(get_fetch_time_key(remote, narrow_refspec), time.time())
+
+# Was the repo brought up to date with the remote less than fetch_ttl seconds
+# ago? A full fetch also counts for any narrow one.
+def is_recently_fetched(repo_path, remote, fetch_ttl, narrow_refspec=None):
+    if not fetch_ttl or not os.path.exists(os.path.join(repo_path, '.git')):
+        return False
+
+    keys = [get_fetch_time_key(remote)]
+    if narrow_refspec:
+        keys.append(get_fetch_time_key(remote, narrow_refspec))
+
+    cache = get_fetch_times_cache(repo_path)
+    now = time.time()
+    for key in keys:
+        fetch_time = cache.get(key)
+        if fetch_time != None and 0 <= now - fetch_time < fetch_ttl:
+            return True
+    return False
+
+# Fetch from the remote. With a narrow refspec, only that's fetched, without
+# tags, falling back to a full fetch if that fails. A pruning fetch is always a
+# full one. Returns the fetch's return code.
+def fetch_remote(repo_path, remote, narrow_refspec=None, prune=False):
+    if prune:
+        narrow_refspec = None
+
+    if narrow_refspec:
+        ret, out, err = rept_utils.exec_proc(
+            ['git', 'fetch', '--no-tags', remote, narrow_refspec],
+            True, repo_path)
+        if not ret:
+            record_fetch(repo_path, remote, narrow_refspec)
+            return ret
+
+    cmd = ['git', 'fetch'] + (['--prune'] if prune else []) + [remote]
+    ret = rept_utils.exec_proc(cmd, False, repo_path)
+    if not ret:
+        record_fetch(repo_path, remote)
+    return ret
+
+# Returns a dict from each branch and tag ref the remote advertises to its hash,
+# or None if the remote couldn't be asked.
+def get_advertised_refs(repo_path, remote):
+    ret, out, err = rept_utils.exec_proc(
+        ['git', 'ls-remote', '--heads', '--tags', remote], True, repo_path)
+    if ret:
+        return None
+
+    refs = {}
+    for line in out.splitlines():
+        fields = line.split('\t')
+        # Skip the peeled values of annotated tags ("refs/tags/v1^{}").
+        if len(fields) != 2 or fields[1].endswith('^{}'):
+            continue
+        refs[fields[1]] = fields[0]
+    return refs
+
+# The local ref a fetch would update for a ref the remote advertises.
+def get_local_refname(remote_refname, remote):
+    heads_prefix = 'refs/heads/'
+    if remote_refname.startswith(heads_prefix):
+        return 'refs/remotes/{0}/{1}'.format(
+            remote, remote_refname[len(heads_prefix):])
+    return remote_refname
+
+# Does the remote have anything the repo doesn't? With a narrow refspec (see
+# get_narrow_refspec()), only the one ref it fetches is compared, and a commit
+# hash only needs to be in the repo.
+def has_remote_changes(repo_path, remote, narrow_refspec=None):
+    if narrow_refspec and git_refs.FULL_HASH_RE.match(narrow_refspec):
+        return not git_utils.has_commit(narrow_refspec, repo_path)
+
+    wanted = None
+    if narrow_refspec:
+        src, dst = parse_ref_refspec(narrow_refspec)
+        if not src:
+            return True
+        wanted = {src: dst}
+    else:
+        # With a custom refspec, the remote's refs don't map onto local ones
+        # the way we expect.
+        ret, out, err = rept_utils.exec_proc(
+            ['git', 'config', '--get-all', 'remote.{0}.fetch'.format(remote)],
+            True, repo_path)
+        if ret or out.splitlines() != [get_default_refspec(remote)]:
+            return True
+
+    advertised = get_advertised_refs(repo_path, remote)
+    if advertised == None:
+        return True
+
+    if wanted:
+        if not set(wanted.keys()) <= set(advertised.keys()):
+            return True
+        advertised = dict(
+            [(refname, advertised[refname]) for refname in wanted])
+
+    for remote_refname, rev_hash in advertised.items():
+        if wanted:
+            local_refname = wanted[remote_refname]
+        else:
+            local_refname = get_local_refname(remote_refname, remote)
+        local_hash, handled = git_refs.resolve_rev(local_refname, repo_path)
+        if not handled or local_hash != rev_hash:
+            return True
+    return False
+
+# Check the given repos, each a (repo_path, remote, remote_server,
+# narrow_refspec) tuple. The remote server only matters for grouping the
+# checks, and narrow_refspec may be None. Returns the set of paths of the repos
+# that are up to date with their remotes.
+def find_up_to_date_repos(repos, num_jobs=DEFAULT_NUM_JOBS):
+    repos = [repo for repo in repos
+             if os.path.exists(os.path.join(repo[0], '.git'))]
+    if not repos:
+        return set()
+
+    server_locks = {}
+    for repo_path, remote, remote_server, narrow_refspec in repos:
+        server_locks.setdefault(
+            remote_server, threading.Semaphore(MAX_CHECKS_PER_SERVER))
+
+    def check_repo(repo):
+        repo_path, remote, remote_server, narrow_refspec = repo
+        with server_locks[remote_server]:
+            has_changes = has_remote_changes(repo_path, remote, narrow_refspec)
+        if not has_changes:
+            record_fetch(repo_path, remote, narrow_refspec)
+        return has_changes
+
+    pool = ThreadPool(min(num_jobs, len(repos)))
+    try:
+        results = pool.map(check_repo, repos)
+    finally:
+        pool.close()
+        pool.join()
+
+    return set([repo[0] for repo, has_changes in zip(repos, results)
+                if not has_changes])
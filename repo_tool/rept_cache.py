@@ -0,0 +1,131 @@
+################################################################################
+# rept cache funcs
+#
+# rept keeps a few small caches on disk, inside the git dir of the repo they
+# describe (.git/rept/<cache name>). They only ever hold answers that can be
+# recomputed, so a missing, stale or corrupt cache file is never an error; it's
+# just an empty cache.
+#
+# Each cache is bounded. When it grows past its maximum size, the least
+# recently used entries are evicted.
+#
+# Changes are kept in memory, and every changed cache is written out once, when
+# the command finishes (see save_all()). A run that only reads a cache leaves
+# its file alone, so the recency of what it read isn't recorded.
+#
+# Each cache file records the version of the file layout and of the cache's
+# contents. A file with any other version (say, one written by an older rept
+# that stored dependencies differently) is treated as empty.
+################################################################################
+
+import collections
+import json
+import os
+import threading
+
+from repo_tool import git_refs
+from repo_tool import rept_utils
+
+CACHE_DIR_NAME = 'rept'
+
+# Bump whenever the layout of cache files changes.
+FORMAT_VERSION = 1
+
+# Caches that have already been loaded by this process, keyed by file path.
+loaded_caches = {}
+
+# Caches may be shared by threads resolving different repos at the same time.
+cache_lock = threading.RLock()
+
+def get_cache_dir(repo_dir='.'):
+    git_dir, common_dir = git_refs.find_git_dirs(repo_dir)
+    if not common_dir:
+        return None
+    return os.path.join(common_dir, CACHE_DIR_NAME)
+
+class BoundedCache(object):
+    def __init__(self, path, max_entries, version=0):
+        self.path = path
+        self.max_entries = max_entries
+        self.version = '{0}.{1}'.format(FORMAT_VERSION, version)
+        self.entries = collections.OrderedDict()
+        self.dirty = False
+
+        if not path:
+            return
+
+        try:
+            with open(path) as f:
+                contents = json.load(f)
+            if (type(contents) != dict or
+                contents.get('version') != self.version):
+                return
+            for key, value in contents['entries']:
+                self.entries[key] = value
+        except (IOError, OSError, ValueError, TypeError, KeyError):
+            self.entries = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        with cache_lock:
+            if key not in self.entries:
+                return default
+
+            # Move the entry to the most recently used end.
+            value = self.entries.pop(key)
+            self.entries[key] = value
+            return value
+
+    def put(self, key, value):
+        with cache_lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+
+    def clear(self):
+        with cache_lock:
+            self.entries.clear()
+            self.dirty = True
+
+    # Write the cache out, if it's changed since it was loaded or last saved.
+    def save(self):
+        if not self.path:
+            return
+
+        try:
+            with cache_lock:
+                if not self.dirty:
+                    return
+                self.dirty = False
+                cache_dir = os.path.dirname(self.path)
+                if not os.path.isdir(cache_dir):
+                    os.makedirs(cache_dir)
+                rept_utils.write_file_atomically(
+                    self.path, json.dumps({
+                        'version': self.version,
+                        'entries': list(self.entries.items())}))
+        except (IOError, OSError):
+            # Failing to save a cache only costs time on the next run.
+            pass
+
+# Get the named cache for the repo at repo_dir. If the repo's git dir can't be
+# found, the cache works, but only in memory. The version is the version of the
+# cache's contents.
+def get_cache(name, max_entries, repo_dir='.', version=0):
+    cache_dir = get_cache_dir(repo_dir)
+    path = os.path.abspath(os.path.join(cache_dir, name)) if cache_dir else None
+
+    with cache_lock:
+        cache = loaded_caches.get(path) if path else None
+        if not cache:
+            cache = BoundedCache(path, max_entries, version)
+            if path:
+                loaded_caches[path] = cache
+        return cache
+
+# Save every loaded cache that's changed. Run once at the end of a command.
+def save_all():
+    with cache_lock:
+        for cache in loaded_caches.values():
+            cache.save()
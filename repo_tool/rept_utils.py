@@ -6,11 +6,12 @@ import getopt
 import os
 import subprocess
 import sys
+import threading
 
 Dependency = collections.namedtuple('Dependency',
     'name path remote remote_server revision')
 LocalConfig = collections.namedtuple('LocalConfig',
-    'remote')
+    'remote fetch_ttl')
 
 class DoInExistingDir(object):
     def __init__(self, dir):
@@ -35,6 +36,14 @@ class DoInExistingDir(object):
 def printerr(s=''):
     print(s, file=sys.stderr)
 
+print_lock = threading.Lock()
+
+# print() for messages that may come from worker threads. Keeps each message on
+# its own line.
+def print_from_worker(s=''):
+    with print_lock:
+        print(s)
+
 def print_unknown_arg(param):
     printerr('error: unknown argument \'{0}\''.format(param))
 
@@ -68,25 +77,114 @@ def gen_bad_revision_err_str(dep_name, dep_revision, rev_hash_err):
             'for repo: {0}'.format(dep_name),
             rev_hash_err]
 
-def exec_proc(cmd, redirect=True):
+# Write a file so that readers see either the old or the new contents, never a
+# partially written file.
+def write_file_atomically(path, contents):
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        f.write(contents)
+
+    # start python 2 hack
+    #os.replace(tmp_path, path)
+    if hasattr(os, 'replace'):
+        os.replace(tmp_path, path)
+    else:
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+    # end python 2 hack
+
+# git subcommands that can move HEAD or change refs. Anything that caches git
+# query results needs to know when rept runs one of these.
+GIT_WRITE_CMDS = [
+    'am', 'branch', 'checkout', 'cherry-pick', 'clone', 'commit', 'fetch', 'gc',
+    'merge', 'pack-refs', 'pull', 'push', 'rebase', 'remote', 'reset', 'revert',
+    'stash', 'switch', 'symbolic-ref', 'tag', 'update-ref', 'worktree',
+]
+
+git_write_listeners = []
+
+# Register a function to be called with the repo directory whenever rept runs a
+# git command that may have changed that repo.
+def add_git_write_listener(listener):
+    git_write_listeners.append(listener)
+
+# Returns (subcommand, repo_dir) for a git command line run in cwd (the current
+# directory if None), or (None, None) if the command isn't a git command.
+def get_git_cmd_info(cmd, cwd=None):
+    if not cmd or os.path.basename(cmd[0]) != 'git':
+        return (None, None)
+
+    repo_dir = os.path.join(os.getcwd(), cwd) if cwd else os.getcwd()
+    idx = 1
+    while idx < len(cmd) and cmd[idx].startswith('-'):
+        if cmd[idx] == '-C' and idx + 1 < len(cmd):
+            repo_dir = os.path.join(repo_dir, cmd[idx + 1])
+            idx += 2
+        elif cmd[idx] == '-c':
+            idx += 2
+        else:
+            idx += 1
+
+    subcommand = cmd[idx] if idx < len(cmd) else None
+    return (subcommand, repo_dir)
+
+def notify_git_write(cmd, cwd=None):
+    subcommand, repo_dir = get_git_cmd_info(cmd, cwd)
+    if subcommand in GIT_WRITE_CMDS:
+        for listener in git_write_listeners:
+            listener(repo_dir)
+
+# Run a command in cwd, or in the current directory if cwd isn't given. Passing
+# cwd lets worker threads run commands in different repos without changing the
+# current directory.
+def exec_proc(cmd, redirect=True, cwd=None):
     sys.stdout.flush()
     sys.stderr.flush()
 
-    if redirect:
+    try:
+        if redirect:
+            p = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=cwd)
+            out, err = p.communicate()
+            # START PYTHON 2 HACK
+            out = out.decode('utf-8').strip()
+            err = err.decode('utf-8').strip()
+            # out = str(out,'utf-8').strip()
+            # err = str(err,'utf-8').strip()
+            # END PYTHON 2 HACK
+            return p.returncode, out, err
+        else:
+            return subprocess.call(cmd, cwd=cwd)
+    finally:
+        notify_git_write(cmd, cwd)
+
+# Run a command and hand each line of its output to line_fn as it arrives,
+# instead of collecting all of it first. Meant for queries whose output can be
+# huge. stderr is discarded. If line_fn returns False, the rest of the output is
+# ignored and the command is stopped. Returns the command's return code.
+def exec_proc_lines(cmd, line_fn):
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    devnull = open(os.devnull, 'w')
+    try:
         p = subprocess.Popen(
             cmd,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE)
-        out, err = p.communicate()
-        # START PYTHON 2 HACK
-        out = out.decode('utf-8').strip()
-        err = err.decode('utf-8').strip()
-        # out = str(out,'utf-8').strip()
-        # err = str(err,'utf-8').strip()
-        # END PYTHON 2 HACK
-        return p.returncode, out, err
-    else:
-        return subprocess.call(cmd)
+            stderr=devnull)
+        for line in iter(p.stdout.readline, b''):
+            if line_fn(line.decode('utf-8').rstrip('\r\n')) is False:
+                p.kill()
+                break
+        p.stdout.close()
+        return p.wait()
+    finally:
+        devnull.close()
+        notify_git_write(cmd)
 
 ################################################################################
 # dependency and config funcs
@@ -142,7 +240,13 @@ def parse_local_data(rept_local_str):
         err = '"remote" must be a string'
         return (None, err)
 
-    local_config = LocalConfig(remote)
+    # How many seconds a fetch is considered fresh. 0 means always fetch.
+    fetch_ttl = contents.get('fetch_ttl', 0)
+    if type(fetch_ttl) != int or fetch_ttl < 0:
+        err = '"fetch_ttl" must be a non-negative number of seconds'
+        return (None, err)
+
+    local_config = LocalConfig(remote, fetch_ttl)
 
     return (local_config, err)
 
@@ -157,7 +261,7 @@ def get_local_config_from_file(rept_local_file):
 
         return parse_local_data(contents)
     else:
-        local_config = LocalConfig(None)
+        local_config = LocalConfig(None, 0)
         return (local_config, None)
 
 def parse_dependency_data(rept_deps_str):
@@ -242,7 +346,9 @@ def parse_dependency_data(rept_deps_str):
 
     return (dependencies, err)
 
-def get_dependency_data_from_file(rept_deps_file):
+def get_dependency_data_from_file(
+    rept_deps_file, parse_fn=parse_dependency_data):
+
     contents = None
 
     try:
@@ -250,14 +356,35 @@ def get_dependency_data_from_file(rept_deps_file):
     except:
         return (None, 'could not read the .rept_deps file')
 
-    return parse_dependency_data(contents)
+    return parse_fn(contents)
 
-def get_dependency_data_or_die(rept_deps_file):
-    dependencies, err = get_dependency_data_from_file(rept_deps_file)
+def get_dependency_data_or_die(
+    rept_deps_file, parse_fn=parse_dependency_data):
+
+    dependencies, err = get_dependency_data_from_file(rept_deps_file, parse_fn)
     if err:
         sys.exit('error: could not load .rept_deps file: ' + err)
     return dependencies
 
+# A dependency is identified by its remote server and name. When a list has
+# duplicates, the first one wins.
+def get_dependency_key(dep):
+    return (dep.remote_server, dep.name)
+
+def index_by_dependency_key(dependencies, value_fn=lambda dep: dep):
+    index = {}
+    for dep in dependencies:
+        index.setdefault(get_dependency_key(dep), value_fn(dep))
+    return index
+
+# Index dependencies by the absolute path of their repos. When a list has
+# duplicates, the last one wins, as it always has for up-deps.
+def index_by_repo_path(dependencies, value_fn=lambda dep: dep):
+    index = {}
+    for dep in dependencies:
+        index[os.path.abspath(dep.path)] = value_fn(dep)
+    return index
+
 def get_local_config_or_die(rept_local_file, remotes):
     local_config, err = get_local_config_from_file(rept_local_file)
     if not local_config:
@@ -276,6 +403,6 @@ def get_local_config_or_die(rept_local_file, remotes):
         else:
             sys.exit('error: multiple remotes detected. specify in .rept_local file')
 
-    local_config = LocalConfig(remote)
+    local_config = LocalConfig(remote, local_config.fetch_ttl)
 
     return local_config
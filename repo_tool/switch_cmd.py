@@ -18,11 +18,13 @@ import collections
 import os
 import sys
 
+from repo_tool import dag_scheduler
+from repo_tool import deps_cache
 from repo_tool import git_utils
 from repo_tool import rept_utils
 
 SwitchArgs = collections.namedtuple('SwitchArgs',
-    'feature_name create_branches detach')
+    'feature_name create_branches detach num_workers')
 
 SwitchPoint = collections.namedtuple('SwitchPoint',
     'dep target_rev no_action_msg')
@@ -55,7 +57,7 @@ def get_dependencies_or_die(local_config, switch_args):
         sys.exit('error: could not retrieve .rept_deps file from repo at '
                  'revision {0}'.format(target_rev))
 
-    dependencies, err = rept_utils.parse_dependency_data(dep_file_contents)
+    dependencies, err = deps_cache.parse_dependency_data(dep_file_contents)
     if err:
         sys.exit('error: could not load .rept_deps file: {0}'.format(err))
 
@@ -159,29 +161,36 @@ def do_switch(dependencies, local_config, switch_args):
         rept_utils.print_std_err_list(errs)
         sys.exit(1)
 
-    def do_switch_checkout(rev, dep_path):
-        ret = rept_utils.exec_proc(['git', 'checkout', '-q', rev], False)
-        if ret:
-            repo_part = 'repo: {0}'.format(dep_path) if dep_path else 'this repo'
-            errs.append(
-                'cannot check out rev {0} for {1}'.format(rev, repo_part))
-
-    for sp in switch_points:
+    def checkout_switch_point(sp):
         repo_name = sp.dep.name if sp.dep else 'this repo'
-        if sp.target_rev:
-            print('checking out {0} on {1}...'.format(sp.target_rev, repo_name))
-            if sp.dep:
-                repo_path = os.path.abspath(sp.dep.path)
-                with rept_utils.DoInExistingDir(repo_path) as ctx:
-                    if ctx:
-                        do_switch_checkout(sp.target_rev, sp.dep.path)
-                    else:
-                        errs.append(
-                            'cannot enter repo at {0} for checkout'.format(sp.dep.path))
-            else:
-                do_switch_checkout(sp.target_rev, None)
+        if not sp.target_rev:
+            rept_utils.print_from_worker('skipping checkout in {0}: {1}'.format(
+                repo_name, sp.no_action_msg))
+            return None
+
+        rept_utils.print_from_worker('checking out {0} on {1}...'.format(
+            sp.target_rev, repo_name))
+        if sp.dep:
+            repo_path = os.path.abspath(sp.dep.path)
+            if not os.path.isdir(repo_path):
+                return 'cannot enter repo at {0} for checkout'.format(sp.dep.path)
         else:
-            print('skipping checkout in {0}: {1}'.format(repo_name, sp.no_action_msg))
+            repo_path = os.getcwd()
+
+        ret = rept_utils.exec_proc(
+            ['git', 'checkout', '-q', sp.target_rev], False, repo_path)
+        if ret:
+            repo_part = 'repo: {0}'.format(sp.dep.path) if sp.dep else 'this repo'
+            return 'cannot check out rev {0} for {1}'.format(
+                sp.target_rev, repo_part)
+        return None
+
+    # Every checkout is independent of the others, so they can all run at once.
+    nodes = list(range(len(switch_points)))
+    results = dag_scheduler.run_dag(
+        nodes, {}, lambda idx: checkout_switch_point(switch_points[idx]),
+        switch_args.num_workers)
+    errs.extend([results[idx] for idx in nodes if results[idx]])
 
     return errs
 
@@ -205,12 +214,12 @@ def do_detach(dependencies, switch_args):
     return errs
 
 def print_switch_usage():
-    rept_utils.printerr('usage: rept switch [-b] <feature-name>')
+    rept_utils.printerr('usage: rept switch [-b] [-j <jobs>] <feature-name>')
     rept_utils.printerr('   or: rept switch -d <feature-name>')
 
 def cmd_switch(local_config, args):
     parsed_args = rept_utils.parse_args(
-        args, 'bd', usage_fn=print_switch_usage)
+        args, 'bdj:', usage_fn=print_switch_usage)
 
     if len(parsed_args[1]) != 1:
         print_switch_usage()
@@ -218,9 +227,16 @@ def cmd_switch(local_config, args):
 
     create_branches = False
     detach = False
+    num_workers = 1
     for opt, optarg in parsed_args[0]:
         if opt == '-b': create_branches = True
         elif opt == '-d': detach = True
+        elif opt == '-j':
+            num_workers = dag_scheduler.parse_num_workers(optarg)
+            if not num_workers:
+                rept_utils.printerr("error: '-j' must be a positive number")
+                print_switch_usage()
+                sys.exit(1)
 
     if create_branches and detach:
         rept_utils.printerr("error: '-b' and '-d' cannot be used together")
@@ -229,7 +245,7 @@ def cmd_switch(local_config, args):
 
     feature_name = parsed_args[1][0]
 
-    switch_args = SwitchArgs(feature_name, create_branches, detach)
+    switch_args = SwitchArgs(feature_name, create_branches, detach, num_workers)
 
     dependencies = get_dependencies_or_die(local_config, switch_args)
 
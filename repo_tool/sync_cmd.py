@@ -5,6 +5,24 @@
 # revision of a repo needs to build. All repos on which the main repo depends
 # are pulled fetched or cloned as needed, and the specific revisions of those
 # repos are checked out.
+#
+# -j sets how many repos are cloned, fetched or checked out at a time.
+#
+# Repos that are already where they need to be are left alone. There's no fetch
+# when the pinned revision is already in the repo and a fetch can't move it
+# (anything but a remote-tracking branch), or when the remote has nothing new
+# (see remote_refs). There's no checkout for a repo whose HEAD is already at its
+# pinned revision. --force syncs every repo regardless.
+#
+# --narrow fetches only each dependency's pinned revision, without tags, falling
+# back to a full fetch when that fails (see remote_refs).
+#
+# With a "fetch_ttl" in .rept_local, repos fetched less than that many seconds
+# ago aren't fetched again. --no-cache fetches them anyway.
+#
+# With the REPT_MIRROR_DIR environment variable set, repos are cloned and
+# fetched from local mirrors of their remotes (see mirror_cache), which are
+# always fully fetched, so --narrow has no effect on them.
 ################################################################################
 
 import errno # python 2 hack
@@ -12,97 +30,303 @@ import os
 import sys
 
 from repo_tool import check_deps_cmd
+from repo_tool import dag_scheduler
+from repo_tool import deps_cache
+from repo_tool import git_refs
+from repo_tool import git_utils
+from repo_tool import mirror_cache
+from repo_tool import remote_refs
+from repo_tool import rept_cache
 from repo_tool import rept_utils
 
+# After a successful sync, the root repo's cache dir remembers the hash of the
+# .rept_deps file that was synced and, for each dependency, the revision that
+# was checked out, its commit and a stamp of the dependency's HEAD ref files.
+# While a dependency's HEAD stamp is unchanged, its HEAD is still where the last
+# sync left it.
+SYNC_STATE_CACHE_NAME = 'sync-state'
+SYNC_STATE_CACHE_MAX_ENTRIES = 4096
+
+ROOT_MANIFEST_KEY = '.rept_deps'
+
+def get_sync_state():
+    return rept_cache.get_cache(
+        SYNC_STATE_CACHE_NAME, SYNC_STATE_CACHE_MAX_ENTRIES)
+
+def get_root_manifest_hash():
+    try:
+        with open('.rept_deps') as f:
+            return deps_cache.get_blob_hash(f.read())
+    except (IOError, OSError):
+        return None
+
+# A commit hash pin can't move, so if the last sync left the dependency at that
+# commit and its HEAD hasn't moved since, there's nothing to fetch or check out.
+def is_pin_synced(dep, sync_state):
+    if not git_refs.FULL_HASH_RE.match(dep.revision):
+        return False
+
+    repo_path = os.path.abspath(dep.path)
+    entry = sync_state.get(repo_path)
+    if not entry or entry[0] != dep.revision:
+        return False
+
+    head_stamp = git_refs.get_ref_state_stamp('HEAD', repo_path)
+    return head_stamp != None and head_stamp == entry[2]
+
+# A fetch can only move remote-tracking branches. So if the pinned revision is
+# already in the repo and isn't one (it's a commit hash, a tag or a local
+# branch), fetching won't change what gets checked out.
+def is_pin_available(dep):
+    repo_path = os.path.abspath(dep.path)
+    if not os.path.exists(os.path.join(repo_path, '.git')):
+        return False
+
+    if git_refs.FULL_HASH_RE.match(dep.revision):
+        return git_utils.has_commit(dep.revision, repo_path)
+
+    refname, handled = git_refs.find_rev_refname(dep.revision, repo_path)
+    if not handled or not refname:
+        return False
+    return not refname.startswith('refs/remotes/')
+
+# Would checking out the dependency's revision leave its HEAD where it already
+# is? Checking out a local branch by name attaches HEAD to it, so for such a pin
+# HEAD has to be on that branch already. Anything else (a tag, a hash, a
+# remote-tracking branch) detaches HEAD, so HEAD has to be detached at the
+# revision's commit.
+def is_checked_out(dep):
+    repo_path = os.path.abspath(dep.path)
+    branch, handled = git_refs.get_head_branch(repo_path)
+    if not handled:
+        return False
+
+    refname, handled = git_refs.find_rev_refname(dep.revision, repo_path)
+    if not handled:
+        return False
+    if refname == 'refs/heads/' + dep.revision:
+        return branch == dep.revision
+    if branch:
+        return False
+
+    head_hash = git_utils.get_rev_hash('HEAD', repo_path)
+    return (head_hash != None and
+            head_hash == git_utils.get_rev_hash(dep.revision, repo_path))
+
+def save_sync_state(dependencies, sync_state, manifest_hash):
+    for dep in dependencies:
+        repo_path = os.path.abspath(dep.path)
+        sync_state.put(repo_path, [
+            dep.revision,
+            git_utils.get_rev_hash('HEAD', repo_path),
+            git_refs.get_ref_state_stamp('HEAD', repo_path)])
+    sync_state.put(ROOT_MANIFEST_KEY, manifest_hash)
+
 def print_sync_usage():
-    rept_utils.printerr('usage: rept sync')
+    rept_utils.printerr('usage: rept sync [-j <jobs>] [--force] [--narrow] '
+                        '[--no-cache]')
+
+# Get the narrow refspec for the dependency's pinned revision, if narrowing.
+def get_fetch_refspec(dep, narrow):
+    if not narrow:
+        return None
+    return remote_refs.get_narrow_refspec(
+        dep.remote, dep.revision, os.path.abspath(dep.path))
+
+# Clone the dependency's repo, or fetch it if it's already there. Returns an
+# err, or None.
+def clone_or_fetch_repo(dep, narrow=False):
+    repo_path = os.path.abspath(dep.path)
 
-def cmd_sync(dependencies, args):
+    # If the dir doesn't exist, it needs to. If it does, this is a no-op.
+    # start python 2 hack
+    #os.makedirs(repo_path, exist_ok=True)
+    try:
+        os.makedirs(repo_path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise  # raises the error again
+    # end python 2 hack
+
+    try:
+        repo_files = os.listdir(repo_path)
+    except OSError:
+        return 'cannot sync {0}: cannot enter directory {1}'.format(
+            dep.name, dep.path)
+
+    is_repo = os.path.isdir(os.path.join(repo_path, '.git'))
+    if repo_files and not is_repo:
+        return 'cannot sync {0}: {1} is not empty and is not a git repo'.format(
+            dep.name, dep.path)
+
+    full_remote_repo_name = dep.remote_server + dep.name
+
+    mirror_path = None
+    mirror_dir = mirror_cache.get_mirror_dir()
+    if mirror_dir:
+        mirror_path, err = mirror_cache.update_mirror(
+            mirror_dir, full_remote_repo_name)
+        if err:
+            return 'cannot sync "{0}": {1}'.format(dep.path, err)
+
+    # Empty dir? If so, do a clone.
+    if not repo_files:
+        rept_utils.print_from_worker('cloning repo {0}...'.format(dep.name))
+        if mirror_path:
+            err = mirror_cache.clone_from_mirror(
+                mirror_path, repo_path, dep.remote, full_remote_repo_name)
+            if err:
+                return 'cannot sync "{0}": {1}'.format(dep.path, err)
+        else:
+            ret = rept_utils.exec_proc(
+                ['git', 'clone', '-o', dep.remote, full_remote_repo_name, '.'],
+                False, repo_path)
+            if (ret):
+                return 'cannot sync "{0}": fetch clone'.format(dep.path)
+        remote_refs.record_fetch(repo_path, dep.remote)
+    # Already a .git dir, so do a fetch.
+    else:
+        rept_utils.print_from_worker('fetching repo {0}...'.format(dep.name))
+        if mirror_path:
+            ret = mirror_cache.fetch_from_mirror(
+                mirror_path, repo_path, dep.remote)
+            if not ret:
+                remote_refs.record_fetch(repo_path, dep.remote)
+        else:
+            ret = remote_refs.fetch_remote(
+                repo_path, dep.remote, get_fetch_refspec(dep, narrow))
+        if (ret):
+            return 'cannot sync "{0}": fetch failed'.format(dep.path)
+
+    return None
+
+# Check out the dependency's pinned revision. Returns an err, or None.
+def checkout_repo(dep):
+    rept_utils.print_from_worker('checking out {0} on {1}...'.format(
+        dep.revision, dep.name))
+    repo_path = os.path.abspath(dep.path)
+    if not os.path.isdir(repo_path):
+        return 'cannot enter repo at {0} for checkout'.format(dep.path)
+
+    ret = rept_utils.exec_proc(
+        ['git', 'checkout', '-q', dep.revision], False, repo_path)
+    if ret:
+        return 'cannot check out rev {0} for repo: {1}'.format(
+            dep.revision, dep.path)
+
+    return None
+
+# Run sync_fn on every dependency, num_workers at a time, and return the errs in
+# manifest order.
+def sync_each_repo(dependencies, sync_fn, num_workers):
+    nodes = list(range(len(dependencies)))
+    results = dag_scheduler.run_dag(
+        nodes, {}, lambda idx: sync_fn(dependencies[idx]), num_workers)
+    return [results[idx] for idx in nodes if results[idx]]
+
+def print_sync_errs(errs):
+    rept_utils.printerr('\n{0} errors:'.format(len(errs)))
+    for err in errs:
+        rept_utils.printerr('- ' + err)
+
+def cmd_sync(dependencies, local_config, args):
     parsed_args = rept_utils.parse_args(
-        args, '', usage_fn=print_sync_usage)
+        args, 'j:', ['force', 'narrow', 'no-cache'],
+        usage_fn=print_sync_usage)
 
     if len(parsed_args[1]):
         rept_utils.print_unknown_arg(parsed_args[1][0])
         print_sync_usage()
         sys.exit(1)
 
-    errs = []
+    num_workers = 1
+    force = False
+    narrow = False
+    fetch_ttl = local_config.fetch_ttl
+    for opt, optarg in parsed_args[0]:
+        if opt == '-j':
+            num_workers = dag_scheduler.parse_num_workers(optarg)
+            if not num_workers:
+                rept_utils.printerr("error: '-j' must be a positive number")
+                print_sync_usage()
+                sys.exit(1)
+        elif opt == '--force':
+            force = True
+        elif opt == '--narrow':
+            narrow = True
+        elif opt == '--no-cache':
+            fetch_ttl = 0
 
-    for dep in dependencies:
-        repo_path = os.path.abspath(dep.path)
+    sync_state = get_sync_state()
+    if force:
+        sync_state.clear()
+
+    synced_paths = set([os.path.abspath(dep.path) for dep in dependencies
+                        if is_pin_synced(dep, sync_state)])
+
+    # Why each repo that doesn't need a fetch doesn't, keyed by repo path.
+    fetch_skips = {}
+    if not force:
+        for dep in dependencies:
+            if is_pin_available(dep):
+                fetch_skips[os.path.abspath(dep.path)] = (
+                    '{0} is already here'.format(dep.revision))
+            elif remote_refs.is_recently_fetched(
+                    os.path.abspath(dep.path), dep.remote, fetch_ttl,
+                    get_fetch_refspec(dep, narrow)):
+                fetch_skips[os.path.abspath(dep.path)] = (
+                    'fetched from {0} in the last {1}s'.format(
+                        dep.remote, fetch_ttl))
+
+        to_check = [dep for dep in dependencies
+                    if os.path.abspath(dep.path) not in fetch_skips]
+        up_to_date = remote_refs.find_up_to_date_repos(
+            [(os.path.abspath(dep.path), dep.remote, dep.remote_server,
+              get_fetch_refspec(dep, narrow))
+             for dep in to_check],
+            max(num_workers, remote_refs.DEFAULT_NUM_JOBS))
+        for dep in to_check:
+            if os.path.abspath(dep.path) in up_to_date:
+                fetch_skips[os.path.abspath(dep.path)] = (
+                    'nothing new on {0}'.format(dep.remote))
 
-        # If the dir doesn't exist, it needs to. If it does, this is a no-op.
-        # start python 2 hack
-        #os.makedirs(repo_path, exist_ok=True)
-        try:
-            os.makedirs(repo_path)
-        except OSError as e:
-            if e.errno != errno.EEXIST:
-                raise  # raises the error again
-        # end python 2 hack
-
-        with rept_utils.DoInExistingDir(repo_path) as ctx:
-            if ctx:
-                # Empty dir? If so, do a clone.
-                if not os.listdir('.'): # python 2 requires param
-                    print('cloning repo {0}...'.format(dep.name))
-                    full_remote_repo_name = dep.remote_server + dep.name
-                    ret = rept_utils.exec_proc(
-                        ['git', 'clone', '-o', dep.remote,
-                         full_remote_repo_name, '.'], False)
-                    if (ret):
-                        errs.append(
-                            'cannot sync "{0}": '
-                            'fetch clone'.format(dep.path))
-                # Already a .git dir? If so, do a fetch.
-                elif (os.path.isdir('.git')):
-                    print('fetching repo {0}...'.format(dep.name))
-                    ret = rept_utils.exec_proc(
-                        ['git', 'fetch', dep.remote], False)
-                    if (ret):
-                        errs.append(
-                            'cannot sync "{0}": '
-                            'fetch failed'.format(dep.path))
-                else:
-                    errs.append(
-                        'cannot sync {0}: {1} is not empty '
-                        'and is not a git repo'.format(
-                            dep.name, dep.path))
-                # No .git dir. Do a clone.
-            else:
-                errs.append(
-                    'cannot sync {0}: cannot enter directory {1}'.format(
-                        dep.name, dep.path))
+    def fetch_fn(dep):
+        reason = fetch_skips.get(os.path.abspath(dep.path))
+        if reason:
+            rept_utils.print_from_worker(
+                'skipping fetch in {0}: {1}'.format(dep.name, reason))
+            return None
+        return clone_or_fetch_repo(dep, narrow)
 
+    def checkout_fn(dep):
+        if ((os.path.abspath(dep.path) in synced_paths) or
+            (not force and is_checked_out(dep))):
+            rept_utils.print_from_worker(
+                'skipping checkout in {0}: already at {1}'.format(
+                    dep.name, dep.revision))
+            return None
+        return checkout_repo(dep)
+
+    errs = sync_each_repo(dependencies, fetch_fn, num_workers)
     if errs:
-        rept_utils.printerr('\n{0} errors:'.format(len(errs)))
-        for err in errs:
-            rept_utils.printerr('- ' + err)
+        print_sync_errs(errs)
         sys.exit(1)
 
-    if not check_deps_cmd.do_check_dep_consistency(dependencies):
+    # If the .rept_deps file and every dependency are where the last sync left
+    # them, the dependencies were already found consistent.
+    manifest_hash = get_root_manifest_hash()
+    all_synced = (len(synced_paths) == len(dependencies) and
+                  manifest_hash != None and
+                  manifest_hash == sync_state.get(ROOT_MANIFEST_KEY))
+
+    if not all_synced and not check_deps_cmd.do_check_dep_consistency(dependencies):
         sys.exit(
             'error: inconsistent dependencies. cannot proceed with checkout')
 
-    for dep in dependencies:
-        print('checking out {0} on {1}...'.format(dep.revision, dep.name))
-        repo_path = os.path.abspath(dep.path)
-        with rept_utils.DoInExistingDir(repo_path) as ctx:
-            if ctx:
-                ret = rept_utils.exec_proc(
-                    ['git', 'checkout', '-q', dep.revision], False)
-                if ret:
-                    errs.append(
-                        'cannot check out rev {0} for repo: {1}'.
-                            format(dep.revision, dep.path))
-            else:
-                errs.append(
-                    'cannot enter repo at {0} for checkout'.format(dep.path))
-
+    errs = sync_each_repo(dependencies, checkout_fn, num_workers)
     if errs:
-        rept_utils.printerr('\n{0} errors:'.format(len(errs)))
-        for err in errs:
-            rept_utils.printerr('- ' + err)
+        print_sync_errs(errs)
         sys.exit(1)
     else:
+        save_sync_state(dependencies, sync_state, manifest_hash)
         print('\nSuccess')
@@ -33,6 +33,8 @@ import collections
 import os
 import sys
 
+from repo_tool import dag_scheduler
+from repo_tool import deps_cache
 from repo_tool import git_utils
 from repo_tool import rept_utils
 
@@ -142,68 +144,103 @@ def get_result_for_current_node(
 
     return result
 
-def update_deps_for_repo(
-    dependencies, feature_name, root_commit_type, repo_path, targets, visited):
-
-    results = []
-
-    # The working directory must be clean.
-    if not git_utils.is_clean_working_directory(False):
-        results.append(UpdateResult(
-            repo_path, RepoAction.ERR, None, 'working directory is not clean'))
-        return results
-
-    for dep in dependencies:
-        dep_abs_path = os.path.abspath(dep.path)
-        if (dep_abs_path not in visited):
-            target_dep = targets.get(dep_abs_path)
-
-            dep_results = update_deps_for_dependency_repo(
-                feature_name, dep_abs_path, targets, visited)
-
-            results.extend(dep_results)
-
-    result = get_result_for_current_node(
-        dependencies, feature_name, root_commit_type, repo_path, targets, visited)
-
-    visited[repo_path] = result
-    results.append(result)
-
-    return results
-
-def update_deps_for_dependency_repo(
-    feature_name, repo_path, targets, visited):
-
-    with rept_utils.DoInExistingDir(repo_path) as ctx:
-        if ctx:
-            # This is guaranteed to succeed because we verified it in
-            # check_subdeps().
-            target_dep = targets.get(repo_path)
-
-            # Look for the contents of a .rept_deps file at the specified
-            # revision so see if we need to keep doing consistency checks.
-            rept_deps_contents = git_utils.get_file_contents_for_revision(
-                target_dep.revision, '.rept_deps')
-
-            dependencies = []
-            if rept_deps_contents:
-                dependencies, err = rept_utils.parse_dependency_data(
-                    rept_deps_contents)
+# Walk the dependency graph depth-first, finding every repo that needs to be
+# looked at. Returns (order, prereqs, dependencies_by_repo, err_results): the
+# repos in depth-first post-order (every repo after its dependencies), each
+# repo's dependencies, each repo's parsed .rept_deps, and the results for repos
+# that can't be looked at any further.
+#
+# This runs in the root repo. The root repo's path is ''.
+def find_repos_to_update(dependencies, targets):
+    order = []
+    prereqs = {}
+    dependencies_by_repo = {}
+    err_results = {}
+    in_progress = set()
+
+    def add_err_result(repo_path, msg):
+        err_results[repo_path] = UpdateResult(repo_path, RepoAction.ERR, None, msg)
+        order.append(repo_path)
+
+    def visit_repo(repo_path, dependencies):
+        prereqs[repo_path] = []
+
+        # The working directory must be clean.
+        if not git_utils.is_clean_working_directory(False):
+            add_err_result(repo_path, 'working directory is not clean')
+            return
+
+        in_progress.add(repo_path)
+        dependencies_by_repo[repo_path] = dependencies
+        for dep in dependencies:
+            dep_abs_path = os.path.abspath(dep.path)
+
+            # A repo still in progress is above this one in the chain. Don't
+            # wait on it, or nothing would ever finish.
+            if dep_abs_path not in in_progress:
+                prereqs[repo_path].append(dep_abs_path)
+            if dep_abs_path not in prereqs:
+                visit_dependency_repo(dep_abs_path)
+
+        in_progress.remove(repo_path)
+        order.append(repo_path)
+
+    def visit_dependency_repo(repo_path):
+        prereqs[repo_path] = []
+        with rept_utils.DoInExistingDir(repo_path) as ctx:
+            if ctx:
+                # This is guaranteed to succeed because we verified it in
+                # check_subdeps().
+                target_dep = targets.get(repo_path)
+
+                # Look for the contents of a .rept_deps file at the specified
+                # revision so see if we need to keep doing consistency checks.
+                dependencies, err = deps_cache.get_dependency_data_for_revision(
+                    target_dep.revision)
 
                 # If the dependencies couldn't be parsed, we can't continue down
                 # this chain, so err out.
                 if dependencies == None: # test for None since [] is allowed
-                    result = UpdateResult(repo_path, RepoAction.ERR, None, err)
-                    return [result]
+                    add_err_result(repo_path, err)
+                    return
 
-            # Now we can check all of the sub-dependencies of this dependency.
-            return update_deps_for_repo(
-                dependencies, feature_name, None, repo_path, targets, visited)
+                # Now we can check all of the sub-dependencies of this
+                # dependency.
+                visit_repo(repo_path, dependencies)
 
-        else:
-            result = UpdateResult(
-                repo_path, RepoAction.ERR, None, 'The repo is missing')
-            return [result]
+            else:
+                add_err_result(repo_path, 'The repo is missing')
+
+    visit_repo('', dependencies)
+    return (order, prereqs, dependencies_by_repo, err_results)
+
+# Work out what to do with every repo, each one after all of its dependencies.
+# Returns the results in that order.
+def update_deps_for_repo(
+    dependencies, feature_name, root_commit_type, targets):
+
+    order, prereqs, dependencies_by_repo, err_results = find_repos_to_update(
+        dependencies, targets)
+
+    root_path = os.getcwd()
+    visited = {}
+
+    def update_repo(repo_path):
+        result = err_results.get(repo_path)
+        if not result:
+            # Each repo's result is worked out in that repo, and depends on the
+            # results of its dependencies, so this always runs one repo at a
+            # time.
+            with rept_utils.DoInExistingDir(repo_path or root_path):
+                result = get_result_for_current_node(
+                    dependencies_by_repo[repo_path], feature_name,
+                    root_commit_type if repo_path == '' else None,
+                    repo_path, targets, visited)
+        visited[repo_path] = result
+        return result
+
+    results = dag_scheduler.run_dag(order, prereqs, update_repo)
+    return [results[repo_path] for repo_path in order]
 
 def action_to_display_str(action):
     if action == RepoAction.ERR:
@@ -218,13 +255,10 @@ def action_to_display_str(action):
         assert False
 
 def do_update_deps(dependencies, root_commit_type, feature_name):
-    target_deps = {}
-    for dep in dependencies:
-        repo_path = os.path.abspath(dep.path)
-        target_deps[repo_path] = dep
+    target_deps = rept_utils.index_by_repo_path(dependencies)
 
     results = update_deps_for_repo(
-        dependencies, feature_name, root_commit_type, '', target_deps, {})
+        dependencies, feature_name, root_commit_type, target_deps)
 
     first_time = True
     for result in results:
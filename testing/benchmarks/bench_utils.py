@@ -0,0 +1,50 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+################################################################################
+# Benchmark utils
+#
+# Benchmarks are plain scripts. Run them from this directory, e.g.
+#   python file_contents_bench.py
+################################################################################
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+top_dir = os.path.dirname(os.path.dirname(bench_dir))
+
+sys.path.append(top_dir)
+
+def exec_proc(cmd):
+    p = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    return out.decode('utf-8').strip(), err.decode('utf-8').strip(), p.returncode
+
+def make_temp_dir():
+    return tempfile.mkdtemp(prefix='rept_bench_')
+
+def remove_temp_dir(temp_dir):
+    os.chdir(bench_dir)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+def init_repo(dirname):
+    os.makedirs(dirname)
+    os.chdir(dirname)
+    exec_proc(['git', 'init', '-q'])
+
+def time_it(fn, iterations):
+    start = time.time()
+    for _ in range(iterations):
+        fn()
+    return (time.time() - start) / iterations
+
+def print_result(name, seconds):
+    print('{0:<40} {1:>10.3f} ms'.format(name, seconds * 1000))
+
+def print_speedup(baseline, seconds):
+    print('{0:<40} {1:>10.1f}x'.format('speedup', baseline / seconds))
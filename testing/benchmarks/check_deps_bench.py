@@ -0,0 +1,113 @@
+# Compare the chain-by-chain walk check-deps used to do against the memoized
+# dependency graph, on a synthetic workspace made of layers of repos where every
+# repo depends on every repo in the layer below it. Every pair of layers is a
+# set of diamonds, so the number of chains grows exponentially with depth.
+
+import os
+
+import bench_utils
+
+from repo_tool import check_deps_cmd
+from repo_tool import rept_cache
+from repo_tool import rept_utils
+
+NUM_LAYERS = 5
+LAYER_WIDTH = 3
+ITERATIONS = 3
+
+def get_repo_name(layer, idx):
+    return 'repo_{0}_{1}'.format(layer, idx)
+
+def make_rept_deps(repo_names):
+    deps = ''.join([
+        '        {{ "name": "{0}", "path": "../{0}" }},\n'.format(name)
+        for name in repo_names])
+    return ('{\n'
+            '    "defaults": {\n'
+            '        "remote": "origin",\n'
+            '        "remote_server": "/nowhere/",\n'
+            '        "revision": "master"\n'
+            '    },\n'
+            '    "dependencies": [\n' + deps + '    ]\n'
+            '}\n')
+
+def commit_rept_deps(repo_dir, repo_names):
+    bench_utils.init_repo(repo_dir)
+    bench_utils.exec_proc(['git', 'symbolic-ref', 'HEAD', 'refs/heads/master'])
+    f = open('.rept_deps', 'w')
+    f.write(make_rept_deps(repo_names))
+    f.close()
+    bench_utils.exec_proc(['git', 'add', '.rept_deps'])
+    bench_utils.exec_proc(['git', 'commit', '-q', '-m', 'deps'])
+
+def make_workspace(temp_dir):
+    layers = [[get_repo_name(layer, idx) for idx in range(LAYER_WIDTH)]
+              for layer in range(NUM_LAYERS)]
+
+    for layer, repo_names in enumerate(layers):
+        sub_deps = layers[layer + 1] if layer + 1 < NUM_LAYERS else []
+        for name in repo_names:
+            commit_rept_deps(os.path.join(temp_dir, name), sub_deps)
+
+    all_names = [name for repo_names in layers for name in repo_names]
+    app_dir = os.path.join(temp_dir, 'app')
+    commit_rept_deps(app_dir, all_names)
+    return app_dir
+
+# The walk check_subdeps() used to do: every repo gets re-checked each time a
+# different chain reaches it.
+def check_by_walking_chains(dependencies, targets, list_chains=False):
+    def walk(dep_chain, items):
+        errs = [('chain', dep_chain)] if list_chains else []
+        for item in items:
+            if item.err:
+                errs.append((item.err, dep_chain))
+                continue
+            path = item.target_dep.repo_abs_path
+            if path in dep_chain:
+                errs.append(('Circular reference detected', dep_chain + [path]))
+                continue
+            errs.extend(walk(dep_chain + [path],
+                             check_deps_cmd.check_subdeps_for_repo(
+                                 item.target_dep, targets, {})))
+        return errs
+
+    return walk([os.getcwd()],
+                check_deps_cmd.check_subdeps(dependencies, targets, {}))
+
+def check_with_graph(dependencies, targets):
+    root_path = os.getcwd()
+    graph = check_deps_cmd.build_check_graph(root_path, dependencies, targets)
+    return check_deps_cmd.check_graph(graph, root_path)
+
+def main():
+    temp_dir = bench_utils.make_temp_dir()
+    try:
+        app_dir = make_workspace(temp_dir)
+        os.chdir(app_dir)
+
+        f = open('.rept_deps')
+        dependencies, err = rept_utils.parse_dependency_data(f.read())
+        f.close()
+        targets = check_deps_cmd.get_target_deps(dependencies)
+
+        # Warm up the manifest cache so both sides only measure the walk.
+        check_with_graph(dependencies, targets)
+
+        print('{0} layers of {1} repos, {2} chains'.format(
+            NUM_LAYERS, LAYER_WIDTH,
+            len(check_by_walking_chains(dependencies, targets, True))))
+
+        walk_time = bench_utils.time_it(
+            lambda: check_by_walking_chains(dependencies, targets), ITERATIONS)
+        graph_time = bench_utils.time_it(
+            lambda: check_with_graph(dependencies, targets), ITERATIONS)
+        bench_utils.print_result('walk every chain', walk_time)
+        bench_utils.print_result('memoized graph', graph_time)
+        bench_utils.print_speedup(walk_time, graph_time)
+    finally:
+        rept_cache.loaded_caches.clear()
+        bench_utils.remove_temp_dir(temp_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# Compare reading .rept_deps at a revision via "git show" against the in-process
+# object reader, for both loose and packed objects.
+
+import os
+
+import bench_utils
+
+from repo_tool import git_objects
+from repo_tool import rept_utils
+
+NUM_COMMITS = 200
+NUM_DEPS = 50
+ITERATIONS = 100
+
+def make_repo(repo_dir):
+    bench_utils.init_repo(repo_dir)
+    for i in range(NUM_COMMITS):
+        deps = ['{{"name": "dep{0}", "path": "../dep{0}", "revision": "v{1}"}},'.
+            format(j, i) for j in range(NUM_DEPS)]
+        f = open('.rept_deps', 'w')
+        f.write('{"dependencies": [\n' + '\n'.join(deps) + '\n]}\n')
+        f.close()
+        bench_utils.exec_proc(['git', 'add', '.rept_deps'])
+        bench_utils.exec_proc(['git', 'commit', '-q', '-m', str(i)])
+
+def run_benchmark(label):
+    def via_git_show():
+        rept_utils.exec_proc(['git', 'show', 'HEAD:.rept_deps'])
+
+    def via_reader():
+        git_objects.get_file_contents_for_revision('HEAD', '.rept_deps')
+
+    print(label)
+    git_time = bench_utils.time_it(via_git_show, ITERATIONS)
+    reader_time = bench_utils.time_it(via_reader, ITERATIONS)
+    bench_utils.print_result('git show', git_time)
+    bench_utils.print_result('git_objects reader', reader_time)
+    bench_utils.print_speedup(git_time, reader_time)
+
+def main():
+    temp_dir = bench_utils.make_temp_dir()
+    try:
+        make_repo(os.path.join(temp_dir, 'repo'))
+        run_benchmark('loose objects:')
+        bench_utils.exec_proc(['git', 'gc', '-q', '--aggressive'])
+        run_benchmark('packed objects:')
+    finally:
+        bench_utils.remove_temp_dir(temp_dir)
+
+if __name__ == '__main__':
+    main()
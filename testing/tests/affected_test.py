@@ -0,0 +1,68 @@
+import json
+import unittest
+
+import check_deps_test
+import test_utils
+
+class AffectedTestCase(unittest.TestCase):
+    # Same repos as the check-deps tests.
+    setUp = check_deps_test.CheckDepsTestCase.setUp
+    tearDown = check_deps_test.CheckDepsTestCase.tearDown
+    checkout_branch = check_deps_test.CheckDepsTestCase.checkout_branch
+
+    def exec_rept_affected(self, args):
+        out, err, ret = test_utils.exec_proc(['rept', 'affected'] + args)
+        try:
+            self.assertEqual(ret, 0)
+            return out
+        except:
+            test_utils.print_out_err(out, err)
+            raise
+
+    def test_affected_1_list(self):
+        self.checkout_branch('branch2')
+
+        test_data = [
+            # All added.
+            ('branch1', 'branch2',
+             ['test_repo_dep1', 'test_repo_dep2', 'test_repo_dep3']),
+            # dep2 changed, and dep1 depends on it.
+            ('branch2', 'branch3', ['test_repo_dep1', 'test_repo_dep2']),
+            # dep2 and dep3 removed. Nothing left depends on them.
+            ('branch3', 'branch4', []),
+            ('branch2', 'branch2', []),
+        ]
+        for old_rev, new_rev, expected in test_data:
+            with self.subTest(old_rev=old_rev, new_rev=new_rev):
+                out = self.exec_rept_affected([old_rev, new_rev])
+                lines = test_utils.convert_to_lines(out) if out else []
+                self.assertEqual(lines, expected)
+
+    def test_affected_2_json(self):
+        self.checkout_branch('branch2')
+
+        out = self.exec_rept_affected(['--format', 'json', 'branch2', 'branch4'])
+        self.assertEqual(json.loads(out), {
+            'added': [],
+            'removed': ['test_repo_dep2', 'test_repo_dep3'],
+            'changed': [],
+            'affected': [],
+        })
+
+        out = self.exec_rept_affected(['--format', 'json', 'branch2', 'branch3'])
+        self.assertEqual(json.loads(out), {
+            'added': [],
+            'removed': [],
+            'changed': ['test_repo_dep2'],
+            'affected': ['test_repo_dep1', 'test_repo_dep2'],
+        })
+
+    def test_affected_3_bad_revision(self):
+        self.checkout_branch('branch2')
+
+        out, err, ret = test_utils.exec_proc(['rept', 'affected', 'branch1', 'nope'])
+        self.assertEqual(ret, 1)
+        self.assertEqual(err, "error: bad revision 'nope'")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -273,14 +273,8 @@ class CheckDepsTestCase(unittest.TestCase):
                 test_utils.convert_to_lines(err),
                 [
                 "Circular reference detected",
+                "  members: test_repo_dep1, test_repo_dep2",
                 "  Detected in: test_repo_dep1",
-                "    included by: test_repo_dep2",
-                "    included by: test_repo_dep1",
-                "    included by: test_repo_app",
-                "Circular reference detected",
-                "  Detected in: test_repo_dep2",
-                "    included by: test_repo_dep1",
-                "    included by: test_repo_dep2",
                 "    included by: test_repo_app",
                 ])
         except:
@@ -305,5 +299,34 @@ class CheckDepsTestCase(unittest.TestCase):
             test_utils.print_out_err(out, err)
             raise
 
+    def test_check_deps_7_incremental(self):
+        self.checkout_branch('branch2')
+
+        expected_err = [
+            "Inconsistent dependency for test_repo_dep2:",
+            "  required: origin/branch1",
+            "  found: origin/branch5",
+            "  Detected in: test_repo_dep1",
+            "    included by: test_repo_app",
+        ]
+
+        try:
+            # The second run reuses the dependencies saved by the first.
+            for i in range(2):
+                out, err, ret = test_utils.exec_proc(['rept', 'check-deps'])
+                self.assertEqual(ret, 0)
+                self.assertEqual(err, '')
+
+            # Move dep1's pinned revision to a commit with different deps.
+            shutil.copyfile(os.path.join(dep1_local_refs_dir, 'branch5'),
+                            os.path.join(dep1_remote_refs_dir, 'branch2'))
+
+            out, err, ret = test_utils.exec_proc(['rept', 'check-deps'])
+            self.assertEqual(ret, 1)
+            self.assertEqual(test_utils.convert_to_lines(err), expected_err)
+        except:
+            test_utils.print_out_err(out, err)
+            raise
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,61 @@
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append('../..');
+from repo_tool import dag_scheduler
+
+class DagSchedulerTestCase(unittest.TestCase):
+    # a -> b -> d
+    #  \-> c -/
+    # e (no prereqs)
+    nodes = ['d', 'b', 'c', 'a', 'e']
+    prereqs = {'a': ['b', 'c'], 'b': ['d'], 'c': ['d']}
+
+    def run_dag(self, num_workers, work_time=0):
+        lock = threading.Lock()
+        started = []
+        finished = set()
+
+        def work_fn(node):
+            with lock:
+                for prereq in self.prereqs.get(node, []):
+                    self.assertIn(prereq, finished)
+                started.append(node)
+            time.sleep(work_time)
+            with lock:
+                finished.add(node)
+            return node.upper()
+
+        results = dag_scheduler.run_dag(
+            self.nodes, self.prereqs, work_fn, num_workers)
+        self.assertEqual(results, dict([(node, node.upper()) for node in self.nodes]))
+        return started
+
+    def test_1_single_worker_keeps_order(self):
+        self.assertEqual(self.run_dag(1), self.nodes)
+
+    def test_2_parallel(self):
+        for num_workers in [2, 3, 10]:
+            with self.subTest(num_workers=num_workers):
+                started = self.run_dag(num_workers, work_time=0.01)
+                self.assertEqual(sorted(started), sorted(self.nodes))
+
+    def test_3_cycle(self):
+        with self.assertRaises(dag_scheduler.DagCycleError):
+            dag_scheduler.run_dag(['a', 'b'], {'a': ['b'], 'b': ['a']}, lambda node: None)
+
+    def test_4_error(self):
+        def work_fn(node):
+            if node == 'b':
+                raise ValueError('bad node')
+            return node
+
+        for num_workers in [1, 4]:
+            with self.subTest(num_workers=num_workers):
+                with self.assertRaises(ValueError):
+                    dag_scheduler.run_dag(self.nodes, self.prereqs, work_fn, num_workers)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import json
+import os
+import shutil
+import sys
+import unittest
+
+sys.path.append('../..');
+from repo_tool import deps_cache
+from repo_tool import rept_cache
+from repo_tool import rept_utils
+
+import test_utils
+
+deps_cache_testing_dir = os.path.join(test_utils.top_testing_dir, 'deps_cache_testing')
+
+class DepsCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        os.chdir(test_utils.top_testing_dir)
+        shutil.rmtree(deps_cache_testing_dir, ignore_errors=True)
+        rept_cache.loaded_caches.clear()
+
+        self.repo_dir = os.path.join(deps_cache_testing_dir, 'repo')
+        test_utils.init_repo(self.repo_dir)
+
+        self.good_deps = test_utils.deps_template.format(
+            test_utils.make_dependency('dep1', 'v1') +
+            test_utils.make_dependency('dep2', 'v2'))
+        self.commit(self.good_deps)
+        test_utils.exec_proc(['git', 'branch', 'good'])
+        self.commit('{ "not": "valid" }')
+        test_utils.exec_proc(['git', 'branch', 'bad'])
+        self.commit('')
+        test_utils.exec_proc(['git', 'branch', 'empty'])
+        test_utils.exec_proc(['git', 'rm', '-q', test_utils.rept_deps_filename])
+        test_utils.exec_proc(['git', 'commit', '-q', '-m', 'none'])
+
+    def tearDown(self):
+        os.chdir(test_utils.top_testing_dir)
+        shutil.rmtree(deps_cache_testing_dir)
+
+    def commit(self, contents):
+        f = open(test_utils.rept_deps_filename, 'w')
+        f.write(contents)
+        f.close()
+        test_utils.exec_proc(['git', 'add', test_utils.rept_deps_filename])
+        test_utils.exec_proc(['git', 'commit', '-q', '--allow-empty', '-m', 'deps'])
+
+    def uncached(self, rev):
+        out, err, ret = test_utils.exec_proc(
+            ['git', 'show', '{0}:{1}'.format(rev, test_utils.rept_deps_filename)])
+        if ret or not out:
+            return ([], None)
+        return rept_utils.parse_dependency_data(out)
+
+    def test_1_revisions(self):
+        for rev in ['good', 'bad', 'empty', 'HEAD', 'good~0']:
+            with self.subTest(rev=rev):
+                expected = self.uncached(rev)
+                self.assertEqual(
+                    deps_cache.get_dependency_data_for_revision(rev), expected)
+
+                # Second time around comes from the cache, both in memory and
+                # after being reloaded from disk.
+                self.assertEqual(
+                    deps_cache.get_dependency_data_for_revision(rev), expected)
+                rept_cache.save_all()
+                rept_cache.loaded_caches.clear()
+                self.assertEqual(
+                    deps_cache.get_dependency_data_for_revision(rev), expected)
+
+    def test_2_cache_hit_skips_parse(self):
+        dependencies, err = deps_cache.get_dependency_data_for_revision('good')
+        self.assertEqual(len(dependencies), 2)
+        self.assertEqual(
+            deps_cache.parse_dependency_data(self.good_deps),
+            (dependencies, None))
+
+        parse_fn = rept_utils.parse_dependency_data
+        rept_utils.parse_dependency_data = None
+        try:
+            rept_cache.save_all()
+            rept_cache.loaded_caches.clear()
+            self.assertEqual(
+                deps_cache.get_dependency_data_for_revision('good'),
+                (dependencies, None))
+            self.assertEqual(
+                deps_cache.parse_dependency_data(self.good_deps),
+                (dependencies, None))
+        finally:
+            rept_utils.parse_dependency_data = parse_fn
+
+    def test_3_blob_hash(self):
+        out, err, ret = test_utils.exec_proc(
+            ['git', 'rev-parse', 'good:' + test_utils.rept_deps_filename])
+        self.assertEqual(deps_cache.get_blob_hash(self.good_deps), out)
+
+    def test_4_cache_version(self):
+        expected = self.uncached('good')
+        deps_cache.get_dependency_data_for_revision('good')
+        rept_cache.save_all()
+        cache_path = os.path.join(
+            rept_cache.get_cache_dir(), deps_cache.DEPS_CACHE_NAME)
+
+        # Entries written for some other version, or in the old layout, hold
+        # dependencies that don't fit the current Dependency.
+        f = open(cache_path)
+        entries = json.load(f)['entries']
+        f.close()
+        for entry in entries:
+            entry[1]['deps'] = [dep + ['extra'] for dep in entry[1]['deps']]
+        for contents in [{'version': 'old', 'entries': entries}, entries]:
+            with self.subTest(contents=type(contents).__name__):
+                f = open(cache_path, 'w')
+                json.dump(contents, f)
+                f.close()
+
+                rept_cache.loaded_caches.clear()
+                self.assertEqual(
+                    deps_cache.get_dependency_data_for_revision('good'), expected)
+
+if __name__ == '__main__':
+    unittest.main()
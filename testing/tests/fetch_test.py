@@ -1,7 +1,11 @@
 import os
 import shutil
+import sys
 import unittest
 
+sys.path.append('../..');
+from repo_tool import remote_refs
+
 import test_utils
 
 def make_app_deps():
@@ -131,7 +135,237 @@ class FetchTestCase(unittest.TestCase):
             test_utils.print_out_err(out, err)
             raise
 
-    def test_fetch_2_missing_origin_and_deps(self):
+    def test_fetch_2_nothing_new(self):
+        app1_dir = os.path.abspath('test_repo_app')
+        try:
+            out, err = '', ''
+            os.chdir(app1_dir)
+            out, err, ret = test_utils.exec_proc(['rept', 'fetch'])
+            self.assertEqual(ret, 0)
+
+            # Everything was just fetched, so the remotes have nothing new.
+            out, err, ret = test_utils.exec_proc(['rept', 'fetch'])
+            self.assertEqual(ret, 0)
+            self.assertEqual(
+                test_utils.convert_to_lines(out),
+                [
+                'skipping this repo: nothing new on origin',
+                'skipping test_repo_dep1: nothing new on origin',
+                'skipping test_repo_dep2: nothing new on origin',
+                'skipping test_repo_dep3: nothing new on origin',
+                ])
+
+            # A new tag on a remote is something new.
+            remote_dep2_dir = os.path.join(test_utils.remotes_home_dir, 'test_repo_dep2')
+            test_utils.exec_proc(['git', '-C', remote_dep2_dir, 'tag', 'v1', 'master'])
+            out, err, ret = test_utils.exec_proc(['rept', 'fetch'])
+            self.assertEqual(ret, 0)
+            self.assertEqual(
+                test_utils.convert_to_lines(out),
+                [
+                'skipping this repo: nothing new on origin',
+                'skipping test_repo_dep1: nothing new on origin',
+                'fetching test_repo_dep2...',
+                'skipping test_repo_dep3: nothing new on origin',
+                ])
+
+            out, err, ret = test_utils.exec_proc(['rept', 'fetch', '--force'])
+            self.assertEqual(ret, 0)
+            self.assertEqual(
+                test_utils.convert_to_lines(out),
+                [
+                'fetching origin for this repo...',
+                'fetching test_repo_dep1...',
+                'fetching test_repo_dep2...',
+                'fetching test_repo_dep3...',
+                ])
+        except:
+            test_utils.print_out_err(out, err)
+            raise
+
+    def test_fetch_3_narrow(self):
+        app1_dir = os.path.abspath('test_repo_app')
+        dep2_dir = os.path.abspath('test_repo_dep2')
+        remote_dep2_dir = os.path.join(test_utils.remotes_home_dir, 'test_repo_dep2')
+
+        # Things a narrow fetch of origin/master shouldn't bring.
+        test_utils.exec_proc(['git', '-C', remote_dep2_dir, 'branch', 'other', 'master'])
+        test_utils.exec_proc(['git', '-C', remote_dep2_dir, 'tag', 'v1', 'master'])
+
+        try:
+            out, err = '', ''
+            os.chdir(app1_dir)
+
+            out, err, ret = test_utils.exec_proc(['rept', 'fetch', '--narrow'])
+            self.assertEqual(ret, 0)
+            self.assertEqual(
+                test_utils.convert_to_lines(out),
+                [
+                'fetching origin for this repo...',
+                'fetching test_repo_dep1...',
+                'fetching test_repo_dep2...',
+                'fetching test_repo_dep3...',
+                ])
+
+            out, err, ret = test_utils.exec_proc(
+                ['git', '-C', dep2_dir, 'for-each-ref', '--format=%(refname) %(objectname)'])
+            self.assertEqual(
+                test_utils.convert_to_lines(out),
+                [
+                'refs/heads/master ' + self.commits['test_repo_dep2'][0].strip(),
+                'refs/remotes/origin/master ' + self.commits['test_repo_dep2'][1].strip(),
+                ])
+
+            # Only the pinned branch is checked, so the new branch and tag
+            # aren't something new.
+            out, err, ret = test_utils.exec_proc(['rept', 'fetch', '--narrow'])
+            self.assertEqual(ret, 0)
+            self.assertEqual(
+                test_utils.convert_to_lines(out),
+                [
+                'skipping this repo: nothing new on origin',
+                'skipping test_repo_dep1: nothing new on origin',
+                'skipping test_repo_dep2: nothing new on origin',
+                'skipping test_repo_dep3: nothing new on origin',
+                ])
+
+            # A pin that can't be fetched on its own, like a branch that only
+            # exists on the remote, gets a full fetch.
+            deps = [
+                test_utils.make_dependency('test_repo_dep1', ''),
+                test_utils.make_dependency('test_repo_dep2', 'other'),
+                test_utils.make_dependency('test_repo_dep3', ''),
+            ]
+            f = open('.rept_deps', 'w')
+            f.write(test_utils.deps_template.format(''.join(deps)))
+            f.close()
+            out, err, ret = test_utils.exec_proc(['rept', 'fetch', '--narrow'])
+            self.assertEqual(ret, 0)
+            self.assertEqual(
+                test_utils.convert_to_lines(out),
+                [
+                'skipping this repo: nothing new on origin',
+                'skipping test_repo_dep1: nothing new on origin',
+                'fetching test_repo_dep2...',
+                'skipping test_repo_dep3: nothing new on origin',
+                ])
+            out, err, ret = test_utils.exec_proc(
+                ['git', '-C', dep2_dir, 'rev-parse', 'origin/other', 'v1'])
+            self.assertEqual(ret, 0)
+
+            # Only names the repo has as tags are fetched as tags.
+            self.assertEqual(
+                remote_refs.get_narrow_refspec('origin', 'v1', dep2_dir),
+                'refs/tags/v1:refs/tags/v1')
+            for revision in ['master', 'other']:
+                self.assertIsNone(
+                    remote_refs.get_narrow_refspec('origin', revision, dep2_dir))
+
+            # A pinned commit that's already here needs no fetch.
+            deps = [
+                test_utils.make_dependency('test_repo_dep1', ''),
+                test_utils.make_dependency(
+                    'test_repo_dep2', self.commits['test_repo_dep2'][1].strip()),
+                test_utils.make_dependency('test_repo_dep3', ''),
+            ]
+            f = open('.rept_deps', 'w')
+            f.write(test_utils.deps_template.format(''.join(deps)))
+            f.close()
+            test_utils.exec_proc(['git', '-C', remote_dep2_dir, 'tag', 'v2', 'master'])
+            out, err, ret = test_utils.exec_proc(['rept', 'fetch', '--narrow'])
+            self.assertEqual(ret, 0)
+            self.assertEqual(
+                test_utils.convert_to_lines(out)[2],
+                'skipping test_repo_dep2: nothing new on origin')
+        except:
+            test_utils.print_out_err(out, err)
+            raise
+
+    def test_fetch_4_fetch_ttl(self):
+        app1_dir = os.path.abspath('test_repo_app')
+        remote_dep2_dir = os.path.join(test_utils.remotes_home_dir, 'test_repo_dep2')
+
+        def write_rept_local(contents):
+            f = open('.rept_local', 'w')
+            f.write(contents)
+            f.close()
+
+        try:
+            out, err = '', ''
+            os.chdir(app1_dir)
+            write_rept_local("{ 'fetch_ttl': 3600 }")
+
+            out, err, ret = test_utils.exec_proc(['rept', 'fetch'])
+            self.assertEqual(ret, 0)
+
+            # Everything was just fetched, so nothing is even checked, and the
+            # new tag isn't noticed.
+            test_utils.exec_proc(['git', '-C', remote_dep2_dir, 'tag', 'v1', 'master'])
+            out, err, ret = test_utils.exec_proc(['rept', 'fetch'])
+            self.assertEqual(ret, 0)
+            self.assertEqual(
+                test_utils.convert_to_lines(out),
+                [
+                'skipping this repo: fetched from origin in the last 3600s',
+                'skipping test_repo_dep1: fetched from origin in the last 3600s',
+                'skipping test_repo_dep2: fetched from origin in the last 3600s',
+                'skipping test_repo_dep3: fetched from origin in the last 3600s',
+                ])
+
+            out, err, ret = test_utils.exec_proc(['rept', 'fetch', '--no-cache'])
+            self.assertEqual(ret, 0)
+            self.assertEqual(
+                test_utils.convert_to_lines(out),
+                [
+                'skipping this repo: nothing new on origin',
+                'skipping test_repo_dep1: nothing new on origin',
+                'fetching test_repo_dep2...',
+                'skipping test_repo_dep3: nothing new on origin',
+                ])
+
+            write_rept_local("{ 'fetch_ttl': '1h' }")
+            out, err, ret = test_utils.exec_proc(['rept', 'fetch'])
+            self.assertEqual(ret, 1)
+            self.assertEqual(
+                err,
+                'error: could not load .rept_local file: '
+                '"fetch_ttl" must be a non-negative number of seconds')
+        except:
+            test_utils.print_out_err(out, err)
+            raise
+
+    def test_fetch_5_prune(self):
+        app1_dir = os.path.abspath('test_repo_app')
+        dep2_dir = os.path.abspath('test_repo_dep2')
+        remote_dep2_dir = os.path.join(test_utils.remotes_home_dir, 'test_repo_dep2')
+
+        try:
+            out, err = '', ''
+            os.chdir(app1_dir)
+            test_utils.exec_proc(['git', '-C', remote_dep2_dir, 'branch', 'gone', 'master'])
+            out, err, ret = test_utils.exec_proc(['rept', 'fetch'])
+            self.assertEqual(ret, 0)
+            test_utils.exec_proc(['git', '-C', remote_dep2_dir, 'branch', '-D', 'gone'])
+
+            # Pruning fetches every repo once, without checking first.
+            out, err, ret = test_utils.exec_proc(['rept', 'fetch', '--prune'])
+            self.assertEqual(ret, 0)
+            self.assertEqual(
+                test_utils.convert_to_lines(out),
+                [
+                'fetching origin for this repo...',
+                'fetching test_repo_dep1...',
+                'fetching test_repo_dep2...',
+                'fetching test_repo_dep3...',
+                ])
+            out, err, ret = test_utils.exec_proc(
+                ['git', '-C', dep2_dir, 'rev-parse', '--verify', '-q', 'origin/gone'])
+            self.assertEqual(ret, 1)
+        except:
+            test_utils.print_out_err(out, err)
+            raise
+
+    def test_fetch_6_missing_origin_and_deps(self):
         app1_dir = os.path.abspath('test_repo_app')
         dep1_dir = os.path.abspath('test_repo_dep1')
         dep2_dir = os.path.abspath('test_repo_dep2')
@@ -0,0 +1,86 @@
+import os
+import shutil
+import sys
+import unittest
+
+sys.path.append('../..');
+from repo_tool import git_objects
+
+import test_utils
+
+objects_testing_dir = os.path.join(test_utils.top_testing_dir, 'objects_testing')
+
+class GitObjectsTestCase(unittest.TestCase):
+    def setUp(self):
+        os.chdir(test_utils.top_testing_dir)
+        shutil.rmtree(objects_testing_dir, ignore_errors=True)
+
+        self.repo_dir = os.path.join(objects_testing_dir, 'repo')
+        test_utils.init_repo(self.repo_dir)
+        os.makedirs(os.path.join('sub', 'dir'))
+
+        # Lots of small edits to the same files give gc something to delta.
+        self.commits = []
+        for i in range(40):
+            deps = test_utils.deps_template.format(''.join(
+                [test_utils.make_dependency('dep{0}'.format(j), 'v{0}'.format(i))
+                 for j in range(20)]))
+            for filename in [test_utils.rept_deps_filename,
+                             os.path.join('sub', 'dir', 'nested')]:
+                f = open(filename, 'w')
+                f.write(deps)
+                f.close()
+            test_utils.exec_proc(['git', 'add', '-A'])
+            test_utils.exec_proc(['git', 'commit', '-q', '-m', 'v{0}'.format(i)])
+            out, err, ret = test_utils.exec_proc(['git', 'rev-parse', 'HEAD'])
+            self.commits.append(out)
+
+        test_utils.exec_proc(['git', 'tag', '-a', '-m', 'tag', 'annotated', self.commits[5]])
+
+    def tearDown(self):
+        os.chdir(test_utils.top_testing_dir)
+        shutil.rmtree(objects_testing_dir)
+
+    def git_show(self, rev, path):
+        out, err, ret = test_utils.exec_proc(
+            ['git', 'show', '{0}:{1}'.format(rev, path)])
+        return out if not ret else None
+
+    def check_contents(self, revs, path):
+        for rev in revs:
+            with self.subTest(rev=rev, path=path):
+                contents, handled = git_objects.get_file_contents_for_revision(
+                    rev, path)
+                self.assertTrue(handled)
+                if contents != None:
+                    contents = contents.decode('utf-8').strip()
+                self.assertEqual(contents, self.git_show(rev, path))
+
+    def check_all(self):
+        revs = self.commits + ['HEAD', 'master', 'annotated']
+        self.check_contents(revs, test_utils.rept_deps_filename)
+        self.check_contents(revs, 'sub/dir/nested')
+        self.check_contents(['HEAD'], 'no_such_file')
+        self.check_contents(['HEAD'], 'sub/no_such_file')
+
+    def test_1_loose_objects(self):
+        self.check_all()
+
+    def test_2_packed_objects(self):
+        test_utils.exec_proc(['git', 'gc', '-q', '--aggressive'])
+        self.assertFalse(os.path.exists(os.path.join(
+            '.git', 'objects', self.commits[0][:2], self.commits[0][2:])))
+        self.check_all()
+
+    def test_3_ref_delta_objects(self):
+        test_utils.exec_proc(
+            ['git', 'repack', '-q', '-a', '-d', '-f', '--no-delta-base-offset'])
+        self.check_all()
+
+    def test_4_unhandled(self):
+        contents, handled = git_objects.get_file_contents_for_revision(
+            'HEAD~1', test_utils.rept_deps_filename)
+        self.assertFalse(handled)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import shutil
+import sys
+import unittest
+
+sys.path.append('../..');
+from repo_tool import git_refs
+
+import test_utils
+
+refs_testing_dir = os.path.join(test_utils.top_testing_dir, 'refs_testing')
+
+class GitRefsTestCase(unittest.TestCase):
+    def setUp(self):
+        os.chdir(test_utils.top_testing_dir)
+        shutil.rmtree(refs_testing_dir, ignore_errors=True)
+
+        self.repo_dir = os.path.join(refs_testing_dir, 'repo')
+        test_utils.init_repo(self.repo_dir)
+
+        for i in range(3):
+            f = open('file', 'w')
+            f.write('v{0}'.format(i))
+            f.close()
+            test_utils.exec_proc(['git', 'add', 'file'])
+            test_utils.exec_proc(['git', 'commit', '-q', '-m', 'v{0}'.format(i)])
+            test_utils.exec_proc(['git', 'branch', 'branch{0}'.format(i)])
+            test_utils.exec_proc(['git', 'tag', '-a', '-m', 't', 'tag{0}'.format(i)])
+
+        for name in ['master', 'branch1', 'feature/x']:
+            test_utils.exec_proc(
+                ['git', 'update-ref', 'refs/remotes/origin/' + name, 'branch1'])
+        test_utils.exec_proc(
+            ['git', 'symbolic-ref', 'refs/remotes/origin/HEAD',
+             'refs/remotes/origin/master'])
+
+    def tearDown(self):
+        os.chdir(test_utils.top_testing_dir)
+        shutil.rmtree(refs_testing_dir)
+
+    def git_rev_parse(self, rev):
+        out, err, ret = test_utils.exec_proc(['git', 'rev-parse', '--verify', '-q', rev])
+        return out if not ret else None
+
+    def check_revs(self, revs):
+        for rev in revs:
+            with self.subTest(rev=rev):
+                rev_hash, handled = git_refs.resolve_rev(rev)
+                self.assertTrue(handled)
+                self.assertEqual(rev_hash, self.git_rev_parse(rev))
+
+    revs = [
+        'HEAD', 'master', 'branch0', 'branch2', 'tag1', 'origin/master',
+        'origin/feature/x', 'origin', 'remotes/origin/branch1',
+        'refs/heads/branch1', 'no_such_branch', 'origin/no_such_branch',
+    ]
+
+    def test_1_loose_refs(self):
+        self.check_revs(self.revs)
+
+    def test_2_packed_refs(self):
+        test_utils.exec_proc(['git', 'pack-refs', '--all'])
+        self.check_revs(self.revs)
+
+        # A loose ref takes precedence over the packed one.
+        test_utils.exec_proc(['git', 'update-ref', 'refs/heads/branch0', 'branch2'])
+        self.check_revs(['branch0'])
+
+        # A large packed-refs file exercises the binary search.
+        for i in range(500):
+            test_utils.exec_proc(
+                ['git', 'update-ref', 'refs/remotes/origin/b{0:03d}'.format(i),
+                 'branch{0}'.format(i % 3)])
+        test_utils.exec_proc(['git', 'pack-refs', '--all'])
+        self.check_revs(['origin/b000', 'origin/b250', 'origin/b499',
+                         'origin/b500', 'origin/a', 'origin/z'] + self.revs)
+
+    def test_3_unhandled_revs(self):
+        for rev in ['HEAD~1', 'master^', 'tag1^{commit}', 'master:file',
+                    self.git_rev_parse('HEAD')[:7], '@', 'FETCH_HEAD']:
+            with self.subTest(rev=rev):
+                rev_hash, handled = git_refs.resolve_rev(rev)
+                self.assertFalse(handled)
+
+    def test_4_head_branch(self):
+        self.assertEqual(git_refs.get_head_branch(), ('master', True))
+
+        test_utils.exec_proc(['git', 'checkout', '-q', '--detach', 'HEAD'])
+        self.assertEqual(git_refs.get_head_branch(), (None, True))
+
+    def test_5_worktree(self):
+        worktree_dir = os.path.join(refs_testing_dir, 'worktree')
+        test_utils.exec_proc(['git', 'worktree', 'add', '-q', worktree_dir, 'branch0'])
+        os.chdir(worktree_dir)
+
+        self.assertEqual(git_refs.get_head_branch(), ('branch0', True))
+        self.check_revs(self.revs)
+
+    def test_6_rev_refname(self):
+        test_data = [
+            ('HEAD', 'HEAD'),
+            ('master', 'refs/heads/master'),
+            ('tag1', 'refs/tags/tag1'),
+            ('origin/master', 'refs/remotes/origin/master'),
+            ('origin', 'refs/remotes/origin/HEAD'),
+            ('refs/heads/branch1', 'refs/heads/branch1'),
+            (self.git_rev_parse('HEAD'), None),
+            ('no_such_branch', None),
+        ]
+        for rev, refname in test_data:
+            with self.subTest(rev=rev):
+                self.assertEqual(git_refs.find_rev_refname(rev), (refname, True))
+
+        for rev in ['HEAD~1', self.git_rev_parse('HEAD')[:7], 'FETCH_HEAD']:
+            with self.subTest(rev=rev):
+                self.assertEqual(git_refs.find_rev_refname(rev), (None, False))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,246 @@
+import os
+import shutil
+import sys
+import unittest
+
+sys.path.append('../..');
+from repo_tool import git_refs
+from repo_tool import git_utils
+from repo_tool import rept_cache
+from repo_tool import rept_utils
+
+import test_utils
+
+utils_testing_dir = os.path.join(test_utils.top_testing_dir, 'utils_testing')
+
+class GitUtilsTestCase(unittest.TestCase):
+    def setUp(self):
+        os.chdir(test_utils.top_testing_dir)
+        shutil.rmtree(utils_testing_dir, ignore_errors=True)
+        rept_cache.loaded_caches.clear()
+
+        self.repo_dir = os.path.join(utils_testing_dir, 'repo')
+        test_utils.init_repo(self.repo_dir)
+
+        # master: c0 - c1 - c2
+        #                \
+        # side:           s1
+        for i in range(3):
+            self.commit('file', 'v{0}'.format(i))
+            if i == 1:
+                test_utils.exec_proc(['git', 'branch', 'side'])
+                test_utils.exec_proc(['git', 'branch', 'merged1'])
+        test_utils.exec_proc(['git', 'branch', 'merged2'])
+        test_utils.exec_proc(['git', 'branch', 'nested/branch', 'side'])
+
+        test_utils.exec_proc(['git', 'checkout', '-q', 'side'])
+        self.commit('side_file', 's1')
+        test_utils.exec_proc(['git', 'checkout', '-q', 'master'])
+
+    def tearDown(self):
+        git_utils.set_memo_enabled(False)
+        os.chdir(test_utils.top_testing_dir)
+        shutil.rmtree(utils_testing_dir)
+
+    def commit(self, filename, contents):
+        f = open(filename, 'w')
+        f.write(contents)
+        f.close()
+        test_utils.exec_proc(['git', 'add', filename])
+        test_utils.exec_proc(['git', 'commit', '-q', '-m', contents])
+
+    def test_1_is_branch_merged(self):
+        self.assertTrue(git_utils.is_branch_merged('merged1'))
+        self.assertTrue(git_utils.is_branch_merged('merged2'))
+        self.assertFalse(git_utils.is_branch_merged('side'))
+        self.assertFalse(git_utils.is_branch_merged('no_such_branch'))
+        self.assertTrue(git_utils.is_branch_merged('merged1', 'side'))
+        self.assertFalse(git_utils.is_branch_merged('merged2', 'side'))
+
+    def test_2_are_branches_merged(self):
+        pairs = [
+            ('merged1', 'HEAD'),
+            ('side', 'HEAD'),
+            ('merged2', 'HEAD'),
+            ('merged2', 'side'),
+            ('merged1', 'side'),
+            ('nested', 'HEAD'),
+            ('nested/branch', 'HEAD'),
+            ('no_such_branch', 'HEAD'),
+        ]
+        self.assertEqual(
+            git_utils.are_branches_merged(pairs),
+            [True, False, True, False, True, False, True, False])
+
+    def test_3_ancestry_cache(self):
+        self.assertTrue(git_utils.is_branch_merged('merged1'))
+        self.assertFalse(git_utils.is_branch_merged('side'))
+
+        # A fresh load of the cache from disk has both answers.
+        rept_cache.save_all()
+        rept_cache.loaded_caches.clear()
+        cache = git_utils.get_ancestry_cache()
+        merged1_hash = git_utils.get_rev_hash('merged1')
+        side_hash = git_utils.get_rev_hash('side')
+        head_hash = git_utils.get_rev_hash('HEAD')
+        merged1_key = git_utils.get_ancestry_cache_key(merged1_hash, head_hash)
+        side_key = git_utils.get_ancestry_cache_key(side_hash, head_hash)
+        self.assertEqual(cache.get(merged1_key), True)
+        self.assertEqual(cache.get(side_key), False)
+
+        # Cached answers are used without asking git again.
+        cache.put(side_key, True)
+        self.assertTrue(git_utils.is_branch_merged('side'))
+        self.assertEqual(
+            git_utils.are_branches_merged([('side', 'HEAD')]), [True])
+
+    def test_4_bounded_cache_eviction(self):
+        cache = rept_cache.get_cache('test_cache', 3)
+        for key in ['a', 'b', 'c']:
+            cache.put(key, key.upper())
+        cache.get('a')
+        cache.put('d', 'D')
+        cache.save()
+
+        rept_cache.loaded_caches.clear()
+        cache = rept_cache.get_cache('test_cache', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(
+            [cache.get(key) for key in ['a', 'c', 'd']], ['A', 'C', 'D'])
+
+    def test_5_clean_working_directory(self):
+        self.assertTrue(git_utils.is_clean_working_directory(False))
+
+        # Stale stat data alone doesn't make it dirty.
+        os.utime('file', (0, 0))
+        self.assertTrue(git_utils.is_clean_working_directory(False))
+
+        # Untracked files only matter when asked for.
+        f = open('untracked', 'w')
+        f.write('untracked')
+        f.close()
+        self.assertTrue(git_utils.is_clean_working_directory(False))
+        self.assertFalse(git_utils.is_clean_working_directory(True))
+        os.remove('untracked')
+
+        # Same size, different contents.
+        f = open('file', 'w')
+        f.write('v9')
+        f.close()
+        self.assertFalse(git_utils.is_clean_working_directory(False))
+
+        # Staged, so the index matches the file but not HEAD.
+        test_utils.exec_proc(['git', 'add', 'file'])
+        self.assertFalse(git_utils.is_clean_working_directory(False))
+
+    def test_6_memo_invalidation(self):
+        git_utils.set_memo_enabled(True)
+
+        master_hash = git_utils.get_rev_hash('master')
+        self.assertTrue(git_utils.is_current_branch('master'))
+
+        # Changes made behind rept's back aren't seen during the same run...
+        test_utils.exec_proc(['git', 'checkout', '-q', 'side'])
+        test_utils.exec_proc(['git', 'branch', '-f', 'master', 'side'])
+        self.assertTrue(git_utils.is_current_branch('master'))
+        self.assertEqual(git_utils.get_rev_hash('master'), master_hash)
+
+        # ...but anything rept changes itself invalidates the memo.
+        rept_utils.exec_proc(['git', 'checkout', '-q', 'merged1'])
+        self.assertFalse(git_utils.is_current_branch('master'))
+        self.assertTrue(git_utils.is_current_branch('merged1'))
+        self.assertEqual(
+            git_utils.get_rev_hash('master'), git_utils.get_rev_hash('side'))
+
+    def test_7_revision_cache(self):
+        def git_rev_parse(rev):
+            out, err, ret = test_utils.exec_proc(['git', 'rev-parse', rev])
+            return out
+
+        self.assertEqual(git_utils.get_rev_hash('HEAD~1'), git_rev_parse('HEAD~1'))
+        self.assertIsNone(git_utils.get_rev_hash('HEAD~10'))
+
+        # Cached answers are used while the refs stay the same, and only for
+        # the same kind of query.
+        cache = git_utils.get_revision_cache()
+        key = git_utils.get_revision_cache_key('HEAD~1', False)
+        stamp, rev_hash = cache.get(key)
+        cache.put(key, [stamp, 'cached'])
+        self.assertEqual(git_utils.get_rev_hash('HEAD~1'), 'cached')
+        self.assertEqual(
+            cache.get(git_utils.get_revision_cache_key('HEAD~1', True)), None)
+        self.assertTrue(git_utils.get_branch_exists('HEAD~1'))
+
+        # A range resolves, but isn't a branch, and isn't cached since the refs
+        # it names can't be picked out of it.
+        self.assertNotEqual(git_utils.get_rev_hash('side..master'), None)
+        self.assertFalse(git_utils.get_branch_exists('side..master'))
+        self.assertEqual(git_refs.get_ref_state_stamp('side..master'), None)
+        self.assertEqual(
+            cache.get(git_utils.get_revision_cache_key('side..master', False)), None)
+
+        # Moving the branch HEAD points to invalidates the entry.
+        test_utils.exec_proc(['git', 'reset', '-q', '--hard', 'side'])
+        self.assertEqual(git_utils.get_rev_hash('HEAD~1'), git_rev_parse('HEAD~1'))
+
+        # So does packing the refs.
+        cache.put(key, [git_refs.get_ref_state_stamp('HEAD~1'), 'cached'])
+        test_utils.exec_proc(['git', 'pack-refs', '--all'])
+        self.assertEqual(git_utils.get_rev_hash('HEAD~1'), git_rev_parse('HEAD~1'))
+
+    def test_8_any_remote_branch_exists(self):
+        for refname in ['origin/feat', 'origin/x/feat', 'up/feat',
+                        'origin/notfeat', 'origin/feat2']:
+            test_utils.exec_proc(
+                ['git', 'update-ref', 'refs/remotes/' + refname, 'HEAD'])
+
+        self.assertEqual(
+            git_utils.get_any_remote_branch_exists('feat'),
+            ['remotes/origin/feat', 'remotes/origin/x/feat', 'remotes/up/feat'])
+        self.assertEqual(git_utils.get_any_remote_branch_exists('nope'), [])
+
+    def test_9_memo_invalidation_in_other_repo(self):
+        git_utils.set_memo_enabled(True)
+
+        # Ask about the repo from outside it, the way the root repo asks about
+        # its dependencies.
+        os.chdir(utils_testing_dir)
+        master_hash = git_utils.get_rev_hash('HEAD', self.repo_dir)
+        self.assertEqual(
+            git_utils.get_file_contents_for_revision('HEAD', 'file', self.repo_dir),
+            'v2')
+
+        rept_utils.exec_proc(['git', '-C', self.repo_dir, 'checkout', '-q', 'side'])
+        out, err, ret = test_utils.exec_proc(
+            ['git', '-C', self.repo_dir, 'rev-parse', 'HEAD'])
+        self.assertNotEqual(out, master_hash)
+        self.assertEqual(git_utils.get_rev_hash('HEAD', self.repo_dir), out)
+        self.assertEqual(
+            git_utils.get_file_contents_for_revision('HEAD', 'file', self.repo_dir),
+            'v1')
+
+        # The same goes for commands run with cwd.
+        rept_utils.exec_proc(['git', 'checkout', '-q', 'master'], True, self.repo_dir)
+        self.assertEqual(git_utils.get_rev_hash('HEAD', self.repo_dir), master_hash)
+
+    def test_10_bounded_cache_saved_once(self):
+        cache = rept_cache.get_cache('test_cache', 3)
+        cache.put('a', 'A')
+        self.assertFalse(os.path.exists(cache.path))
+
+        # Only changed caches are written out.
+        rept_cache.save_all()
+        self.assertTrue(os.path.exists(cache.path))
+        os.remove(cache.path)
+        cache.get('a')
+        rept_cache.save_all()
+        self.assertFalse(os.path.exists(cache.path))
+
+        cache.put('b', 'B')
+        rept_cache.save_all()
+        rept_cache.loaded_caches.clear()
+        cache = rept_cache.get_cache('test_cache', 3)
+        self.assertEqual([cache.get(key) for key in ['a', 'b']], ['A', 'B'])
+
+if __name__ == '__main__':
+    unittest.main()
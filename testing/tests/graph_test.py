@@ -0,0 +1,136 @@
+import collections
+import json
+import os
+import sys
+import unittest
+
+sys.path.append('../..');
+from repo_tool import graph_cmd
+
+import check_deps_test
+import test_utils
+
+class GraphTestCase(unittest.TestCase):
+    # Same repos as the check-deps tests.
+    setUp = check_deps_test.CheckDepsTestCase.setUp
+    tearDown = check_deps_test.CheckDepsTestCase.tearDown
+    checkout_branch = check_deps_test.CheckDepsTestCase.checkout_branch
+
+    def get_rev_hash(self, repo_name, rev):
+        out, err, ret = test_utils.exec_proc(
+            ['git', '-C', os.path.join('..', repo_name), 'rev-parse', rev])
+        return out
+
+    def get_graph(self, extra_args=[]):
+        out, err, ret = test_utils.exec_proc(
+            ['rept', 'graph', '--format', 'json'] + extra_args)
+        try:
+            self.assertEqual(ret, 0)
+            return json.loads(out)
+        except:
+            test_utils.print_out_err(out, err)
+            raise
+
+    def test_graph_1_json(self):
+        self.checkout_branch('branch2')
+
+        for jobs in ['1', '4']:
+            with self.subTest(jobs=jobs):
+                graph = self.get_graph(['-j', jobs])
+
+                self.assertEqual(graph['root'], 'test_repo_app')
+                self.assertEqual(
+                    [(node['name'], node['rev_hash']) for node in graph['nodes']],
+                    [('test_repo_app', self.get_rev_hash('test_repo_app', 'HEAD')),
+                     ('test_repo_dep1', self.get_rev_hash('test_repo_dep1', 'origin/branch2')),
+                     ('test_repo_dep2', self.get_rev_hash('test_repo_dep2', 'origin/branch1')),
+                     ('test_repo_dep3', self.get_rev_hash('test_repo_dep3', 'origin/master'))])
+                self.assertEqual(
+                    [(edge['src'], edge['dst'], edge['revision'])
+                     for edge in graph['edges']],
+                    [('test_repo_app', 'test_repo_dep1', 'origin/branch2'),
+                     ('test_repo_app', 'test_repo_dep2', 'origin/branch1'),
+                     ('test_repo_app', 'test_repo_dep3', 'origin/master'),
+                     ('test_repo_dep1', 'test_repo_dep2', 'origin/branch1')])
+                self.assertEqual(graph['errors'], [])
+
+    def test_graph_2_inconsistent(self):
+        self.checkout_branch('branch3')
+
+        graph = self.get_graph()
+        self.assertEqual(graph['errors'], [{
+            'repo': 'test_repo_dep1',
+            'error': 'Inconsistent dependency for test_repo_dep2: '
+                     'required: origin/branch2, found: origin/branch1',
+        }])
+        self.assertEqual(
+            [edge['dst'] for edge in graph['edges'] if edge['err']],
+            ['test_repo_dep2'])
+
+    def test_graph_3_cycle(self):
+        self.checkout_branch('branch5')
+
+        graph = self.get_graph()
+        self.assertEqual(graph['errors'], [{
+            'repo': 'test_repo_dep1',
+            'error': 'Circular reference detected, members: '
+                     'test_repo_dep1, test_repo_dep2',
+        }])
+
+    def test_graph_4_dot(self):
+        self.checkout_branch('branch2')
+
+        out, err, ret = test_utils.exec_proc(['rept', 'graph'])
+        lines = test_utils.convert_to_lines(out)
+        self.assertEqual(lines[0], 'digraph rept {')
+        self.assertEqual(lines[-1], '}')
+        self.assertIn(
+            '    "test_repo_dep1" -> "test_repo_dep2" [label="origin/branch1"];',
+            lines)
+
+    def test_graph_5_why(self):
+        self.checkout_branch('branch2')
+
+        out, err, ret = test_utils.exec_proc(['rept', 'graph', 'why', 'test_repo_dep2'])
+        self.assertEqual(ret, 0)
+        self.assertEqual(
+            test_utils.convert_to_lines(out),
+            ['test_repo_app -> test_repo_dep1 -> test_repo_dep2',
+             'test_repo_app -> test_repo_dep2'])
+
+        out, err, ret = test_utils.exec_proc(['rept', 'graph', 'why', 'nope'])
+        self.assertEqual(ret, 1)
+
+    def test_graph_6_keys_and_paths(self):
+        def make_node(server, name):
+            return ((server, name),
+                    graph_cmd.GraphNode(name, server, name, 'HEAD', None, None))
+
+        def make_edge(src, dst):
+            return graph_cmd.GraphEdge(src, dst, 'HEAD', None)
+
+        # Two repos named lib, on different servers, under a chain of 25
+        # diamonds that doesn't lead to either of them.
+        root = (None, 'app')
+        nodes = [make_node(None, 'app'), make_node('a', 'lib'), make_node('b', 'lib')]
+        edges = [make_edge(root, ('a', 'lib')), make_edge(('a', 'lib'), ('b', 'lib'))]
+        prev = root
+        for idx in range(25):
+            left, right, bottom = [('a', '{0}{1}'.format(part, idx)) for part in 'lrb']
+            nodes.extend([make_node(*left), make_node(*right), make_node(*bottom)])
+            edges.extend([make_edge(prev, left), make_edge(prev, right),
+                          make_edge(left, bottom), make_edge(right, bottom)])
+            prev = bottom
+        graph = graph_cmd.DepGraph(root, collections.OrderedDict(nodes), edges, [])
+
+        labels = graph_cmd.get_node_labels(graph.nodes)
+        self.assertEqual(
+            [labels[key] for key in [root, ('a', 'lib'), ('b', 'lib'), ('a', 'b0')]],
+            ['app', 'a:lib', 'b:lib', 'b0'])
+        self.assertEqual(
+            graph_cmd.find_paths_to(graph, set([('b', 'lib')])),
+            [[root, ('a', 'lib'), ('b', 'lib')]])
+        self.assertEqual(len(graph_cmd.find_paths_to(graph, set([('a', 'b3')]))), 16)
+
+if __name__ == '__main__':
+    unittest.main()
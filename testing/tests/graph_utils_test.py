@@ -0,0 +1,42 @@
+import sys
+import unittest
+
+sys.path.append('../..');
+from repo_tool import graph_utils
+
+class GraphUtilsTestCase(unittest.TestCase):
+    def find_components(self, edges, roots=['a']):
+        get_children = lambda node: edges.get(node, [])
+        components, parents = graph_utils.find_components(roots, get_children)
+        cycles = [component for component in components
+                  if graph_utils.is_cycle(component, get_children)]
+        return (components, cycles, parents)
+
+    def test_1_dag(self):
+        components, cycles, parents = self.find_components(
+            {'a': ['b', 'c'], 'b': ['d'], 'c': ['d']})
+        self.assertEqual(components, [['d'], ['b'], ['c'], ['a']])
+        self.assertEqual(cycles, [])
+        self.assertEqual(graph_utils.get_path_to(parents, 'd'), ['a', 'b', 'd'])
+
+    def test_2_cycles(self):
+        components, cycles, parents = self.find_components(
+            {'a': ['b', 'e'], 'b': ['c'], 'c': ['d', 'b'], 'd': ['b'],
+             'e': ['e', 'f'], 'f': []})
+        self.assertEqual(cycles, [['b', 'c', 'd'], ['e']])
+        self.assertEqual(components[-1], ['a'])
+
+        # Each node is in exactly one component.
+        members = sorted([node for component in components for node in component])
+        self.assertEqual(members, ['a', 'b', 'c', 'd', 'e', 'f'])
+
+    def test_3_deep_graph(self):
+        depth = 20000
+        edges = dict([(i, [i + 1]) for i in range(depth)])
+        edges[depth] = [0]
+        components, cycles, parents = self.find_components(edges, [0])
+        self.assertEqual(len(cycles), 1)
+        self.assertEqual(len(cycles[0]), depth + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import sys
+import time
+import unittest
+
+sys.path.append('../..');
+from repo_tool import history_cmd
+from repo_tool import rept_cache
+from repo_tool import rept_utils
+
+import check_deps_test
+import test_utils
+
+class HistoryTestCase(unittest.TestCase):
+    # Same repos as the check-deps tests.
+    setUp = check_deps_test.CheckDepsTestCase.setUp
+    tearDown = check_deps_test.CheckDepsTestCase.tearDown
+    checkout_branch = check_deps_test.CheckDepsTestCase.checkout_branch
+
+    def get_rev_hash(self, rev):
+        out, err, ret = test_utils.exec_proc(['git', 'rev-parse', rev])
+        return out
+
+    def make_line(self, rev, revision, subject):
+        commit_time = int(test_utils.exec_proc(
+            ['git', 'log', '-1', '--format=%ct', rev])[0])
+        return '{0} {1} {2}  {3}'.format(
+            self.get_rev_hash(rev)[:12],
+            time.strftime('%Y-%m-%d', time.localtime(commit_time)),
+            revision,
+            subject)
+
+    def exec_rept_history(self, args):
+        out, err, ret = test_utils.exec_proc(['rept', 'history'] + args)
+        try:
+            self.assertEqual(ret, 0)
+            return test_utils.convert_to_lines(out)
+        except:
+            test_utils.print_out_err(out, err)
+            raise
+
+    def test_history_1_pin_changes(self):
+        self.checkout_branch('branch4')
+
+        expected = [
+            self.make_line('branch4', '(removed)', 'v4'),
+            self.make_line('branch3', 'origin/branch2', 'v3'),
+            self.make_line('branch2', 'origin/branch1', 'v2'),
+        ]
+
+        # Second time around comes from the index.
+        for i in range(2):
+            with self.subTest(i=i):
+                self.assertEqual(
+                    self.exec_rept_history(['test_repo_dep2']), expected)
+
+        with self.subTest('revision'):
+            self.assertEqual(
+                self.exec_rept_history(
+                    ['--revision', 'origin/branch2', 'test_repo_dep2']),
+                [expected[1]])
+
+        with self.subTest('dep1'):
+            self.assertEqual(
+                self.exec_rept_history(['test_repo_dep1']),
+                [self.make_line('branch2', 'origin/branch2', 'v2')])
+
+        with self.subTest('never a dependency'):
+            out, err, ret = test_utils.exec_proc(
+                ['rept', 'history', 'test_repo_nope'])
+            self.assertEqual(ret, 1)
+            self.assertEqual(
+                err, "error: 'test_repo_nope' has never been a dependency")
+
+    def test_history_2_incremental(self):
+        self.checkout_branch('branch2')
+        rept_cache.loaded_caches.clear()
+
+        changes, err = history_cmd.get_changes(self.get_rev_hash('HEAD'))
+        self.assertEqual(err, None)
+        self.assertEqual(
+            [change.commit for change in changes],
+            [self.get_rev_hash('branch2'), self.get_rev_hash('branch1')])
+
+        # Once indexed, no git log is needed.
+        exec_proc_lines = rept_utils.exec_proc_lines
+        rept_utils.exec_proc_lines = None
+        try:
+            rept_cache.save_all()
+            rept_cache.loaded_caches.clear()
+            self.assertEqual(
+                history_cmd.get_changes(self.get_rev_hash('HEAD')),
+                (changes, None))
+        finally:
+            rept_utils.exec_proc_lines = exec_proc_lines
+
+        # Moving to a later commit only reads the log down to the first commit
+        # that's already indexed.
+        self.checkout_branch('branch4')
+        commits = []
+        def exec_proc_lines_spy(cmd, line_fn):
+            def spy_fn(line):
+                if line.startswith('commit '):
+                    commits.append(line.split(' ')[1])
+                return line_fn(line)
+            return exec_proc_lines(cmd, spy_fn)
+
+        rept_utils.exec_proc_lines = exec_proc_lines_spy
+        try:
+            changes, err = history_cmd.get_changes(self.get_rev_hash('HEAD'))
+        finally:
+            rept_utils.exec_proc_lines = exec_proc_lines
+        self.assertEqual(
+            commits,
+            [self.get_rev_hash(rev) for rev in ['branch4', 'branch3', 'branch2']])
+        self.assertEqual(
+            [change.commit for change in changes],
+            [self.get_rev_hash(rev)
+             for rev in ['branch4', 'branch3', 'branch2', 'branch1']])
+
+if __name__ == '__main__':
+    unittest.main()
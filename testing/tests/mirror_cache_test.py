@@ -0,0 +1,69 @@
+import os
+import shutil
+import subprocess
+import sys
+import unittest
+
+sys.path.append('../..');
+from repo_tool import mirror_cache
+
+import test_utils
+
+mirror_cache_testing_dir = os.path.join(test_utils.top_testing_dir, 'mirror_cache_testing')
+rept_dir = os.path.dirname(os.path.dirname(os.path.abspath(mirror_cache.__file__)))
+
+class MirrorCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(mirror_cache_testing_dir, ignore_errors=True)
+        os.makedirs(mirror_cache_testing_dir)
+        self.mirror_path = os.path.join(mirror_cache_testing_dir, 'repo.git')
+        self.lock_timeout_secs = mirror_cache.LOCK_TIMEOUT_SECS
+        mirror_cache.LOCK_TIMEOUT_SECS = 0
+
+    def tearDown(self):
+        mirror_cache.LOCK_TIMEOUT_SECS = self.lock_timeout_secs
+        shutil.rmtree(mirror_cache_testing_dir)
+
+    def test_1_lock_is_exclusive(self):
+        lock_fd, err = mirror_cache.lock_mirror(self.mirror_path)
+        self.assertEqual(err, None)
+
+        # Another holder has to wait, and gives up after the timeout.
+        other_fd, err = mirror_cache.lock_mirror(self.mirror_path)
+        self.assertEqual(other_fd, None)
+        self.assertTrue(err.startswith('timed out'))
+
+        mirror_cache.unlock_mirror(lock_fd)
+        other_fd, err = mirror_cache.lock_mirror(self.mirror_path)
+        self.assertEqual(err, None)
+        mirror_cache.unlock_mirror(other_fd)
+
+    def test_2_lock_of_dead_process(self):
+        # A process that dies holding the lock lets go of it.
+        lock_script = (
+            'import sys\n'
+            'sys.path.append(sys.argv[2])\n'
+            'from repo_tool import mirror_cache\n'
+            'mirror_cache.lock_mirror(sys.argv[1])\n'
+            'print("locked")\n'
+            'sys.stdout.flush()\n'
+            'sys.stdin.read()\n')
+        lock_proc = subprocess.Popen(
+            [sys.executable, '-c', lock_script, self.mirror_path, rept_dir],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            lock_proc.stdout.readline()
+            lock_fd, err = mirror_cache.lock_mirror(self.mirror_path)
+            self.assertEqual(lock_fd, None)
+        finally:
+            lock_proc.kill()
+            lock_proc.wait()
+            lock_proc.stdin.close()
+            lock_proc.stdout.close()
+
+        lock_fd, err = mirror_cache.lock_mirror(self.mirror_path)
+        self.assertEqual(err, None)
+        mirror_cache.unlock_mirror(lock_fd)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,8 @@
 import os
 import shutil
+import subprocess
+import sys
+import time
 import unittest
 
 import test_utils
@@ -105,6 +108,22 @@ class SyncTestCase(unittest.TestCase):
         os.chdir(test_utils.top_testing_dir)
         shutil.rmtree('test_repos')
 
+    def get_rev_hash(self, repo_dir, rev):
+        out, err, ret = test_utils.exec_proc(['git', '-C', repo_dir, 'rev-parse', rev])
+        return out
+
+    # Write a .rept_deps file with the given (repo name, revision) pairs. A
+    # revision of None pins the dependency to the commit it's currently at.
+    def write_rept_deps(self, repo_revs):
+        deps = []
+        for repo_name, rev in repo_revs:
+            if rev is None:
+                rev = self.get_rev_hash(os.path.join('..', repo_name), 'HEAD')
+            deps.append(test_utils.make_dependency(repo_name, rev))
+        f = open('.rept_deps', 'w')
+        f.write(test_utils.deps_template.format(''.join(deps)))
+        f.close()
+
     def test_sync_1(self):
 
         test_repo_app_dir = os.path.join(test_utils.remotes_home_dir, 'test_repo_app')
@@ -183,8 +202,33 @@ class SyncTestCase(unittest.TestCase):
             with self.subTest('sync consistent deps test (fetching)'):
                 try:
                     out, err = '', ''
+                    # Only dep1's remote has anything new.
+                    test_utils.exec_proc(
+                        ['git', '-C', os.path.join(test_utils.remotes_home_dir, 'test_repo_dep1'),
+                         'branch', 'new_branch', 'master'])
                     out, err, ret = test_utils.exec_proc(['rept', 'sync'])
                     self.assertEqual(ret, 0)
+                    self.assertEqual(
+                        test_utils.convert_to_lines(out),
+                        [
+                        'fetching repo test_repo_dep1...',
+                        'skipping fetch in test_repo_dep2: nothing new on origin',
+                        'skipping fetch in test_repo_dep3: nothing new on origin',
+                        'skipping checkout in test_repo_dep1: already at origin/branch2',
+                        'skipping checkout in test_repo_dep2: already at origin/branch1',
+                        'skipping checkout in test_repo_dep3: already at origin/master',
+                        '',
+                        'Success',
+                        ])
+                except:
+                    test_utils.print_out_err(out, err)
+                    raise
+
+            with self.subTest('sync consistent deps test (forced)'):
+                try:
+                    out, err = '', ''
+                    out, err, ret = test_utils.exec_proc(['rept', 'sync', '--force'])
+                    self.assertEqual(ret, 0)
                     self.assertEqual(
                         test_utils.convert_to_lines(out),
                         [
@@ -201,6 +245,183 @@ class SyncTestCase(unittest.TestCase):
                     test_utils.print_out_err(out, err)
                     raise
 
+            with self.subTest('sync consistent deps test (parallel)'):
+                try:
+                    out, err = '', ''
+                    out, err, ret = test_utils.exec_proc(['rept', 'sync', '-j', '3'])
+                    self.assertEqual(ret, 0)
+                    self.assertEqual(
+                        sorted(test_utils.convert_to_lines(out)),
+                        [
+                        '',
+                        'Success',
+                        'skipping checkout in test_repo_dep1: already at origin/branch2',
+                        'skipping checkout in test_repo_dep2: already at origin/branch1',
+                        'skipping checkout in test_repo_dep3: already at origin/master',
+                        'skipping fetch in test_repo_dep1: nothing new on origin',
+                        'skipping fetch in test_repo_dep2: nothing new on origin',
+                        'skipping fetch in test_repo_dep3: nothing new on origin',
+                        ])
+                except:
+                    test_utils.print_out_err(out, err)
+                    raise
+
+            with self.subTest('sync consistent deps test (commit pins)'):
+                try:
+                    out, err = '', ''
+                    # dep2 stays on a branch, since dep1 depends on it by
+                    # branch name.
+                    self.write_rept_deps([
+                        ('test_repo_dep1', None),
+                        ('test_repo_dep2', 'origin/branch1'),
+                        ('test_repo_dep3', None),
+                        ])
+                    # The pinned commits are already here, and the branch pin's
+                    # remote has nothing new.
+                    for i in range(2):
+                        out, err, ret = test_utils.exec_proc(['rept', 'sync'])
+                        self.assertEqual(ret, 0)
+                        self.assertEqual(
+                            [line.split(':')[0] for line in test_utils.convert_to_lines(out)],
+                            [
+                            'skipping fetch in test_repo_dep1',
+                            'skipping fetch in test_repo_dep2',
+                            'skipping fetch in test_repo_dep3',
+                            'skipping checkout in test_repo_dep1',
+                            'skipping checkout in test_repo_dep2',
+                            'skipping checkout in test_repo_dep3',
+                            '',
+                            'Success',
+                            ])
+
+                    # Moving a repo's HEAD means it has to be synced again.
+                    dep3_rev = self.get_rev_hash(dep3_dir, 'HEAD')
+                    test_utils.exec_proc(['git', '-C', dep3_dir, 'checkout', '-q', 'HEAD~1'])
+                    out, err, ret = test_utils.exec_proc(['rept', 'sync'])
+                    self.assertEqual(ret, 0)
+                    self.assertEqual(
+                        [line.split(':')[0] for line in test_utils.convert_to_lines(out)],
+                        [
+                        'skipping fetch in test_repo_dep1',
+                        'skipping fetch in test_repo_dep2',
+                        'skipping fetch in test_repo_dep3',
+                        'skipping checkout in test_repo_dep1',
+                        'skipping checkout in test_repo_dep2',
+                        'checking out {0} on test_repo_dep3...'.format(dep3_rev),
+                        '',
+                        'Success',
+                        ])
+                    self.assertEqual(self.get_rev_hash(dep3_dir, 'HEAD'), dep3_rev)
+                except:
+                    test_utils.print_out_err(out, err)
+                    raise
+                finally:
+                    test_utils.exec_proc(['git', 'checkout', '.rept_deps'])
+
+            with self.subTest('sync consistent deps test (tag and local branch pins)'):
+                try:
+                    out, err = '', ''
+                    test_utils.exec_proc(['git', '-C', dep1_dir, 'tag', 'v1', 'origin/branch2'])
+                    test_utils.exec_proc(['git', '-C', dep3_dir, 'branch', 'local', 'origin/master'])
+                    self.write_rept_deps([
+                        ('test_repo_dep1', 'v1'),
+                        ('test_repo_dep2', 'origin/branch1'),
+                        ('test_repo_dep3', 'local'),
+                        ])
+                    out, err, ret = test_utils.exec_proc(['rept', 'sync'])
+                    self.assertEqual(ret, 0)
+                    self.assertEqual(
+                        test_utils.convert_to_lines(out),
+                        [
+                        'skipping fetch in test_repo_dep1: v1 is already here',
+                        'skipping fetch in test_repo_dep2: nothing new on origin',
+                        'skipping fetch in test_repo_dep3: local is already here',
+                        'skipping checkout in test_repo_dep1: already at v1',
+                        'skipping checkout in test_repo_dep2: already at origin/branch1',
+                        'checking out local on test_repo_dep3...',
+                        '',
+                        'Success',
+                        ])
+                    out, err, ret = test_utils.exec_proc(
+                        ['git', '-C', dep3_dir, 'symbolic-ref', 'HEAD'])
+                    self.assertEqual(out, 'refs/heads/local')
+
+                    # Once on the branch, there's nothing left to do.
+                    out, err, ret = test_utils.exec_proc(['rept', 'sync'])
+                    self.assertEqual(ret, 0)
+                    self.assertIn(
+                        'skipping checkout in test_repo_dep3: already at local',
+                        test_utils.convert_to_lines(out))
+
+                    # A pin that isn't here yet still needs a fetch.
+                    dep1_remote_dir = os.path.join(test_utils.remotes_home_dir, 'test_repo_dep1')
+                    test_utils.exec_proc(['git', '-C', dep1_remote_dir, 'tag', 'v2', 'branch2'])
+                    self.write_rept_deps([
+                        ('test_repo_dep1', 'v2'),
+                        ('test_repo_dep2', 'origin/branch1'),
+                        ('test_repo_dep3', 'origin/master'),
+                        ])
+                    out, err, ret = test_utils.exec_proc(['rept', 'sync'])
+                    self.assertEqual(ret, 0)
+                    self.assertEqual(
+                        test_utils.convert_to_lines(out),
+                        [
+                        'fetching repo test_repo_dep1...',
+                        'skipping fetch in test_repo_dep2: nothing new on origin',
+                        'skipping fetch in test_repo_dep3: nothing new on origin',
+                        'skipping checkout in test_repo_dep1: already at v2',
+                        'skipping checkout in test_repo_dep2: already at origin/branch1',
+                        'checking out origin/master on test_repo_dep3...',
+                        '',
+                        'Success',
+                        ])
+                except:
+                    test_utils.print_out_err(out, err)
+                    raise
+                finally:
+                    test_utils.exec_proc(['git', 'checkout', '.rept_deps'])
+
+            with self.subTest('sync consistent deps test (narrow)'):
+                try:
+                    out, err = '', ''
+                    dep1_remote_dir = os.path.join(test_utils.remotes_home_dir, 'test_repo_dep1')
+                    test_utils.exec_proc(['git', '-C', dep1_remote_dir, 'branch', 'narrow', 'branch2'])
+                    test_utils.exec_proc(['git', '-C', dep1_remote_dir, 'tag', 'v3', 'branch2'])
+                    test_utils.exec_proc(['git', '-C', dep1_remote_dir, 'branch', 'unpinned', 'branch1'])
+                    self.write_rept_deps([
+                        ('test_repo_dep1', 'origin/narrow'),
+                        ('test_repo_dep2', 'origin/branch1'),
+                        ('test_repo_dep3', 'origin/master'),
+                        ])
+                    out, err, ret = test_utils.exec_proc(['rept', 'sync', '--narrow'])
+                    self.assertEqual(ret, 0)
+                    self.assertEqual(
+                        test_utils.convert_to_lines(out),
+                        [
+                        'fetching repo test_repo_dep1...',
+                        'skipping fetch in test_repo_dep2: nothing new on origin',
+                        'skipping fetch in test_repo_dep3: nothing new on origin',
+                        'skipping checkout in test_repo_dep1: already at origin/narrow',
+                        'skipping checkout in test_repo_dep2: already at origin/branch1',
+                        'skipping checkout in test_repo_dep3: already at origin/master',
+                        '',
+                        'Success',
+                        ])
+
+                    # Only the pinned branch was fetched.
+                    self.assertEqual(
+                        self.get_rev_hash(dep1_dir, 'origin/narrow'),
+                        self.get_rev_hash(dep1_remote_dir, 'narrow'))
+                    for rev in ['origin/unpinned', 'v3']:
+                        out, err, ret = test_utils.exec_proc(
+                            ['git', '-C', dep1_dir, 'rev-parse', '--verify', '-q', rev])
+                        self.assertEqual(ret, 1)
+                except:
+                    test_utils.print_out_err(out, err)
+                    raise
+                finally:
+                    test_utils.exec_proc(['git', 'checkout', '.rept_deps'])
+
             with self.subTest('sync consistent deps test (no dep1 .git folder)'):
                 try:
                     out, err = '', ''
@@ -210,8 +431,8 @@ class SyncTestCase(unittest.TestCase):
                     self.assertEqual(
                         test_utils.convert_to_lines(out),
                         [
-                        'fetching repo test_repo_dep2...',
-                        'fetching repo test_repo_dep3...',
+                        'skipping fetch in test_repo_dep2: nothing new on origin',
+                        'skipping fetch in test_repo_dep3: nothing new on origin',
                         ])
                     self.assertEqual(
                         test_utils.convert_to_lines(err),
@@ -267,5 +488,97 @@ class SyncTestCase(unittest.TestCase):
                 test_utils.print_out_err(out, err)
                 raise
 
+    def test_sync_2_mirror(self):
+        mirror_dir = os.path.join(test_utils.test_repos_home_dir, 'mirrors')
+        dep1_remote_dir = os.path.join(test_utils.remotes_home_dir, 'test_repo_dep1')
+        os.environ['REPT_MIRROR_DIR'] = mirror_dir
+
+        def clone_and_sync(workspace_dir):
+            os.makedirs(workspace_dir)
+            os.chdir(workspace_dir)
+            test_utils.exec_proc(
+                ['git', 'clone', '-q', '-b', 'branch2',
+                 os.path.join(test_utils.remotes_home_dir, 'test_repo_app')])
+            os.chdir('test_repo_app')
+            return test_utils.exec_proc(['rept', 'sync'])
+
+        out, err = '', ''
+        try:
+            with self.subTest('first workspace'):
+                out, err, ret = clone_and_sync(
+                    os.path.join(test_utils.test_repos_home_dir, 'workspace1'))
+                self.assertEqual(ret, 0)
+                self.assertEqual(
+                    test_utils.convert_to_lines(out)[:3],
+                    [
+                    'cloning repo test_repo_dep1...',
+                    'cloning repo test_repo_dep2...',
+                    'cloning repo test_repo_dep3...',
+                    ])
+
+                # One mirror per repo, each with its lock file.
+                mirrors = sorted(os.listdir(mirror_dir))
+                self.assertEqual(len(mirrors), 6)
+                self.assertEqual(
+                    [mirror for mirror in mirrors if mirror.endswith('.git')],
+                    [mirror[:-len('.lock')] for mirror in mirrors
+                     if mirror.endswith('.lock')])
+
+                # The clone still points at the real remote.
+                out, err, ret = test_utils.exec_proc(
+                    ['git', '-C', '../test_repo_dep1', 'remote', 'get-url', 'origin'])
+                self.assertEqual(out, dep1_remote_dir)
+
+            with self.subTest('fetching'):
+                test_utils.exec_proc(['git', '-C', dep1_remote_dir, 'branch', 'new_branch', 'branch1'])
+                out, err, ret = test_utils.exec_proc(['rept', 'sync', '--force'])
+                self.assertEqual(ret, 0)
+                self.assertEqual(
+                    self.get_rev_hash('../test_repo_dep1', 'origin/new_branch'),
+                    self.get_rev_hash(dep1_remote_dir, 'new_branch'))
+
+            with self.subTest('second workspace'):
+                out, err, ret = clone_and_sync(
+                    os.path.join(test_utils.test_repos_home_dir, 'workspace2'))
+                self.assertEqual(ret, 0)
+                self.assertEqual(len(os.listdir(mirror_dir)), 6)
+                dep1_mirror = [mirror for mirror in os.listdir(mirror_dir)
+                               if mirror.startswith('test_repo_dep1-') and
+                               mirror.endswith('.git')][0]
+                self.assertEqual(
+                    self.get_rev_hash(os.path.join(mirror_dir, dep1_mirror), 'new_branch'),
+                    self.get_rev_hash(dep1_remote_dir, 'new_branch'))
+                self.assertEqual(
+                    self.get_rev_hash('../test_repo_dep1', 'origin/new_branch'),
+                    self.get_rev_hash(dep1_remote_dir, 'new_branch'))
+
+            # A run killed while holding a lock doesn't leave the mirror locked.
+            with self.subTest('killed run'):
+                dep1_lock = os.path.join(mirror_dir, dep1_mirror + '.lock')
+                lock_script = (
+                    'import fcntl, sys, time\n'
+                    'f = open(sys.argv[1], "w")\n'
+                    'fcntl.flock(f, fcntl.LOCK_EX)\n'
+                    'print("locked")\n'
+                    'sys.stdout.flush()\n'
+                    'time.sleep(600)\n')
+                lock_proc = subprocess.Popen(
+                    [sys.executable, '-c', lock_script, dep1_lock],
+                    stdout=subprocess.PIPE)
+                lock_proc.stdout.readline()
+                lock_proc.kill()
+                lock_proc.wait()
+                lock_proc.stdout.close()
+
+                start = time.time()
+                out, err, ret = test_utils.exec_proc(['rept', 'sync', '--force'])
+                self.assertEqual(ret, 0)
+                self.assertLess(time.time() - start, 60)
+        except:
+            test_utils.print_out_err(out, err)
+            raise
+        finally:
+            del os.environ['REPT_MIRROR_DIR']
+
 if __name__ == '__main__':
     unittest.main()